@@ -0,0 +1,168 @@
+# Author: duvob90
+"""Microbenchmark del costo de normalización por ciclo (parsers.py).
+
+Uso (requiere homeassistant instalado, sin red):
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --stops 100 --baseline HEAD~1
+
+Con `--baseline` se carga también la versión de parsers.py de ese commit
+(vía `git show`) y se comparan ambas con los mismos payloads. Cada fila
+es una fuente: en versiones antiguas se usa el parser que tenían entonces
+(`parse_indicator`, `parse_sismo`; ver PARSER_NAMES).
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+PARSERS = ROOT / "custom_components" / "navaja_chilena" / "parsers.py"
+PARSERS_REL = "custom_components/navaja_chilena/parsers.py"
+
+
+def load_module(path: Path, name: str) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def load_baseline(ref: str) -> ModuleType:
+    src = subprocess.run(
+        ["git", "show", f"{ref}:{PARSERS_REL}"], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    tmp = Path(tempfile.mkdtemp()) / "parsers_baseline.py"
+    tmp.write_text(src, encoding="utf-8")
+    return load_module(tmp, "parsers_baseline")
+
+
+def metro_payload(stations: int = 20) -> dict:
+    lines = []
+    for lid in ("1", "2", "3", "4", "4A", "5", "6"):
+        lines.append({
+            "nombre": f"Linea {lid}",
+            "estado": "Operativa",
+            "estaciones": [
+                {"nombre": f"Estación {lid}-{i}", "estado": "cerrada" if i == 3 else "normal"}
+                for i in range(stations)
+            ],
+            "incidencias": [{"estacion": f"Estación {lid}-3", "detalle": "Cierre temporal"}],
+        })
+    return {"lineas": lines}
+
+
+def sismos_payload(n: int = 15) -> list:
+    return [
+        {
+            "Magnitud": f"{3 + i % 4}.{i % 10}",
+            "RefGeografica": f"{10 + i} km al N de Ciudad",
+            "Fecha": "2025-01-01 10:00:00",
+            "Profundidad": "35",
+            "Latitud": "-33.4",
+            "Longitud": "-70.6",
+        }
+        for i in range(n)
+    ]
+
+
+def series_payload(days: int = 30) -> dict:
+    return {
+        "serie": [
+            {"fecha": f"2025-01-{day:02d}T03:00:00.000Z", "valor": 950.5 + day}
+            for day in range(days, 0, -1)
+        ],
+    }
+
+
+def stop_payload(sid: str) -> dict:
+    # Forma que no calza con el primer alias: obliga a recorrer la lista de alias/estrategias
+    return {
+        "title": f"Paradero {sid}",
+        "services": [
+            {"servicio": f"{500 + i}", "destino": "Centro", "arrives_in": f"{i:02d}-{i + 2:02d} min"}
+            for i in range(10)
+        ],
+    }
+
+
+def best(func: Callable[[], Any], number: int, repeat: int = 5) -> float:
+    """µs por llamada (mínimo de varias repeticiones, menos sensible al ruido)."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+# Parser de cada fuente por nombre, del actual al más antiguo (para comparar con `--baseline`)
+PARSER_NAMES = {
+    "indicador": ("parse_series", "parse_indicator"),
+    "metro": ("parse_metro",),
+    "sismos": ("parse_quakes", "parse_sismo"),
+    "paradero": ("parse_stop",),
+}
+
+
+def parsers_of(mod: ModuleType) -> dict[str, Callable[..., Any]]:
+    """Función de cada fuente en `mod` (la primera de PARSER_NAMES que exista)."""
+    out = {}
+    for key, names in PARSER_NAMES.items():
+        func = next((getattr(mod, n) for n in names if hasattr(mod, n)), None)
+        if func is None:
+            raise AttributeError(f"{mod.__name__}: no tiene {' ni '.join(names)}")
+        out[key] = func
+    return out
+
+
+def run(mod: ModuleType, stops: int, number: int) -> dict[str, float]:
+    """µs por llamada de cada parser y costo total de un ciclo."""
+    p = parsers_of(mod)
+    metro = metro_payload()
+    sismos = sismos_payload()
+    usd = series_payload()
+    stop_js = {f"PA{i}": stop_payload(f"PA{i}") for i in range(stops)}
+
+    res = {
+        "indicador": best(lambda: p["indicador"](usd, "dolar"), number),
+        "metro": best(lambda: p["metro"](metro), number),
+        "sismos": best(lambda: p["sismos"](sismos), number),
+        "paradero": best(lambda: p["paradero"]("PA0", stop_js["PA0"]), number),
+    }
+
+    def cycle() -> None:
+        p["indicador"](usd, "dolar")
+        p["indicador"](usd, "uf")
+        p["metro"](metro)
+        p["sismos"](sismos)
+        for sid, js in stop_js.items():
+            p["paradero"](sid, js)
+
+    cycles = max(1, number // max(1, stops))
+    res[f"ciclo ({stops} paraderos)"] = best(cycle, cycles)
+    return res
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--stops", type=int, default=50)
+    ap.add_argument("--number", type=int, default=2000)
+    ap.add_argument("--baseline", help="commit/ref de git con el parsers.py a comparar")
+    args = ap.parse_args()
+
+    results = {"actual": run(load_module(PARSERS, "parsers_actual"), args.stops, args.number)}
+    if args.baseline:
+        results[args.baseline] = run(load_baseline(args.baseline), args.stops, args.number)
+
+    cols = list(results)
+    print(f"{'µs/llamada':<26}" + "".join(f"{c:>14}" for c in cols))
+    for key in results["actual"]:
+        print(f"{key:<26}" + "".join(f"{results[c][key]:>14.1f}" for c in cols))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
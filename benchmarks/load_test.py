@@ -0,0 +1,381 @@
+# Author: duvob90
+"""Prueba de carga offline de la integración contra APIs simuladas.
+
+Levanta `stub_upstream.py` en otro proceso y, por cada escenario
+(paraderos x entradas), arranca en un proceso nuevo un Home Assistant
+mínimo (sin HTTP ni frontend) con la integración apuntando al stub.
+Mide el arranque (primer ciclo) y varios ciclos completos con todos los
+paraderos vencidos (peor caso):
+
+  - tiempo de pared y CPU del ciclo
+  - tiempo ocupado del event loop y bloqueos (callbacks > 1 ms, y el peor)
+  - tiempo decodificando/normalizando respuestas en el event loop (lo que
+    no se mandó al executor; `--offload-bytes` cambia el umbral)
+  - escrituras de estado (state_changed + state_reported)
+  - peticiones emitidas y errores
+  - pico de memoria (RSS y, con --tracemalloc, heap de Python)
+
+Uso (requiere homeassistant instalado; no usa la red):
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --scenarios 100x1,100x3 --latency 0.2 --error-rate 0.05
+    python benchmarks/load_test.py --json hoy.json --compare ayer.json
+    python benchmarks/load_test.py --scenarios 500x1 --offload-bytes 0          # todo al executor
+    python benchmarks/load_test.py --scenarios 500x1 --offload-bytes 1000000000 # todo en el loop
+
+Con `--compare` se sale con código 1 si el CPU por ciclo de algún
+escenario empeora más que `--tolerance`.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter, process_time
+from types import MappingProxyType
+from typing import Any
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+STUB = HERE / "stub_upstream.py"
+DOMAIN = "navaja_chilena"
+DEFAULT_SCENARIOS = "1x1,10x1,100x1,500x1,100x3"
+URL_NAMES = ("USD_URL", "UF_URL", "METRO_URL", "SISMOS_URL", "BUS_URL_TMPL")
+
+sys.path.insert(0, str(HERE))
+from stub_upstream import build_parser as stub_parser, stub_url  # noqa: E402
+
+
+class LoopMonitor:
+    """Mide cuánto tiempo ocupa cada callback del event loop.
+
+    `busy` es el tiempo total dentro de callbacks (el loop sin poder atender
+    otra cosa) y `blocked` sólo el de los callbacks que superan `threshold`.
+    """
+
+    def __init__(self, threshold: float = 0.001) -> None:
+        self.threshold = threshold
+        self.busy = self.blocked = self.worst = 0.0
+        self._orig = asyncio.events.Handle._run
+
+    def start(self) -> None:
+        orig = self._orig
+        monitor = self
+
+        def _run(handle: asyncio.Handle) -> None:
+            t = perf_counter()
+            orig(handle)
+            d = perf_counter() - t
+            monitor.busy += d
+            if d > monitor.threshold:
+                monitor.blocked += d
+                monitor.worst = max(monitor.worst, d)
+
+        asyncio.events.Handle._run = _run
+
+    def stop(self) -> None:
+        asyncio.events.Handle._run = self._orig
+
+    def reset(self) -> None:
+        self.busy = self.blocked = self.worst = 0.0
+
+
+# ---------------------------------------------------------------------------
+# Proceso hijo: un escenario
+# ---------------------------------------------------------------------------
+
+async def _async_start_hass(config_dir: str):
+    """Home Assistant mínimo: registros, loader y config entries (sin bootstrap completo)."""
+    from homeassistant import bootstrap, config_entries, loader
+    from homeassistant.core import CoreState, HomeAssistant
+    from homeassistant.helpers import (
+        area_registry as ar,
+        device_registry as dr,
+        entity,
+        entity_registry as er,
+        floor_registry as fr,
+        issue_registry as ir,
+        label_registry as lr,
+        translation,
+    )
+
+    hass = HomeAssistant(config_dir)
+    hass.config.skip_pip = True
+    await hass.config.async_set_time_zone("America/Santiago")
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    entity.async_setup(hass)
+    loader.async_setup(hass)
+    translation.async_setup(hass)
+    for registry in (ar, dr, er, fr, ir, lr):
+        await registry.async_load(hass)
+    hass.data[bootstrap.DATA_REGISTRIES_LOADED] = None
+    # Dependencias del manifest que no hacen falta para medir: se dan por cargadas
+    hass.config.components.update(("device_automation", "http", "websocket_api"))
+    await hass.config_entries.async_initialize()
+    hass.set_state(CoreState.running)
+    return hass
+
+
+def _redirect_upstreams(port: int) -> None:
+    """Apunta las URLs de la integración al stub (antes de crear las entradas)."""
+    import importlib
+
+    const = importlib.import_module(f"custom_components.{DOMAIN}.const")
+    urls = {attr: stub_url(getattr(const, attr), port) for attr in URL_NAMES}
+    for name in ("const", "coordinator"):
+        mod = importlib.import_module(f"custom_components.{DOMAIN}.{name}")
+        for attr, url in urls.items():
+            if hasattr(mod, attr):
+                setattr(mod, attr, url)
+
+
+def _set_offload_bytes(limit: int) -> None:
+    """Umbral de decodificación en el executor (antes de crear las entradas)."""
+    import importlib
+
+    for name in ("api", "coordinator"):
+        setattr(importlib.import_module(f"custom_components.{DOMAIN}.{name}"), "DECODE_OFFLOAD_BYTES", limit)
+
+
+def _entry_stops(stops: list[str], entries: int) -> list[list[str]]:
+    """Reparte los paraderos entre entradas; el primero lo comparten todas."""
+    return [sorted({stops[0], *stops[i::entries]}) for i in range(entries)]
+
+
+async def _stub_call(session, port: int, method: str, path: str) -> dict[str, Any]:
+    async with session.request(method, f"http://127.0.0.1:{port}{path}") as resp:
+        return await resp.json()
+
+
+def _total(stats: dict[str, Any], key: str) -> int:
+    return sum(stats[key].values())
+
+
+async def run_scenario(args: argparse.Namespace) -> dict[str, Any]:
+    import aiohttp
+
+    from homeassistant.config_entries import ConfigEntry
+    from homeassistant.const import EVENT_STATE_CHANGED, EVENT_STATE_REPORTED
+    from homeassistant.core import callback
+
+    n_stops, n_entries = (int(x) for x in args.child.split("x"))
+    config_dir = tempfile.mkdtemp(prefix="navaja_bench_")
+    (Path(config_dir) / "custom_components").mkdir()
+    (Path(config_dir) / "custom_components" / DOMAIN).symlink_to(ROOT / "custom_components" / DOMAIN)
+    sys.path.insert(0, config_dir)
+
+    hass = await _async_start_hass(config_dir)
+    _redirect_upstreams(args.port)
+    if args.offload_bytes is not None:
+        _set_offload_bytes(args.offload_bytes)
+    from custom_components.navaja_chilena.const import CONF_INTERVALS, CONF_STOP_IDS, DATA_HUB, SOURCE_BUS
+
+    writes = 0
+
+    @callback
+    def _count(event_data: Any = None) -> bool:
+        nonlocal writes
+        writes += 1
+        return False  # filtro de state_reported: sólo contamos
+
+    hass.bus.async_listen(EVENT_STATE_CHANGED, _count)
+    hass.bus.async_listen(EVENT_STATE_REPORTED, lambda e: None, event_filter=_count)
+
+    monitor = LoopMonitor()
+    monitor.start()
+    control = aiohttp.ClientSession()
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    async def measure(work) -> dict[str, Any]:
+        nonlocal writes
+        before = await _stub_call(control, args.port, "GET", "/_stats")
+        writes = 0
+        monitor.reset()
+        t0, c0 = perf_counter(), process_time()
+        await work()
+        await hass.async_block_till_done()
+        wall, cpu = perf_counter() - t0, process_time() - c0
+        after = await _stub_call(control, args.port, "GET", "/_stats")
+        hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+        return {
+            "wall_s": wall,
+            "cpu_ms": cpu * 1000,
+            "loop_busy_ms": monitor.busy * 1000,
+            "blocked_ms": monitor.blocked * 1000,
+            "max_block_ms": monitor.worst * 1000,
+            # Decodificación en el loop durante el último refresco de cada fuente
+            "decode_loop_ms": sum(c.cycle_loop_time for c in hub.coordinators.values()) * 1000 if hub else 0.0,
+            "writes": writes,
+            "requests": _total(after, "requests") - _total(before, "requests"),
+            "errors": _total(after, "errors") - _total(before, "errors"),
+        }
+
+    stops = [f"PA{i}" for i in range(1, n_stops + 1)]
+    entries = [
+        ConfigEntry(
+            data={CONF_STOP_IDS: ",".join(ids)},
+            discovery_keys=MappingProxyType({}),
+            domain=DOMAIN,
+            minor_version=1,
+            options={CONF_STOP_IDS: ",".join(ids), CONF_INTERVALS[SOURCE_BUS]: args.bus_interval},
+            source="user",
+            title=f"Navaja {i}",
+            unique_id=None,
+            version=1,
+        )
+        for i, ids in enumerate(_entry_stops(stops, n_entries))
+    ]
+
+    async def setup() -> None:
+        await asyncio.gather(*(hass.config_entries.async_add(e) for e in entries))
+        # El setup vuelve sin esperar a las APIs: el arranque cuenta hasta el primer dato de todo
+        await hass.async_block_till_done(wait_background_tasks=True)
+
+    result: dict[str, Any] = {"scenario": args.child, "setup": await measure(setup)}
+    result["entities"] = len(hass.states.async_all())
+    hub = hass.data[DOMAIN][DATA_HUB]
+
+    cycles = []
+    for gen in range(1, args.cycles + 1):
+        await _stub_call(control, args.port, "POST", f"/_control?generation={gen}")
+        # Peor caso: todos los paraderos vencidos a la vez
+        hub.coordinators[SOURCE_BUS]._next_poll.clear()  # noqa: SLF001
+
+        async def cycle() -> None:
+            await asyncio.gather(*(c.async_refresh() for c in hub.coordinators.values()))
+
+        cycles.append(await measure(cycle))
+    result["cycle"] = {k: sum(c[k] for c in cycles) / len(cycles) for k in cycles[0]}
+    result["cycle"]["max_block_ms"] = max(c["max_block_ms"] for c in cycles)
+
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["rss_peak_mb"] = rss_peak / 1024
+    result["rss_growth_mb"] = (rss_peak - rss_start) / 1024
+    if args.tracemalloc:
+        result["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    monitor.stop()
+    await control.close()
+    for e in entries:
+        await hass.config_entries.async_unload(e.entry_id)
+    await hass.async_stop(force=True)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Proceso padre: stub + escenarios + reporte
+# ---------------------------------------------------------------------------
+
+def _start_stub(stub_args: list[str]) -> tuple[subprocess.Popen, int]:
+    proc = subprocess.Popen([sys.executable, str(STUB), *stub_args], stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("PORT "):
+        proc.kill()
+        raise SystemExit(f"El stub no arrancó: {line!r}")
+    return proc, int(line.split()[1])
+
+
+def _run_child(scenario: str, port: int, args: argparse.Namespace) -> dict[str, Any]:
+    cmd = [
+        sys.executable, __file__, "--child", scenario, "--port", str(port),
+        "--cycles", str(args.cycles), "--bus-interval", str(args.bus_interval),
+    ]
+    if args.tracemalloc:
+        cmd.append("--tracemalloc")
+    if args.offload_bytes is not None:
+        cmd += ["--offload-bytes", str(args.offload_bytes)]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _print_table(results: list[dict[str, Any]]) -> None:
+    head = (
+        f"{'escenario':>10} {'entid.':>6} {'arranque s':>10} {'ciclo s':>8} {'CPU ms':>8} {'loop ms':>8} "
+        f"{'bloqueo ms':>11} {'máx ms':>7} {'decod. ms':>9} {'escrit.':>7} {'petic.':>7} {'errores':>7} {'RSS MB':>7}"
+    )
+    print(head)
+    print("-" * len(head))
+    for r in results:
+        c = r["cycle"]
+        print(
+            f"{r['scenario']:>10} {r['entities']:>6} {r['setup']['wall_s']:>10.2f} {c['wall_s']:>8.2f} "
+            f"{c['cpu_ms']:>8.1f} {c['loop_busy_ms']:>8.1f} {c['blocked_ms']:>11.1f} {c['max_block_ms']:>7.1f}"
+            f" {c['decode_loop_ms']:>9.1f} {c['writes']:>7.0f} "
+            f"{c['requests']:>7.0f} {c['errors']:>7.0f} {r['rss_peak_mb']:>7.0f}"
+        )
+
+
+def _compare(results: list[dict[str, Any]], baseline_path: Path, tolerance: float) -> bool:
+    """Compara CPU y bloqueo por ciclo contra una corrida previa; False si hay regresión."""
+    baseline = {r["scenario"]: r for r in json.loads(baseline_path.read_text())}
+    ok = True
+    print(f"\nvs {baseline_path} (tolerancia {tolerance:.0%})")
+    for r in results:
+        old = baseline.get(r["scenario"])
+        if old is None:
+            continue
+        ratio = r["cycle"]["cpu_ms"] / max(old["cycle"]["cpu_ms"], 1e-6)
+        regressed = ratio > 1 + tolerance
+        ok &= not regressed
+        print(
+            f"{r['scenario']:>10}  CPU x{ratio:.2f}  bloqueo {old['cycle']['blocked_ms']:.1f} → "
+            f"{r['cycle']['blocked_ms']:.1f} ms" + ("  REGRESIÓN" if regressed else "")
+        )
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="El resto de las opciones (--latency, --error-rate, --arrivals, --pad-kb, --etag, --compress, "
+        "--payload-dir, ...) se pasan al stub: ver stub_upstream.py --help.",
+    )
+    ap.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="paraderosxentradas separados por coma")
+    ap.add_argument("--cycles", type=int, default=3, help="ciclos medidos tras el arranque")
+    ap.add_argument("--bus-interval", type=int, default=10, help="bus_interval de las entradas (s)")
+    ap.add_argument("--tracemalloc", action="store_true", help="medir el heap de Python (más lento)")
+    ap.add_argument("--offload-bytes", type=int, help="umbral de decodificación en el executor (bytes)")
+    ap.add_argument("--json", type=Path, help="guardar resultados")
+    ap.add_argument("--compare", type=Path, help="resultados previos (--json) para comparar")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args, stub_argv = ap.parse_known_args()
+
+    if args.child:
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(asyncio.run(run_scenario(args))))
+        return 0
+
+    stub_parser().parse_args(stub_argv)  # valida las opciones del stub antes de arrancarlo
+    stub, port = _start_stub(stub_argv)
+    try:
+        results = []
+        for scenario in args.scenarios.split(","):
+            print(f"escenario {scenario}…", file=sys.stderr, flush=True)
+            results.append(_run_child(scenario.strip(), port, args))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    _print_table(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.compare and not _compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# Author: duvob90
+"""Presupuesto de tiempo de import y de setup de la integración.
+
+Uso (requiere homeassistant instalado; no usa la red):
+
+    python benchmarks/setup_budget.py
+    python benchmarks/setup_budget.py --import-budget-ms 20 --setup-budget-ms 500 --latency 5
+
+Sale con código 1 si algo excede su presupuesto.
+
+- Import: en procesos nuevos (con bytecode ya compilado, como en una
+  instalación real) y con Home Assistant ya importado, se mide cuánto suma
+  el import de coordinator.py, panel.py y sensor.py. Se toma el mínimo de
+  `--repeat` corridas.
+- Setup: un Home Assistant mínimo contra el stub con APIs lentas
+  (`--latency`). Agregar una entrada debe volver sin esperarlas, con todas
+  las entidades creadas (no disponibles); después se informa cuánto tarda
+  cada fuente en quedar disponible.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from types import MappingProxyType
+from typing import Any
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+from load_test import DOMAIN, ROOT, _async_start_hass, _redirect_upstreams, _start_stub  # noqa: E402
+
+# Lo que Home Assistant ya tiene importado cuando carga la integración
+HA_PRELOAD = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.aiohttp_client",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.entity_platform",
+    "homeassistant.helpers.event",
+    "homeassistant.helpers.storage",
+    "homeassistant.helpers.update_coordinator",
+    "homeassistant.components.http",
+    "homeassistant.components.sensor",
+    "homeassistant.components.websocket_api",
+)
+MODULES = ("coordinator", "panel", "sensor")
+
+IMPORT_CHILD = """
+import importlib, json, sys
+from time import perf_counter
+for name in {preload!r}:
+    importlib.import_module(name)
+out = {{}}
+for name in {modules!r}:
+    t = perf_counter()
+    importlib.import_module("custom_components.{domain}." + name)
+    out[name] = (perf_counter() - t) * 1000
+print(json.dumps(out))
+"""
+
+
+def measure_imports(repeat: int) -> dict[str, float]:
+    """ms que suma cada módulo (mínimo de `repeat` procesos, con bytecode ya en caché)."""
+    code = IMPORT_CHILD.format(preload=HA_PRELOAD, modules=MODULES, domain=DOMAIN)
+    with tempfile.TemporaryDirectory(prefix="navaja_pyc_") as pyc:
+        env = {**os.environ, "PYTHONPYCACHEPREFIX": pyc}
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        runs = []
+        for i in range(repeat + 1):
+            out = subprocess.run(
+                [sys.executable, "-c", code], cwd=ROOT, env=env, check=True, stdout=subprocess.PIPE, text=True
+            ).stdout
+            if i:  # la primera sólo compila
+                runs.append(json.loads(out))
+    return {name: min(r[name] for r in runs) for name in MODULES}
+
+
+async def measure_setup(port: int, stops: int) -> dict[str, Any]:
+    from homeassistant.config_entries import ConfigEntry, ConfigEntryState
+    from homeassistant.const import EVENT_STATE_CHANGED, STATE_UNAVAILABLE
+    from homeassistant.core import Event, callback
+
+    config_dir = tempfile.mkdtemp(prefix="navaja_budget_")
+    (Path(config_dir) / "custom_components").mkdir()
+    (Path(config_dir) / "custom_components" / DOMAIN).symlink_to(ROOT / "custom_components" / DOMAIN)
+    sys.path.insert(0, config_dir)
+
+    hass = await _async_start_hass(config_dir)
+    _redirect_upstreams(port)
+    from custom_components.navaja_chilena.const import CONF_STOP_IDS
+
+    t0 = perf_counter()
+    ready: dict[str, float] = {}
+
+    @callback
+    def _on_state(event: Event) -> None:
+        new = event.data["new_state"]
+        if new is not None and new.state != STATE_UNAVAILABLE and new.entity_id not in ready:
+            ready[new.entity_id] = perf_counter() - t0
+
+    hass.bus.async_listen(EVENT_STATE_CHANGED, _on_state)
+    ids = ",".join(f"PA{i}" for i in range(1, stops + 1))
+    entry = ConfigEntry(
+        data={CONF_STOP_IDS: ids},
+        discovery_keys=MappingProxyType({}),
+        domain=DOMAIN,
+        minor_version=1,
+        options={},
+        source="user",
+        title="Navaja",
+        unique_id=None,
+        version=1,
+    )
+    await hass.config_entries.async_add(entry)
+    setup_s = perf_counter() - t0
+    states = hass.states.async_all("sensor")
+    result = {
+        "setup_s": setup_s,
+        "loaded": entry.state is ConfigEntryState.LOADED,
+        "entities": len(states),
+        "unavailable_at_setup": sum(s.state == STATE_UNAVAILABLE for s in states),
+    }
+    await hass.async_block_till_done(wait_background_tasks=True)
+    result["first_available_s"] = min(ready.values(), default=None)
+    result["all_available_s"] = max(ready.values(), default=None)
+    result["available"] = len(ready)
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_stop(force=True)
+    return result
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--import-budget-ms", type=float, default=20.0, help="suma de los tres módulos")
+    ap.add_argument("--setup-budget-ms", type=float, default=500.0)
+    ap.add_argument("--latency", type=float, default=3.0, help="latencia de las APIs simuladas (s)")
+    ap.add_argument("--stops", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--child-port", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child_port:
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(asyncio.run(measure_setup(args.child_port, args.stops))))
+        return 0
+
+    ok = True
+    imports = measure_imports(args.repeat)
+    total = sum(imports.values())
+    print("import (ms): " + "  ".join(f"{k} {v:.1f}" for k, v in imports.items()) + f"  total {total:.1f}")
+    if total > args.import_budget_ms:
+        print(f"  EXCEDE el presupuesto de import ({args.import_budget_ms:.0f} ms)")
+        ok = False
+
+    stub, port = _start_stub(["--latency", str(args.latency), "--jitter", "0"])
+    try:
+        out = subprocess.run(
+            [sys.executable, __file__, "--child-port", str(port), "--stops", str(args.stops)],
+            check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+    finally:
+        stub.kill()
+    setup = json.loads(out.strip().splitlines()[-1])
+    print(
+        f"setup: {setup['setup_s'] * 1000:.0f} ms con APIs a {args.latency:.1f} s, "
+        f"{setup['entities']} entidades ({setup['unavailable_at_setup']} no disponibles al volver); "
+        f"primera disponible a los {setup['first_available_s'] or 0:.2f} s, "
+        f"todas a los {setup['all_available_s'] or 0:.2f} s"
+    )
+    if not setup["loaded"] or setup["setup_s"] * 1000 > args.setup_budget_ms:
+        print(f"  EXCEDE el presupuesto de setup ({args.setup_budget_ms:.0f} ms)")
+        ok = False
+    if setup["available"] < setup["entities"]:
+        print(f"  {setup['entities'] - setup['available']} entidades nunca quedaron disponibles")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
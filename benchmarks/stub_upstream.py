@@ -0,0 +1,285 @@
+# Author: duvob90
+"""Servidor local que imita las APIs de la integración (sin red).
+
+Sirve los mismos paths que mindicador.cl, metro.cl, api.xor.cl y
+api.gael.cl, cada uno en su propia dirección de loopback (127.0.0.1-4,
+mismo puerto) para que el cliente los trate como hosts distintos:
+
+    python benchmarks/stub_upstream.py --latency 0.05 --error-rate 0.02
+
+Imprime `PORT <n>` al quedar escuchando. Los payloads son sintéticos
+(tamaño configurable) o, con `--payload-dir`, archivos grabados
+(dolar.json, uf.json, metro.json, sismos.json, bus.json).
+
+Control para el arnés de carga:
+  POST /_control?generation=N  cambia la "generación" (los paraderos que
+                               rotan entregan llegadas nuevas)
+  GET  /_stats                 peticiones, errores y bytes por fuente
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from aiohttp import web
+
+# Dirección de loopback de cada host real (todas en el mismo puerto)
+HOSTS = {
+    "mindicador.cl": "127.0.0.1",
+    "www.metro.cl": "127.0.0.2",
+    "api.xor.cl": "127.0.0.3",
+    "api.gael.cl": "127.0.0.4",
+}
+
+METRO_LINES = ("1", "2", "3", "4", "4A", "5", "6")
+
+
+class StubUpstream:
+    """Genera y sirve los payloads, con latencia, errores y tamaño configurables."""
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.05,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        arrivals: int = 8,
+        quakes: int = 15,
+        stations: int = 20,
+        churn: float = 0.3,
+        pad_kb: int = 0,
+        etag: bool = False,
+        compress: bool = False,
+        payload_dir: Path | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.arrivals = arrivals
+        self.quakes = quakes
+        self.stations = stations
+        self.churn = churn
+        self.pad = "x" * (pad_kb * 1024)
+        self.etag = etag
+        self.compress = compress
+        self.recorded: dict[str, Any] = {}
+        if payload_dir is not None:
+            for name in ("dolar", "uf", "metro", "sismos", "bus"):
+                path = payload_dir / f"{name}.json"
+                if path.exists():
+                    self.recorded[name] = json.loads(path.read_text(encoding="utf-8"))
+        self.generation = 0
+        self.requests: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.not_modified: Counter[str] = Counter()
+        self.bytes: Counter[str] = Counter()
+        self._rng = random.Random(seed)
+
+    # ---- Payloads ----
+    def _indicator(self, key: str) -> Any:
+        if key in self.recorded:
+            return self.recorded[key]
+        base = 950.0 if key == "dolar" else 38000.0
+        return {
+            "codigo": key,
+            "unidad_medida": "Pesos",
+            "serie": [
+                {"fecha": f"2025-01-{31 - i:02d}T03:00:00.000Z", "valor": round(base + i * 1.7, 2)}
+                for i in range(31)
+            ],
+        }
+
+    def _metro(self) -> Any:
+        if "metro" in self.recorded:
+            return self.recorded["metro"]
+        lines = []
+        for lid in METRO_LINES:
+            closed = (self.generation + len(lid)) % 11 == 0
+            lines.append({
+                "nombre": f"Linea {lid}",
+                "estado": "Suspendida parcialmente" if closed else "Operativa",
+                "estaciones": [
+                    {"nombre": f"Estación {lid}-{i}", "estado": "cerrada" if closed and i < 3 else "normal"}
+                    for i in range(self.stations)
+                ],
+                "incidencias": [{"estacion": f"Estación {lid}-0", "detalle": "Cierre temporal"}] if closed else [],
+            })
+        return {"lineas": lines}
+
+    def _sismos(self) -> Any:
+        if "sismos" in self.recorded:
+            return self.recorded["sismos"]
+        rng = random.Random(self.generation // 10)  # un sismo nuevo cada ~10 generaciones
+        return [
+            {
+                "Fecha": f"2025-01-01 {23 - i % 24:02d}:00:00",
+                "Profundidad": str(rng.randint(5, 120)),
+                "Magnitud": f"{rng.uniform(2.5, 6.5):.1f} Ml",
+                "RefGeografica": f"{rng.randint(5, 90)} km al {rng.choice('NSEO')} de Ciudad",
+                "Latitud": f"{rng.uniform(-40, -18):.3f}",
+                "Longitud": f"{rng.uniform(-73, -68):.3f}",
+            }
+            for i in range(self.quakes)
+        ]
+
+    def _bus(self, stop_id: str) -> Any:
+        if "bus" in self.recorded:
+            return {**self.recorded["bus"], "name": f"Paradero {stop_id}"}
+        h = zlib.crc32(stop_id.encode())
+        gen = self.generation if h % 100 < self.churn * 100 else 0
+        rng = random.Random(f"{stop_id}:{gen}")
+        style = h % 3  # cada paradero usa siempre el mismo formato de ETA
+        buses = []
+        for i in range(rng.randint(0, self.arrivals)):
+            lo = rng.randint(0, 25)
+            bus: dict[str, Any] = {"route": f"{rng.choice('BCDEFGHI')}{rng.randint(1, 40):02d}", "destination": "Centro"}
+            if style == 0:
+                bus.update(min_arrival=lo, max_arrival=lo + 2)
+            elif style == 1:
+                bus["arrival_estimation"] = f"Entre {lo:02d} Y {lo + 4:02d} min."
+            else:
+                bus["minutes"] = lo
+            buses.append(bus)
+        return {"name": f"Paradero {stop_id}", "buses": buses}
+
+    def _payload(self, path: str) -> tuple[str, Any]:
+        if path == "/api/dolar":
+            return "usd", self._indicator("dolar")
+        if path == "/api/uf":
+            return "uf", self._indicator("uf")
+        if path.endswith("/estado-red"):
+            return "metro", self._metro()
+        if path.startswith("/red/bus-stop/"):
+            return "bus", self._bus(path.rsplit("/", 1)[1])
+        if path.endswith("/sismos"):
+            return "sismos", self._sismos()
+        raise web.HTTPNotFound
+
+    # ---- HTTP ----
+    async def handle(self, request: web.Request) -> web.Response:
+        source, payload = self._payload(request.path)
+        self.requests[source] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors[source] += 1
+            return web.Response(status=503)
+        if self.pad and isinstance(payload, dict):
+            payload = {**payload, "_pad": self.pad}
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        headers = {}
+        if self.etag:
+            tag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            if request.headers.get("If-None-Match") == tag:
+                self.not_modified[source] += 1
+                return web.Response(status=304)
+            headers["ETag"] = tag
+        self.bytes[source] += len(body)
+        resp = web.Response(body=body, content_type="application/json", headers=headers)
+        if self.compress:
+            resp.enable_compression()  # según el Accept-Encoding del cliente
+        return resp
+
+    async def control(self, request: web.Request) -> web.Response:
+        if "generation" in request.query:
+            self.generation = int(request.query["generation"])
+        return web.json_response({"generation": self.generation})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": self.requests,
+            "errors": self.errors,
+            "not_modified": self.not_modified,
+            "bytes": self.bytes,
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/_control", self.control)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+    async def start(self, port: int = 0) -> tuple[web.AppRunner, int]:
+        """Escucha en cada dirección de HOSTS (mismo puerto) y devuelve el puerto."""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        addrs = list(dict.fromkeys(HOSTS.values()))
+        first = web.TCPSite(runner, addrs[0], port)
+        await first.start()
+        port = first._server.sockets[0].getsockname()[1]  # noqa: SLF001 (puerto efímero)
+        for addr in addrs[1:]:
+            await web.TCPSite(runner, addr, port).start()
+        return runner, port
+
+
+def stub_url(url: str, port: int) -> str:
+    """URL real → la misma ruta en el stub local."""
+    scheme, rest = url.split("://", 1)
+    host, _, path = rest.partition("/")
+    return f"http://{HOSTS[host]}:{port}/{path}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--latency", type=float, default=0.05, help="segundos por respuesta")
+    ap.add_argument("--jitter", type=float, default=0.5, help="variación relativa de la latencia")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    ap.add_argument("--arrivals", type=int, default=8, help="máximo de buses por paradero")
+    ap.add_argument("--quakes", type=int, default=15)
+    ap.add_argument("--stations", type=int, default=20, help="estaciones por línea de Metro")
+    ap.add_argument("--churn", type=float, default=0.3, help="fracción de paraderos que cambian por generación")
+    ap.add_argument("--pad-kb", type=int, default=0, help="relleno extra por payload (KB)")
+    ap.add_argument("--etag", action="store_true", help="responder ETag / 304")
+    ap.add_argument("--compress", action="store_true", help="comprimir según Accept-Encoding (gzip/br)")
+    ap.add_argument("--payload-dir", type=Path, help="payloads grabados en vez de sintéticos")
+    ap.add_argument("--seed", type=int, default=0)
+    return ap
+
+
+def from_args(args: argparse.Namespace) -> StubUpstream:
+    return StubUpstream(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        arrivals=args.arrivals,
+        quakes=args.quakes,
+        stations=args.stations,
+        churn=args.churn,
+        pad_kb=args.pad_kb,
+        etag=args.etag,
+        compress=args.compress,
+        payload_dir=args.payload_dir,
+        seed=args.seed,
+    )
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    runner, port = await from_args(args).start(args.port)
+    print(f"PORT {port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main() -> int:
+    try:
+        asyncio.run(_serve(build_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,27 +7,44 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.helpers.typing import ConfigType
 
-from .const import DOMAIN
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .const import (
+    DOMAIN, DATA_HUB, CONF_STOP_IDS, CONF_INTERVALS, CONF_MAX_CONCURRENCY, SIGNAL_STOPS_CHANGED,
+)
 
 _LOGGER = logging.getLogger(__name__)
 PLATFORMS: list[Platform] = [Platform.SENSOR]
+# Opciones que se aplican en caliente; cualquier otra recarga la entrada
+LIVE_OPTIONS = frozenset({CONF_STOP_IDS, CONF_MAX_CONCURRENCY, *CONF_INTERVALS.values()})
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
-    """Setup via YAML (no-op)."""
+    """Setup via YAML (no-op); registra los comandos de websocket y los servicios."""
+    from .services import async_register_services
+    from .websocket_api import async_register_commands
+
+    async_register_commands(hass)
+    async_register_services(hass)
     return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Navaja Chilena from a config entry."""
     # ⬇️ Importamos aquí para no bloquear el import de config_flow
-    from .coordinator import NavajaCoordinator
-
-    coordinator = NavajaCoordinator(hass, entry)
-    await coordinator.async_config_entry_first_refresh()
+    from .coordinator import NavajaHub
 
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = {"coordinator": coordinator, "entry": entry}
+    # Un solo hub para todas las entradas: cada URL se pide una vez por ciclo
+    hub: NavajaHub = hass.data[DOMAIN].get(DATA_HUB) or NavajaHub(hass)
+    hass.data[DOMAIN][DATA_HUB] = hub
+    coordinators = await hub.async_add_entry(entry)
+
+    hass.data[DOMAIN][entry.entry_id] = {
+        "coordinators": coordinators,
+        "entry": entry,
+        "options": dict(entry.options),
+    }
 
     # UI/endpoint opcional (también import perezoso)
     try:
@@ -39,7 +56,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Cargar plataformas
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    # Recargar si cambian opciones
+    # Aplicar opciones nuevas (en caliente si se puede)
     entry.async_on_unload(entry.add_update_listener(async_update_listener))
     return True
 
@@ -49,9 +66,25 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
+        hub = hass.data[DOMAIN].get(DATA_HUB)
+        if hub is not None:
+            await hub.async_remove_entry(entry)
+            if not hub.has_entries:
+                hass.data[DOMAIN].pop(DATA_HUB)
     return unload_ok
 
 
 async def async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
-    """Reload entry on options update."""
-    await hass.config_entries.async_reload(entry.entry_id)
+    """Paraderos, intervalos y concurrencia se aplican sin recargar; el resto recarga la entrada."""
+    data = hass.data[DOMAIN][entry.entry_id]
+    old, new = data["options"], dict(entry.options)
+    changed = {k for k in old.keys() | new.keys() if old.get(k) != new.get(k)}
+    if not changed:
+        return
+    if not changed <= LIVE_OPTIONS:
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+    data["options"] = new
+    added, removed = hass.data[DOMAIN][DATA_HUB].async_update_entry(entry)
+    if added or removed:
+        async_dispatcher_send(hass, SIGNAL_STOPS_CHANGED.format(entry.entry_id), added, removed)
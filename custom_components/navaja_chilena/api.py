@@ -0,0 +1,577 @@
+# Author: duvob90
+from __future__ import annotations
+
+import asyncio
+import codecs
+import hashlib
+import json
+import logging
+import random
+import re
+from collections import defaultdict, deque
+from math import ceil
+from email.utils import parsedate_to_datetime
+from time import monotonic, perf_counter
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+from urllib.parse import urlsplit
+
+from aiohttp import ClientResponse, ClientResponseError
+
+try:
+    from aiohttp.compression_utils import HAS_BROTLI
+except ImportError:  # aiohttp antiguo
+    HAS_BROTLI = False
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.util import dt as dt_util
+from homeassistant.util.json import json_loads
+
+from .const import (
+    CIRCUIT_BASE_BACKOFF_SECONDS, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_MAX_BACKOFF_SECONDS,
+    DEFAULT_MAX_CONCURRENCY, TELEMETRY_WINDOW,
+    MAX_BODY_BYTES, DECODE_OFFLOAD_BYTES,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+FETCH_TIMEOUT_SECONDS = 20
+# Cubetas (segundos) del histograma de latencia
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10)
+# Sólo pedimos br si aiohttp puede descomprimirlo
+ACCEPT_ENCODING = "br, gzip, deflate" if HAS_BROTLI else "gzip, deflate"
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+_CHUNK_SIZE = 16 * 1024
+_SEPARATORS = re.compile(r"[\s,]*")
+_DECODER = json.JSONDecoder()
+_DELIMITERS = frozenset(",] \t\r\n")
+
+
+class UpstreamError(Exception):
+    """La API no respondió algo utilizable (o su circuito está abierto)."""
+
+
+class _Circuit:
+    """Circuit breaker de un host: backoff exponencial con jitter y soporte de Retry-After.
+
+    Cerrado hasta CIRCUIT_FAILURE_THRESHOLD fallas seguidas (o un Retry-After).
+    Abierto, rechaza todo hasta que vence el backoff; las peticiones que ya
+    habían salido y fallan no suman otra falla a esa ventana. Al vencer queda
+    semiabierto: pasa una sola petición de prueba; si responde se cierra y si
+    falla se vuelve a abrir con el doble de espera.
+    """
+
+    __slots__ = ("failures", "trips", "open_until", "probing")
+
+    def __init__(self) -> None:
+        self.failures = 0  # fallas seguidas
+        self.trips = 0  # aperturas seguidas (escala el backoff)
+        self.open_until = 0.0
+        self.probing = False
+
+    def state(self, now: float) -> str:
+        if not self.trips:
+            return "closed"
+        return "half_open" if self.probing or now >= self.open_until else "open"
+
+    def allows(self, now: float) -> bool:
+        if not self.trips:
+            return True
+        if now < self.open_until:
+            return False
+        # Semiabierto: pasa sólo esta; si la prueba se pierde (cancelada), otra tras el timeout
+        self.probing = True
+        self.open_until = now + FETCH_TIMEOUT_SECONDS
+        return True
+
+    def success(self) -> None:
+        self.failures = self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def failure(self, now: float, retry_after: float | None = None) -> float | None:
+        """Registra una falla; devuelve los segundos que el circuito queda abierto (None si no se abre)."""
+        if self.trips and not self.probing:
+            # Salió antes de abrirse el circuito: esta ventana ya contó su falla
+            return None
+        self.failures += 1
+        if retry_after is None and not self.trips and self.failures < CIRCUIT_FAILURE_THRESHOLD:
+            return None
+        self.trips += 1
+        self.probing = False
+        if retry_after is None:
+            delay = min(CIRCUIT_BASE_BACKOFF_SECONDS * 2 ** (self.trips - 1), CIRCUIT_MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.8, 1.2)
+        else:
+            delay = min(retry_after, CIRCUIT_MAX_BACKOFF_SECONDS)
+        self.open_until = now + delay
+        return delay
+
+
+def _retry_after(value: str | None) -> float | None:
+    """Segundos pedidos por Retry-After (entero o fecha HTTP)."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - dt_util.utcnow()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class _BodyTooLarge(Exception):
+    """La respuesta supera el máximo de la fuente."""
+
+
+def _check_declared_length(resp: ClientResponse, limit: int) -> None:
+    """Rechaza sin leer si Content-Length ya supera `limit`."""
+    # Content-Length es el tamaño comprimido: si ya se pasa, descomprimido también
+    length = resp.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > limit:
+        raise _BodyTooLarge
+
+
+async def _read_capped(resp: ClientResponse, limit: int) -> bytes:
+    """Cuerpo completo (descomprimido), cortando apenas supera `limit` bytes."""
+    _check_declared_length(resp, limit)
+    body = bytearray()
+    async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+        body += chunk
+        if len(body) > limit:
+            raise _BodyTooLarge
+    return bytes(body)
+
+
+async def _read_list_head(resp: ClientResponse, max_items: int, limit: int) -> tuple[bytes, Any, int]:
+    """Primeros `max_items` elementos de un arreglo JSON, decodificados a medida que llegan.
+
+    Deja de leer apenas los tiene. Devuelve (texto de esos elementos, lista,
+    bytes recibidos); el texto sirve para el hash de caché. Si el cuerpo no
+    es un arreglo se lee completo y se devuelve (cuerpo, None, bytes).
+    """
+    _check_declared_length(resp, limit)
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    raw = bytearray()  # sólo hasta saber si es un arreglo
+    buf = ""
+    items: list[Any] = []
+    texts: list[str] = []
+    received = 0
+    started = closed = False
+
+    def drain(final: bool) -> None:
+        nonlocal buf, closed
+        pos = 0
+        while len(items) < max_items:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                closed = True
+                break
+            try:
+                obj, end = _DECODER.raw_decode(buf, pos)
+            except ValueError:
+                if final:
+                    raise
+                break  # elemento incompleto: esperamos el próximo trozo
+            if not final and (end >= len(buf) or buf[end] not in _DELIMITERS):
+                break  # podría ser un número cortado ("4" de "4.25")
+            items.append(obj)
+            texts.append(buf[pos:end])
+            pos = end
+        buf = buf[pos:]
+
+    async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+        received += len(chunk)
+        if received > limit:
+            raise _BodyTooLarge
+        if not started:
+            raw += chunk
+            head = raw.lstrip()
+            if not head:
+                continue
+            if head[:1] != b"[":
+                continue  # no es un arreglo: se lee completo
+            started = True
+            buf = utf8.decode(bytes(head[1:]))
+        else:
+            buf += utf8.decode(chunk)
+        drain(False)
+        if closed or len(items) >= max_items:
+            break
+    else:
+        if not started:
+            return bytes(raw), None, received
+        buf += utf8.decode(b"", final=True)
+        drain(True)
+        if not closed and len(items) < max_items:
+            raise ValueError("arreglo JSON incompleto")
+    return ",".join(texts).encode(), items, received
+
+
+def _percentile(samples: list[float], q: float) -> float | None:
+    """Percentil por rango más cercano (muestras ya ordenadas)."""
+    if not samples:
+        return None
+    return samples[max(0, ceil(q * len(samples)) - 1)]
+
+
+def _ms(v: float | None) -> float | None:
+    return None if v is None else round(v * 1000, 2)
+
+
+class SourceStats:
+    """Telemetría de una fuente: contadores acumulados y ventana móvil de latencias."""
+
+    __slots__ = (
+        "requests", "successes", "failures", "rejected", "cache_hits", "bytes",
+        "latencies", "parse_times", "offloaded", "loop_parse", "last_error", "last_success",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0  # no enviadas: circuito abierto
+        self.cache_hits = 0  # 304 o cuerpo idéntico (sin volver a parsear)
+        self.bytes = 0
+        self.latencies: deque[float] = deque(maxlen=TELEMETRY_WINDOW)
+        self.parse_times: deque[float] = deque(maxlen=TELEMETRY_WINDOW)
+        self.offloaded = 0  # respuestas decodificadas en el executor
+        self.loop_parse = 0.0  # segundos acumulados decodificando en el event loop
+        self.last_error: str | None = None
+        self.last_success: str | None = None
+
+    def ok(self) -> None:
+        self.successes += 1
+        self.last_success = dt_util.utcnow().isoformat()
+
+    def fail(self, reason: Any) -> None:
+        self.failures += 1
+        self.last_error = str(reason)
+
+    def latency_p(self, q: float) -> float | None:
+        return _percentile(sorted(self.latencies), q)
+
+    def as_dict(self) -> dict[str, Any]:
+        lat = sorted(self.latencies)
+        parse = sorted(self.parse_times)
+        histogram = {f"<={b}s": 0 for b in LATENCY_BUCKETS}
+        histogram[f">{LATENCY_BUCKETS[-1]}s"] = 0
+        for v in lat:
+            bucket = next((f"<={b}s" for b in LATENCY_BUCKETS if v <= b), f">{LATENCY_BUCKETS[-1]}s")
+            histogram[bucket] += 1
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "cache_hits": self.cache_hits,
+            "bytes": self.bytes,
+            "latency_ms": {
+                "p50": _ms(_percentile(lat, 0.5)),
+                "p95": _ms(_percentile(lat, 0.95)),
+                "max": _ms(lat[-1] if lat else None),
+                "histogram": histogram,
+            },
+            "parse_ms": {
+                "p50": _ms(_percentile(parse, 0.5)),
+                "p95": _ms(_percentile(parse, 0.95)),
+                "on_loop_total": _ms(self.loop_parse),
+            },
+            "offloaded": self.offloaded,
+            "last_error": self.last_error,
+            "last_success": self.last_success,
+        }
+
+
+# Marca de JSON inválido en los resultados de _decode_batch
+_INVALID_JSON = object()
+
+
+def _freeze(obj: Any) -> Any:
+    """Vista de sólo lectura: dict → MappingProxyType, list → tuple (recursivo)."""
+    if type(obj) is dict:
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if type(obj) is list:
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj: Any) -> Any:
+    """Copia mutable (dict/list) de un resultado de `async_fetch`, p. ej. para guardarlo como JSON."""
+    if isinstance(obj, Mapping):
+        return {k: thaw(v) for k, v in obj.items()}
+    if type(obj) is tuple:
+        return [thaw(v) for v in obj]
+    return obj
+
+
+def _decode_batch(jobs: tuple[tuple[bytes, Any, Callable[[Any], Any]], ...]) -> tuple[tuple[Any, Any, float], ...]:
+    """Decodifica y normaliza un lote de cuerpos: `(resultado, error, segundos)` por cuerpo.
+
+    Corre en el executor o en el loop; no toca estado del cliente. El
+    resultado sale congelado (ver `_freeze`): queda en la caché y se comparte
+    entre quienes piden la URL. Un JSON inválido devuelve `_INVALID_JSON`
+    con el ValueError; si falla `parse`, el resultado es None con la excepción.
+    """
+    out = []
+    for body, js, parse in jobs:
+        t0 = perf_counter()
+        try:
+            # json_loads de HA ya usa orjson
+            if js is None:
+                js = json_loads(body)
+        except ValueError as e:
+            out.append((_INVALID_JSON, e, perf_counter() - t0))
+            continue
+        try:
+            out.append((_freeze(parse(js)), None, perf_counter() - t0))
+        except Exception as e:  # noqa: BLE001 - se relanza en quien pidió la URL
+            out.append((None, e, perf_counter() - t0))
+    return tuple(out)
+
+
+class _CachedResponse:
+    """Validadores HTTP, hash del cuerpo y último resultado ya normalizado de una URL."""
+
+    __slots__ = ("etag", "last_modified", "body_hash", "parsed")
+
+    def __init__(self) -> None:
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.body_hash: bytes | None = None
+        self.parsed: Any = None
+
+
+class NavajaApiClient:
+    """Cliente HTTP con peticiones condicionales, caché por URL y circuit breaker por host.
+
+    Si el servidor responde 304, o el cuerpo es idéntico al anterior, se
+    devuelve el mismo objeto normalizado de la vez pasada sin decodificar
+    ni normalizar de nuevo. Los errores de red, 5xx y 429 cuentan como fallas
+    del host y, seguidos, abren su circuito (ver `_Circuit`).
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._cache: dict[str, _CachedResponse] = {}
+        self._circuits: dict[str, _Circuit] = {}
+        # Límite de peticiones simultáneas por host (no acaparar la sesión compartida de HA)
+        self.host_concurrency = DEFAULT_MAX_CONCURRENCY
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.stats: defaultdict[str, SourceStats] = defaultdict(SourceStats)
+        # Cuerpos a la espera de decodificarse en lote (ver `_async_decode`)
+        self.decode_offload_bytes = DECODE_OFFLOAD_BYTES
+        self._decode_queue: list[tuple[bytes, Any, Callable[[Any], Any], asyncio.Future]] = []
+        self._decode_bytes = 0
+        self._decode_offload = False
+        self._decode_scheduled = False
+        self._decode_running = False
+
+    def set_host_concurrency(self, limit: int) -> None:
+        if limit != self.host_concurrency:
+            self.host_concurrency = limit
+            self._semaphores.clear()  # las peticiones en vuelo terminan con el semáforo anterior
+
+    def circuits(self) -> dict[str, dict[str, Any]]:
+        """Estado de los circuitos por host (diagnóstico)."""
+        now = monotonic()
+        return {
+            host: {
+                "state": c.state(now),
+                "failures": c.failures,
+                "open_for": round(max(0.0, c.open_until - now), 1),
+            }
+            for host, c in self._circuits.items()
+        }
+
+    def _trip(self, host: str, circuit: _Circuit, reason: Any, retry_after: float | None = None) -> UpstreamError:
+        delay = circuit.failure(monotonic(), retry_after)
+        if delay is None:
+            _LOGGER.debug("Fetch failed for %s (%s)", host, reason)
+            return UpstreamError(f"{host}: {reason}")
+        _LOGGER.warning("Fetch failed for %s (%s); pausing requests for %.0f s", host, reason, delay)
+        return UpstreamError(f"{host}: {reason}")
+
+    async def async_fetch(
+        self,
+        url: str,
+        parse: Callable[[Any], Any],
+        source: str,
+        max_items: int | None = None,
+        offload: bool = False,
+    ) -> Any:
+        """Descarga `url` y devuelve `parse(json)` de sólo lectura; ante error lanza UpstreamError.
+
+        Sin cambios (304 o mismo cuerpo) devuelve el mismo objeto que la vez
+        anterior; quien necesite modificarlo o guardarlo usa `thaw`.
+
+        La respuesta se corta en MAX_BODY_BYTES[source]. Con `max_items` el
+        cuerpo debe ser un arreglo y sólo se leen y decodifican sus primeros
+        `max_items` elementos. Con `offload` (o si la respuesta es grande)
+        el cuerpo se decodifica y normaliza en el executor. Latencia, bytes,
+        tiempo de parseo y aciertos de caché quedan en `stats[source]`.
+        """
+        host = urlsplit(url).hostname or url
+        stats = self.stats[source]
+        circuit = self._circuits.setdefault(host, _Circuit())
+        if not circuit.allows(monotonic()):
+            stats.rejected += 1
+            raise UpstreamError(f"{host}: circuito abierto")
+
+        session = async_get_clientsession(self.hass)
+        cached = self._cache.get(url)
+
+        headers: dict[str, str] = {"Accept-Encoding": ACCEPT_ENCODING}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+
+        stats.requests += 1
+        try:
+            async with semaphore:
+                # La latencia no incluye la espera por el semáforo
+                start = monotonic()
+                async with session.get(url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS) as resp:
+                    if resp.status == 304 and cached is not None:
+                        stats.latencies.append(monotonic() - start)
+                        stats.cache_hits += 1
+                        stats.ok()
+                        circuit.success()
+                        return cached.parsed
+                    if resp.status == 429 or resp.status >= 500:
+                        raise self._trip(
+                            host, circuit, f"HTTP {resp.status}", _retry_after(resp.headers.get("Retry-After"))
+                        )
+                    resp.raise_for_status()
+                    max_bytes = MAX_BODY_BYTES.get(source, DEFAULT_MAX_BODY_BYTES)
+                    if max_items is None:
+                        body = await _read_capped(resp, max_bytes)
+                        js, received = None, len(body)
+                    else:
+                        body, js, received = await _read_list_head(resp, max_items, max_bytes)
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+                stats.latencies.append(monotonic() - start)
+        except UpstreamError as e:
+            stats.fail(e)
+            raise
+        except _BodyTooLarge:
+            stats.fail(f"respuesta > {max_bytes} bytes")
+            raise self._trip(host, circuit, f"respuesta > {max_bytes} bytes") from None
+        except ValueError as e:
+            stats.fail(f"JSON inválido: {e}")
+            raise self._trip(host, circuit, f"JSON inválido: {e}") from e
+        except ClientResponseError as e:
+            # 4xx propio de la petición (p. ej. paradero inexistente): el host está sano
+            circuit.success()
+            stats.fail(f"HTTP {e.status}")
+            raise UpstreamError(f"{host}: HTTP {e.status}") from e
+        except Exception as e:
+            stats.fail(e)
+            raise self._trip(host, circuit, e) from e
+        stats.bytes += received
+
+        # Sin validadores (o servidor que los ignora): comparamos un hash barato del cuerpo
+        body_hash = hashlib.blake2b(body, digest_size=16).digest()
+        if cached is not None and cached.body_hash == body_hash:
+            stats.cache_hits += 1
+            stats.ok()
+            circuit.success()
+            cached.etag = etag or cached.etag
+            cached.last_modified = last_modified or cached.last_modified
+            return cached.parsed
+
+        parsed, error, elapsed, offloaded = await self._async_decode(body, js, parse, offload)
+        stats.parse_times.append(elapsed)
+        if offloaded:
+            stats.offloaded += 1
+        else:
+            stats.loop_parse += elapsed
+        if parsed is _INVALID_JSON:
+            stats.fail(f"JSON inválido: {error}")
+            raise self._trip(host, circuit, f"JSON inválido: {error}") from error
+        circuit.success()
+        if error is not None:
+            raise error
+
+        entry = cached or self._cache.setdefault(url, _CachedResponse())
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.body_hash = body_hash
+        entry.parsed = parsed
+        stats.ok()
+        return entry.parsed
+
+    async def _async_decode(
+        self, body: bytes, js: Any, parse: Callable[[Any], Any], offload: bool
+    ) -> tuple[Any, Any, float, bool]:
+        """Encola un cuerpo para decodificarlo y normalizarlo en lote.
+
+        Lo que llega en la misma vuelta del loop, o mientras el executor
+        procesa el lote anterior, forma un lote. Un lote va al executor si
+        alguien lo pidió (`offload`) o si suma `decode_offload_bytes`; si
+        no, se procesa en el loop. El resultado es de sólo lectura (ver
+        `_decode_batch`).
+        """
+        fut: asyncio.Future = self.hass.loop.create_future()
+        self._decode_queue.append((body, js, parse, fut))
+        self._decode_bytes += len(body)
+        self._decode_offload |= offload
+        if not self._decode_scheduled and not self._decode_running:
+            self._decode_scheduled = True
+            self.hass.loop.call_soon(self._flush_decode)
+        return await fut
+
+    @callback
+    def _flush_decode(self) -> None:
+        self._decode_scheduled = False
+        queue, self._decode_queue = self._decode_queue, []
+        size, self._decode_bytes = self._decode_bytes, 0
+        offload, self._decode_offload = self._decode_offload, False
+        if not queue:
+            return
+        jobs = tuple((body, js, parse) for body, js, parse, _ in queue)
+        futures = [fut for *_, fut in queue]
+        if offload or size >= self.decode_offload_bytes:
+            self._decode_running = True
+            self.hass.async_create_background_task(
+                self._async_offload(jobs, futures), "navaja_chilena decode", eager_start=True
+            )
+        else:
+            _resolve(futures, _decode_batch(jobs), False)
+
+    async def _async_offload(self, jobs: tuple, futures: list[asyncio.Future]) -> None:
+        try:
+            results = await self.hass.async_add_executor_job(_decode_batch, jobs)
+        except asyncio.CancelledError:  # Home Assistant apagándose
+            for fut in futures:
+                fut.cancel()
+            raise
+        except Exception as e:  # noqa: BLE001 - executor caído
+            for fut in futures:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            _resolve(futures, results, True)
+        finally:
+            self._decode_running = False
+            # Lo que llegó mientras tanto va como el siguiente lote
+            if self._decode_queue:
+                self._flush_decode()
+
+
+def _resolve(futures: list[asyncio.Future], results: tuple[tuple[Any, Any, float], ...], offloaded: bool) -> None:
+    for fut, res in zip(futures, results):
+        # Quien pidió la URL pudo cancelarse (plazo del ciclo de paraderos)
+        if not fut.done():
+            fut.set_result((*res, offloaded))
@@ -0,0 +1,258 @@
+# Author: duvob90
+"""Catálogo local de paraderos (código, nombre, coordenadas) importado desde GTFS.
+
+Se arma una vez desde un `stops.txt` (servicio `navaja_chilena.import_stops`)
+y se guarda compacto en `.storage/navaja_chilena.stops`: coordenadas como
+enteros de 32 bits (micro-grados) y un solo bloque de texto con códigos y
+nombres. Se carga la primera vez que se usa, en el executor.
+"""
+from __future__ import annotations
+
+import csv
+import math
+import re
+import struct
+import unicodedata
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_CATALOGUE, CATALOGUE_FILE
+
+_MAGIC = b"NCSTOPS1"
+_HEADER = struct.Struct("<8sI")
+# Celdas de ~550 m (latitud) para la búsqueda por cercanía
+_CELL_DEG = 0.005
+_M_PER_DEG = 111_320.0
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+_RE_CODE = re.compile(r"^[A-Z]+\d*$")
+# Marca en hass.data: ya se buscó el archivo y no existe
+_MISSING = object()
+
+
+def _fold(text: str) -> str:
+    """Minúsculas y sin tildes, para comparar nombres."""
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+
+
+class StopCatalogue:
+    """Paraderos ordenados por código, con índice por prefijo/nombre y grilla espacial."""
+
+    def __init__(self, codes: list[str], names: list[str], lat: array, lon: array) -> None:
+        order = sorted(range(len(codes)), key=codes.__getitem__)
+        self.codes = [codes[i] for i in order]
+        self.names = [names[i] for i in order]
+        self.lat = array("i", (lat[i] for i in order))
+        self.lon = array("i", (lon[i] for i in order))
+        # Índices: se arman al primer uso (o con warm() desde el executor)
+        self._tokens: list[tuple[str, int]] | None = None
+        self._vocabulary: list[str] | None = None
+        self._grid: dict[tuple[int, int], list[int]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code: str) -> bool:
+        return self.index_of(code) is not None
+
+    def index_of(self, code: str) -> int | None:
+        code = code.strip().upper()
+        i = bisect_left(self.codes, code)
+        return i if i < len(self.codes) and self.codes[i] == code else None
+
+    def stop(self, i: int, distance_m: float | None = None) -> dict[str, Any]:
+        out = {"code": self.codes[i], "name": self.names[i], "lat": self.lat[i] / 1e6, "lon": self.lon[i] / 1e6}
+        if distance_m is not None:
+            out["distance_m"] = round(distance_m)
+        return out
+
+    # ---- Persistencia ----
+    @classmethod
+    def from_gtfs(cls, path: Path) -> StopCatalogue:
+        """Lee un `stops.txt` de GTFS (usa stop_code y, si falta, stop_id)."""
+        codes: list[str] = []
+        names: list[str] = []
+        lat, lon = array("i"), array("i")
+        seen: set[str] = set()
+        with path.open(encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                code = (row.get("stop_code") or row.get("stop_id") or "").strip().upper()
+                try:
+                    la, lo = float(row["stop_lat"]), float(row["stop_lon"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if not code or code in seen or "\t" in code:
+                    continue
+                seen.add(code)
+                codes.append(code)
+                names.append(" ".join((row.get("stop_name") or "").split()))
+                lat.append(round(la * 1e6))
+                lon.append(round(lo * 1e6))
+        return cls(codes, names, lat, lon)
+
+    def save(self, path: Path) -> None:
+        text = "\n".join(f"{c}\t{n}" for c, n in zip(self.codes, self.names)).encode()
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(self.codes)))
+            self.lat.tofile(f)
+            self.lon.tofile(f)
+            f.write(text)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> StopCatalogue:
+        raw = path.read_bytes()
+        magic, count = _HEADER.unpack_from(raw)
+        if magic != _MAGIC:
+            raise ValueError(f"{path}: formato desconocido")
+        pos = _HEADER.size
+        lat, lon = array("i"), array("i")
+        lat.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+        lon.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+        codes: list[str] = []
+        names: list[str] = []
+        if count:
+            for line in raw[pos:].decode().split("\n"):
+                code, _, name = line.partition("\t")
+                codes.append(code)
+                names.append(name)
+        if len(codes) != count:
+            raise ValueError(f"{path}: archivo truncado")
+        return cls(codes, names, lat, lon)
+
+    def warm(self) -> StopCatalogue:
+        """Arma los índices de una vez (en el executor: ~40 ms con todos los paraderos de Red)."""
+        self._name_index()
+        self._cells()
+        return self
+
+    # ---- Búsqueda ----
+    def _name_index(self) -> list[tuple[str, int]]:
+        if self._tokens is None:
+            self._tokens = sorted(
+                (tok, i) for i, name in enumerate(self.names) for tok in set(_RE_TOKEN.findall(_fold(name)))
+            )
+            self._vocabulary = sorted({tok for tok, _ in self._tokens})
+        return self._tokens
+
+    def _with_token_prefix(self, prefix: str) -> set[int]:
+        tokens = self._name_index()
+        out: set[int] = set()
+        for j in range(bisect_left(tokens, (prefix, -1)), len(tokens)):
+            tok, i = tokens[j]
+            if not tok.startswith(prefix):
+                break
+            out.add(i)
+        return out
+
+    def search(self, query: str, limit: int = 10) -> list[dict[str, Any]]:
+        """Por código (prefijo) y por nombre: cada palabra debe empezar alguna palabra del nombre.
+
+        Si el nombre no calza tal cual, se prueba con las palabras más parecidas
+        (errores de tipeo).
+        """
+        query = query.strip()
+        if not query:
+            return []
+        hits: list[int] = []
+        code = query.upper()
+        if _RE_CODE.match(code):
+            for j in range(bisect_left(self.codes, code), len(self.codes)):
+                if not self.codes[j].startswith(code) or len(hits) >= limit:
+                    break
+                hits.append(j)
+        words = _RE_TOKEN.findall(_fold(query))
+        if words and len(hits) < limit:
+            found = self._match_words(words)
+            if not found:
+                import difflib  # sólo para errores de tipeo: fuera del import de la integración
+
+                self._name_index()
+                fuzzy = [difflib.get_close_matches(w, self._vocabulary, n=3, cutoff=0.75) or [w] for w in words]
+                found = self._match_words([alts[0] for alts in fuzzy])
+            seen = set(hits)
+            hits += sorted((i for i in found if i not in seen), key=lambda i: (self.names[i], self.codes[i]))
+        return [self.stop(i) for i in hits[:limit]]
+
+    def _match_words(self, words: list[str]) -> set[int]:
+        found: set[int] | None = None
+        for w in words:
+            match = self._with_token_prefix(w)
+            found = match if found is None else found & match
+            if not found:
+                return set()
+        return found or set()
+
+    def _cells(self) -> dict[tuple[int, int], list[int]]:
+        if self._grid is None:
+            grid: dict[tuple[int, int], list[int]] = {}
+            for i, (la, lo) in enumerate(zip(self.lat, self.lon)):
+                grid.setdefault((math.floor(la / 1e6 / _CELL_DEG), math.floor(lo / 1e6 / _CELL_DEG)), []).append(i)
+            self._grid = grid
+        return self._grid
+
+    def near(self, lat: float, lon: float, radius_m: float, limit: int = 20) -> list[dict[str, Any]]:
+        """Paraderos a menos de `radius_m` metros, del más cercano al más lejano."""
+        grid = self._cells()
+        cos_lat = math.cos(math.radians(lat))
+        d_lat = radius_m / _M_PER_DEG
+        d_lon = radius_m / (_M_PER_DEG * max(cos_lat, 1e-6))
+        ci0, ci1 = math.floor((lat - d_lat) / _CELL_DEG), math.floor((lat + d_lat) / _CELL_DEG)
+        cj0, cj1 = math.floor((lon - d_lon) / _CELL_DEG), math.floor((lon + d_lon) / _CELL_DEG)
+        found: list[tuple[float, int]] = []
+        for ci in range(ci0, ci1 + 1):
+            for cj in range(cj0, cj1 + 1):
+                for i in grid.get((ci, cj), ()):
+                    # Equirectangular: de sobra para unos cientos de metros
+                    dy = (self.lat[i] / 1e6 - lat) * _M_PER_DEG
+                    dx = (self.lon[i] / 1e6 - lon) * _M_PER_DEG * cos_lat
+                    dist = math.hypot(dx, dy)
+                    if dist <= radius_m:
+                        found.append((dist, i))
+        found.sort()
+        return [self.stop(i, dist) for dist, i in found[:limit]]
+
+
+def catalogue_path(hass: HomeAssistant) -> Path:
+    return Path(hass.config.path(".storage", CATALOGUE_FILE))
+
+
+async def async_get_catalogue(hass: HomeAssistant) -> StopCatalogue | None:
+    """Catálogo importado (cargado una vez y compartido), o None si aún no hay."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    cached = domain_data.get(DATA_CATALOGUE)
+    if cached is _MISSING:
+        return None
+    if cached is not None:
+        return cached
+    path = catalogue_path(hass)
+
+    def _load() -> StopCatalogue | None:
+        return StopCatalogue.load(path).warm() if path.exists() else None
+
+    catalogue = await hass.async_add_executor_job(_load)
+    domain_data[DATA_CATALOGUE] = _MISSING if catalogue is None else catalogue
+    return catalogue
+
+
+async def async_import_catalogue(hass: HomeAssistant, source: Path) -> StopCatalogue:
+    """Arma el catálogo desde un `stops.txt`, lo guarda y lo deja en uso."""
+    target = catalogue_path(hass)
+
+    def _build() -> StopCatalogue:
+        catalogue = StopCatalogue.from_gtfs(source)
+        if not len(catalogue):
+            raise ValueError(f"{source} no tiene paraderos con coordenadas")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        catalogue.save(target)
+        return catalogue.warm()
+
+    catalogue = await hass.async_add_executor_job(_build)
+    hass.data.setdefault(DOMAIN, {})[DATA_CATALOGUE] = catalogue
+    return catalogue
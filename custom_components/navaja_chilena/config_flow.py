@@ -6,13 +6,31 @@ from homeassistant import config_entries
 from homeassistant.core import callback
 
 # Evitamos dependencias innecesarias para que el import sea 100% fiable
-DOMAIN = "navaja_chilena"
-CONF_STOP_IDS = "stop_ids"
-DEFAULT_STOPS = "PA433"
+# (const.py no importa nada de Home Assistant)
+from .const import (
+    DOMAIN, CONF_STOP_IDS, DEFAULT_STOPS,
+    SOURCES, CONF_INTERVALS, DEFAULT_INTERVALS, MIN_INTERVAL_SECONDS,
+    CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY, MAX_CONCURRENCY_LIMIT,
+    CONF_QUAKE_RADIUS_KM, DEFAULT_QUAKE_RADIUS_KM,
+    CONF_METRO_STATION_SENSORS, CONF_METRO_PINNED_STATIONS,
+    CONF_BUS_COMPACT_ATTRIBUTES, CONF_BUS_ARRIVALS, DEFAULT_BUS_ARRIVALS,
+    CATALOGUE_NEAR_RADIUS_M,
+)
 
 DATA_SCHEMA = vol.Schema({
     vol.Required(CONF_STOP_IDS, default=DEFAULT_STOPS): str
 })
+NEAR_STOPS_DEFAULT = 5  # paraderos cerca de casa que se proponen al configurar
+
+
+async def _async_unknown_stops(hass, stops_str: str) -> list[str]:
+    """Códigos que no están en el catálogo local (ninguno si no se ha importado)."""
+    from .catalogue import async_get_catalogue
+
+    catalogue = await async_get_catalogue(hass)
+    if catalogue is None:
+        return []
+    return [s for s in (p.strip().upper() for p in stops_str.split(",")) if s and s not in catalogue]
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -20,14 +38,37 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
     async def async_step_user(self, user_input: dict | None = None):
+        errors: dict[str, str] = {}
+        placeholders = {"unknown": ""}
         if user_input is not None:
-            # Guardamos directamente lo ingresado por el usuario
-            return self.async_create_entry(title="Navaja Chilena", data=user_input)
+            # Con catálogo importado se validan los códigos sin consultar la API
+            unknown = await _async_unknown_stops(self.hass, user_input[CONF_STOP_IDS])
+            if not unknown:
+                return self.async_create_entry(title="Navaja Chilena", data=user_input)
+            errors[CONF_STOP_IDS] = "unknown_stop"
+            placeholders["unknown"] = ", ".join(unknown)
+
+        schema = DATA_SCHEMA
+        if user_input is None:
+            # Sin nada ingresado aún: proponer los paraderos más cercanos a casa
+            from .catalogue import async_get_catalogue
+
+            catalogue = await async_get_catalogue(self.hass)
+            near = catalogue.near(
+                self.hass.config.latitude, self.hass.config.longitude, CATALOGUE_NEAR_RADIUS_M, NEAR_STOPS_DEFAULT
+            ) if catalogue is not None else []
+            if near:
+                schema = vol.Schema({
+                    vol.Required(CONF_STOP_IDS, default=", ".join(s["code"] for s in near)): str
+                })
+        else:
+            schema = self.add_suggested_values_to_schema(DATA_SCHEMA, user_input)
 
         return self.async_show_form(
             step_id="user",
-            data_schema=DATA_SCHEMA,
-            errors={},
+            data_schema=schema,
+            errors=errors,
+            description_placeholders=placeholders,
         )
 
     @staticmethod
@@ -42,17 +83,59 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         self.config_entry = config_entry
 
     async def async_step_init(self, user_input: dict | None = None):
+        errors: dict[str, str] = {}
+        placeholders = {"unknown": ""}
         if user_input is not None:
-            # Persistimos las opciones tal cual
-            return self.async_create_entry(title="", data=user_input)
+            unknown = await _async_unknown_stops(self.hass, user_input[CONF_STOP_IDS])
+            if not unknown:
+                # Persistimos las opciones tal cual
+                return self.async_create_entry(title="", data=user_input)
+            errors[CONF_STOP_IDS] = "unknown_stop"
+            placeholders["unknown"] = ", ".join(unknown)
 
         current = self.config_entry.options.get(
             CONF_STOP_IDS,
             self.config_entry.data.get(CONF_STOP_IDS, DEFAULT_STOPS),
         )
+        schema: dict = {vol.Required(CONF_STOP_IDS, default=current): str}
+        # Un intervalo por fuente (segundos)
+        for source in SOURCES:
+            key = CONF_INTERVALS[source]
+            schema[vol.Required(key, default=self.config_entry.options.get(key, DEFAULT_INTERVALS[source]))] = vol.All(
+                vol.Coerce(int), vol.Range(min=MIN_INTERVAL_SECONDS)
+            )
+        # Peticiones simultáneas por host
+        schema[vol.Required(
+            CONF_MAX_CONCURRENCY,
+            default=self.config_entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY),
+        )] = vol.All(vol.Coerce(int), vol.Range(min=1, max=MAX_CONCURRENCY_LIMIT))
+        # Radio (km desde casa) del sensor "mayor sismo cercano"
+        schema[vol.Required(
+            CONF_QUAKE_RADIUS_KM,
+            default=self.config_entry.options.get(CONF_QUAKE_RADIUS_KM, DEFAULT_QUAKE_RADIUS_KM),
+        )] = vol.All(vol.Coerce(int), vol.Range(min=1))
+        # Estaciones de Metro: sensores para las que alguna vez se desvían y/o las fijadas
+        schema[vol.Required(
+            CONF_METRO_STATION_SENSORS,
+            default=self.config_entry.options.get(CONF_METRO_STATION_SENSORS, False),
+        )] = bool
+        schema[vol.Optional(
+            CONF_METRO_PINNED_STATIONS,
+            default=self.config_entry.options.get(CONF_METRO_PINNED_STATIONS, ""),
+        )] = str
+        # Atributos de los paraderos: compactos (recorder) y cuántas llegadas
+        schema[vol.Required(
+            CONF_BUS_COMPACT_ATTRIBUTES,
+            default=self.config_entry.options.get(CONF_BUS_COMPACT_ATTRIBUTES, False),
+        )] = bool
+        schema[vol.Required(
+            CONF_BUS_ARRIVALS,
+            default=self.config_entry.options.get(CONF_BUS_ARRIVALS, DEFAULT_BUS_ARRIVALS),
+        )] = vol.All(vol.Coerce(int), vol.Range(min=1, max=DEFAULT_BUS_ARRIVALS))
         return self.async_show_form(
             step_id="init",
-            data_schema=vol.Schema({
-                vol.Required(CONF_STOP_IDS, default=current): str
-            }),
+            # Si hubo error, se conserva lo que el usuario ya había cambiado
+            data_schema=self.add_suggested_values_to_schema(vol.Schema(schema), user_input or {}),
+            errors=errors,
+            description_placeholders=placeholders,
         )
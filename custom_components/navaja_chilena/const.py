@@ -4,9 +4,126 @@ from __future__ import annotations
 DOMAIN = "navaja_chilena"
 TITLE = "Navaja Chilena"
 
+# Clave en hass.data[DOMAIN] del hub compartido entre entradas
+DATA_HUB = "hub"
+# ... y del catálogo local de paraderos (ver catalogue.py)
+DATA_CATALOGUE = "catalogue"
+
 CONF_STOP_IDS = "stop_ids"  # comma-separated list
 DEFAULT_STOPS = "PA433"
-UPDATE_INTERVAL_SECONDS = 60
+
+# Fuentes: cada una tiene su propio coordinador e intervalo de refresco
+SOURCE_USD = "usd"
+SOURCE_UF = "uf"
+SOURCE_METRO = "metro"
+SOURCE_SISMOS = "sismos"
+SOURCE_BUS = "bus"
+SOURCES = [SOURCE_USD, SOURCE_UF, SOURCE_METRO, SOURCE_SISMOS, SOURCE_BUS]
+
+# Intervalos configurables desde Options (segundos)
+CONF_INTERVALS = {
+    SOURCE_USD: "usd_interval",
+    SOURCE_UF: "uf_interval",
+    SOURCE_METRO: "metro_interval",
+    SOURCE_SISMOS: "sismos_interval",
+    SOURCE_BUS: "bus_interval",
+}
+# UF y dólar cambian a lo más una vez al día; los buses sí merecen refresco rápido
+DEFAULT_INTERVALS = {
+    SOURCE_USD: 3600,
+    SOURCE_UF: 3600,
+    SOURCE_METRO: 60,
+    SOURCE_SISMOS: 60,
+    # Paraderos: intervalo más rápido; cada paradero se adapta (ver BUS_* más abajo)
+    SOURCE_BUS: 60,
+}
+MIN_INTERVAL_SECONDS = 10
+
+# Cada cuánto se recalculan localmente las ETA de los paraderos (sin red)
+ETA_COUNTDOWN_SECONDS = 15
+
+# Sondeo adaptativo por paradero
+BUS_NEAR_MINUTES = 5  # bus a menos de esto: intervalo base
+BUS_IDLE_INTERVAL_SECONDS = 600  # sin llegadas (y tope para buses lejanos)
+BUS_NIGHT_INTERVAL_SECONDS = 1800  # fuera del horario de servicio
+BUS_NIGHT_START_HOUR = 1  # hora local [inicio, fin) sin servicio regular
+BUS_NIGHT_END_HOUR = 5
+
+# Reparto de carga con muchos paraderos
+CONF_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_MAX_CONCURRENCY = 4  # peticiones simultáneas por host
+MAX_CONCURRENCY_LIMIT = 32
+BUS_DISPATCH_SPREAD = 0.5  # fracción del intervalo en que se reparten los inicios
+BUS_CYCLE_DEADLINE = 0.8  # fracción del intervalo tras la cual se publica lo que haya
+
+# Historial de sismos: ring buffer por identidad del evento
+QUAKE_HISTORY_SIZE = 100
+QUAKE_WINDOW_HOURS = 24  # ventana de "el mayor sismo cercano"
+CONF_QUAKE_RADIUS_KM = "quake_radius_km"
+DEFAULT_QUAKE_RADIUS_KM = 300
+EVENT_NEW_QUAKE = f"{DOMAIN}_new_quake"
+
+# Eventos de flanco (sólo cuando algo cambia); también como device triggers
+EVENT_METRO_STATUS_CHANGED = f"{DOMAIN}_metro_status_changed"
+EVENT_BUS_APPROACHING = f"{DOMAIN}_bus_approaching"
+BUS_APPROACHING_MINUTES = 3  # un recorrido "se acerca" cuando su llegada más temprana baja de esto
+
+# Sensores por estación de Metro (opcionales): fijadas por el usuario y/o las que alguna vez se desviaron
+CONF_METRO_STATION_SENSORS = "metro_station_sensors"
+CONF_METRO_PINNED_STATIONS = "metro_pinned_stations"  # comma-separated list
+
+# Atributos de los paraderos: modo compacto (ventanas numéricas, destinos sin repetir, fuera del recorder)
+CONF_BUS_COMPACT_ATTRIBUTES = "bus_compact_attributes"
+CONF_BUS_ARRIVALS = "bus_arrivals"  # llegadas por paradero en los atributos
+DEFAULT_BUS_ARRIVALS = 8
+SERVICE_GET_ARRIVALS = "get_arrivals"
+# Paraderos agregados/quitados de una entrada en caliente (formatear con entry_id)
+SIGNAL_STOPS_CHANGED = f"{DOMAIN}_stops_changed_{{}}"
+
+# Circuit breaker por host (mindicador.cl, metro.cl, api.xor.cl, api.gael.cl)
+CIRCUIT_FAILURE_THRESHOLD = 3  # fallas seguidas antes de abrir
+CIRCUIT_BASE_BACKOFF_SECONDS = 30
+CIRCUIT_MAX_BACKOFF_SECONDS = 1800
+
+# Tamaño máximo (ya descomprimido) de cada respuesta: una API que se desboca no nos llena la memoria
+MAX_BODY_BYTES = {
+    SOURCE_USD: 256 * 1024,
+    SOURCE_UF: 256 * 1024,
+    SOURCE_METRO: 2 * 1024 * 1024,
+    SOURCE_SISMOS: 1024 * 1024,
+    SOURCE_BUS: 256 * 1024,
+}
+# Decodificación y normalización en el executor (en vez del event loop) para una respuesta
+# o lote de este tamaño, o para una fuente cuyo ciclo anterior descargó al menos esto
+DECODE_OFFLOAD_BYTES = 64 * 1024
+# Sismos: sólo se decodifican los primeros N de la lista (vienen del más nuevo al más viejo)
+QUAKE_FEED_ITEMS = 30
+
+# USD/UF: serie diaria en caché; sólo se descarga si no cubre el día de hoy
+INDICATOR_RECHECK_SECONDS = 3 * 3600  # sin dato nuevo (p. ej. dólar en fin de semana)
+INDICATOR_HISTORY_DAYS = 30  # atributo `history`
+INDICATOR_SERIES_MAX_DAYS = 90
+
+# Telemetría por fuente: latencias y tiempos de parseo de las últimas N peticiones
+TELEMETRY_WINDOW = 100
+
+# Caché de consultas del panel (paraderos no vigilados por ninguna entrada)
+LOOKUP_CACHE_SIZE = 64
+LOOKUP_CACHE_TTL_SECONDS = 30
+# Consulta de varios paraderos en una sola petición del panel
+LOOKUP_BATCH_MAX = 20
+LOOKUP_BATCH_CONCURRENCY = 4
+
+# Catálogo local de paraderos (GTFS stops.txt importado una vez)
+CATALOGUE_FILE = "navaja_chilena.stops"
+CATALOGUE_NEAR_RADIUS_M = 300  # "paraderos cerca de casa"
+CATALOGUE_SEARCH_LIMIT = 10
+SERVICE_IMPORT_STOPS = "import_stops"
+
+# Último estado conocido (arranque instantáneo)
+STORAGE_KEY = "navaja_chilena.last_state"
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY_SECONDS = 30
 
 # API endpoints
 USD_URL = "https://mindicador.cl/api/dolar"
@@ -3,256 +3,843 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from datetime import timedelta
-from typing import Any, Iterable
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
+from time import monotonic
+from typing import Any
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_change, async_track_time_interval
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.util import dt as dt_util
 
+from .api import NavajaApiClient, UpstreamError, thaw
+from .catalogue import async_get_catalogue
 from .const import (
-    UPDATE_INTERVAL_SECONDS,
     CONF_STOP_IDS,
+    CONF_INTERVALS, DEFAULT_INTERVALS,
+    LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL_SECONDS, LOOKUP_BATCH_CONCURRENCY,
+    ETA_COUNTDOWN_SECONDS,
+    BUS_NEAR_MINUTES, BUS_IDLE_INTERVAL_SECONDS, BUS_NIGHT_INTERVAL_SECONDS,
+    BUS_NIGHT_START_HOUR, BUS_NIGHT_END_HOUR,
+    BUS_DISPATCH_SPREAD, BUS_CYCLE_DEADLINE,
+    CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY,
+    STORAGE_KEY, STORAGE_VERSION, STORAGE_SAVE_DELAY_SECONDS,
+    EVENT_NEW_QUAKE, QUAKE_FEED_ITEMS, DECODE_OFFLOAD_BYTES,
+    EVENT_METRO_STATUS_CHANGED, EVENT_BUS_APPROACHING, BUS_APPROACHING_MINUTES,
+    INDICATOR_RECHECK_SECONDS,
+    SOURCE_USD, SOURCE_UF, SOURCE_METRO, SOURCE_SISMOS, SOURCE_BUS,
     USD_URL, UF_URL, METRO_URL, BUS_URL_TMPL, SISMOS_URL,
 )
+from .parsers import (
+    parse_series, parse_metro, parse_quakes, parse_stop, sismo_view,
+    anchor_stop, render_stop,
+)
+from .quakes import QuakeIndex
+from .series import IndicatorSeries
+from .stations import StationIndex
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def _try_float(v) -> float | None:
-    try:
-        if v is None:
-            return None
-        if isinstance(v, (int, float)):
-            return float(v)
-        s = str(v).strip().replace(",", ".")
-        return float(s)
-    except Exception:
-        return None
-
-
-def _first(items: Iterable[Any]) -> Any | None:
-    for it in items:
-        if it is not None:
-            return it
-    return None
-
-
-def _fmt_eta(obj: dict) -> str | None:
-    """Construye una ETA legible desde múltiples formatos (XOR y variantes)."""
-    # 1) Campo ya listo
-    txt = _first([obj.get("arrival_estimation"), obj.get("eta_text"), obj.get("eta")])
-    if isinstance(txt, str) and txt.strip():
-        return txt.strip()
-
-    # 2) Rangos numéricos (a/b, min/max, etc.)
-    for a_key, b_key in (("a", "b"), ("min", "max"), ("min_arrival", "max_arrival"), ("min_arrive", "max_arrive")):
-        a = _try_float(obj.get(a_key))
-        b = _try_float(obj.get(b_key))
-        if a is not None and b is not None:
-            return f"Entre {int(a):02d} Y {int(b):02d} min."
-
-    # 3) Strings tipo "06-08", "6 a 8", "6–8"
-    raw = _first([obj.get("arrives_in"), obj.get("time"), obj.get("window"), obj.get("range")])
-    if isinstance(raw, str):
-        s = raw.lower().replace("min.", "").replace("min", "").strip()
-        for sep in ("-", "–", "—", " a ", " y "):
-            if sep in s:
-                p = [x.strip() for x in s.split(sep)]
-                if len(p) >= 2 and p[0].isdigit() and p[1].isdigit():
-                    return f"Entre {int(p[0]):02d} Y {int(p[1]):02d} min."
-
-    # 4) Timestamp → minutos
-    ts = _first([obj.get("datetime"), obj.get("timestamp"), obj.get("hora"), obj.get("time_at")])
-    if isinstance(ts, str) and ts:
-        try:
-            target = dt_util.parse_datetime(ts)
-            if target:
-                mins = max(0, int((target - dt_util.utcnow()).total_seconds() / 60))
-                return f"{mins} min"
-        except Exception:
-            pass
+def stop_ids_from_entry(entry: ConfigEntry) -> list[str]:
+    """Paraderos configurados (options tiene prioridad sobre data)."""
+    stops_str = entry.options.get(CONF_STOP_IDS, entry.data.get(CONF_STOP_IDS, ""))
+    return [s.strip().upper() for s in stops_str.split(",") if s.strip()]
 
-    # 5) Número suelto
-    m = _try_float(_first([obj.get("minutes"), obj.get("minutos")]))
-    if m is not None:
-        return f"{int(m)} min"
 
-    return None
+class NavajaSourceCoordinator(DataUpdateCoordinator[dict[str, Any]], ABC):
+    """Coordinador de una sola fuente, compartido por todas las entradas (ver NavajaHub)."""
 
+    source: str
 
-class NavajaCoordinator(DataUpdateCoordinator[dict[str, Any]]):
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+    def __init__(self, hass: HomeAssistant, hub: NavajaHub) -> None:
         super().__init__(
             hass,
             _LOGGER,
-            name="Navaja Chilena Coordinator",
-            update_interval=timedelta(seconds=UPDATE_INTERVAL_SECONDS),
+            # Compartido entre entradas: no queda atado a ninguna (ni a su unload)
+            config_entry=None,
+            name=f"Navaja Chilena {self.source}",
+            update_interval=timedelta(seconds=DEFAULT_INTERVALS[self.source]),
+            # Si nada cambió devolvemos el mismo dict y no se notifica a las entidades
+            always_update=False,
         )
-        self.entry = entry
+        self.hub = hub
+        self.client = hub.client
+        # Momento de la última descarga (o del snapshot restaurado desde disco)
+        self.fetched_at: datetime | None = None
+        # Contextos de entidades cuyo trozo cambió en el último refresco (None = todas)
+        self._changed: set[str] | None = None
+        self._notified_success = True
+        # Duración (s) del último refresco completo, para diagnóstico
+        self.cycle_duration: float | None = None
+        # Bytes descargados y tiempo (s) decodificando en el event loop durante el último refresco
+        self.cycle_bytes = 0
+        self.cycle_loop_time = 0.0
+        # Una descarga a la vez: un refresco que llega a mitad de otro lo espera y parte de sus datos
+        self._fetch_lock = asyncio.Lock()
 
     async def _async_update_data(self) -> dict[str, Any]:
-        session = async_get_clientsession(self.hass)
-
-        stops_str = self.entry.options.get(CONF_STOP_IDS, self.entry.data.get(CONF_STOP_IDS, ""))
-        stop_ids = [s.strip().upper() for s in stops_str.split(",") if s.strip()]
-
-        async def fetch_json(url: str) -> Any:
-            try:
-                async with session.get(url, timeout=20) as resp:
-                    resp.raise_for_status()
-                    return await resp.json(content_type=None)
-            except Exception as e:
-                _LOGGER.warning("Fetch failed for %s: %s", url, e)
-                return None
-
-        usd_task = asyncio.create_task(fetch_json(USD_URL))
-        uf_task = asyncio.create_task(fetch_json(UF_URL))
-        metro_task = asyncio.create_task(fetch_json(METRO_URL))
-        sismos_task = asyncio.create_task(fetch_json(SISMOS_URL))
-        bus_tasks = {sid: asyncio.create_task(fetch_json(BUS_URL_TMPL.format(stop_id=sid))) for sid in stop_ids}
-
-        usd_json, uf_json, metro_json, sismos_json = await asyncio.gather(
-            usd_task, uf_task, metro_task, sismos_task
+        async with self._fetch_lock:
+            return await self._async_update_locked()
+
+    async def _async_update_locked(self) -> dict[str, Any]:
+        self._changed = None
+        start = monotonic()
+        stats = self.client.stats[self.source]
+        bytes0, loop0 = stats.bytes, stats.loop_parse
+        try:
+            data = await self._async_fetch_data()
+        except UpstreamError as e:
+            # Nunca reemplazamos datos buenos por defaults: se sirve el último dato con `stale_since`
+            if self.data is None:
+                raise UpdateFailed(str(e)) from e
+            return self._stale(self.data)
+        finally:
+            self.cycle_duration = monotonic() - start
+            self.cycle_bytes = stats.bytes - bytes0
+            self.cycle_loop_time = stats.loop_parse - loop0
+        self.fetched_at = dt_util.utcnow()
+        old = self.data
+        if data is not old:
+            self.hub.async_schedule_save()
+            if old is not None and old.get("stale_since") == data.get("stale_since"):
+                self._changed = self._changed_contexts(old, data)
+        return data
+
+    def _changed_contexts(self, old: dict[str, Any], new: dict[str, Any]) -> set[str]:
+        """Claves de primer nivel que cambiaron (las subclases afinan por línea/paradero)."""
+        return {k for k in old.keys() | new.keys() if old.get(k) != new.get(k)}
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Notifica sólo a las entidades cuyo contexto cambió.
+
+        Si no hay diff (primer dato, error, cambio de disponibilidad o de
+        `stale_since`) se notifica a todas, como el coordinador base.
+        """
+        changed, self._changed = self._changed, None
+        if changed is None or self.last_update_success != self._notified_success:
+            self._notified_success = self.last_update_success
+            super().async_update_listeners()
+            return
+        for update_callback, context in list(self._listeners.values()):
+            if context is None or context in changed:
+                update_callback()
+
+    @abstractmethod
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        """Descarga y arma el payload de la fuente (UpstreamError si falla)."""
+
+    def _stale(self, data: dict[str, Any]) -> dict[str, Any]:
+        if "stale_since" in data or self.fetched_at is None:
+            return data
+        return {**data, "stale_since": self.fetched_at.isoformat()}
+
+    def async_restore(self, data: dict[str, Any], fetched_at: datetime) -> None:
+        """Carga un snapshot previo, marcado con `stale_since` hasta el próximo refresco."""
+        self.fetched_at = fetched_at
+        self.data = {**data, "stale_since": fetched_at.isoformat()}
+
+    def _reuse_if_unchanged(self, data: dict[str, Any]) -> dict[str, Any]:
+        """Devuelve el dict anterior si todas sus partes son los mismos objetos."""
+        prev = self.data
+        if prev is not None and prev.keys() == data.keys() and all(prev[k] is v for k, v in data.items()):
+            return prev
+        return data
+
+
+class IndicatorCoordinator(NavajaSourceCoordinator):
+    """USD/UF desde la serie en caché; sólo se descarga cuando no cubre el día de hoy.
+
+    La UF se publica por adelantado, así que basta ~una descarga al mes; el
+    dólar, una al día (y, mientras no haya valor nuevo, como mucho una cada
+    INDICATOR_RECHECK_SECONDS). El cambio de día lo dispara el hub a
+    medianoche y se resuelve sin red.
+    """
+
+    key: str
+    api_key: str
+    url: str
+
+    def __init__(self, hass: HomeAssistant, hub: NavajaHub) -> None:
+        super().__init__(hass, hub)
+        self.series = IndicatorSeries()
+        self._checked_at: float | None = None
+
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        today = dt_util.now().date().isoformat()
+        if not self.series.covers(today) and (
+            self._checked_at is None or monotonic() - self._checked_at >= INDICATOR_RECHECK_SECONDS
+        ):
+            values = await self.client.async_fetch(self.url, partial(parse_series, key=self.api_key), self.source)
+            self._checked_at = monotonic()
+            self.series.merge(values)
+        return self._from_series(today)
+
+    def _from_series(self, today: str) -> dict[str, Any]:
+        view = self.series.view(today)
+        data = {self.key: view.pop("value"), f"{self.key}_info": view, "series": self.series.values}
+        prev = self.data
+        if prev is not None and all(prev.get(k) == v for k, v in data.items()) and "stale_since" not in prev:
+            return prev
+        return data
+
+    def _changed_contexts(self, old: dict[str, Any], new: dict[str, Any]) -> set[str]:
+        return {self.key}
+
+    def async_restore(self, data: dict[str, Any], fetched_at: datetime) -> None:
+        self.series.merge(data.get("series") or {})
+        super().async_restore(data, fetched_at)
+
+
+class UsdCoordinator(IndicatorCoordinator):
+    source = SOURCE_USD
+    key = "usd"
+    api_key = "dolar"
+    url = USD_URL
+
+
+class UfCoordinator(IndicatorCoordinator):
+    source = SOURCE_UF
+    key = "uf"
+    api_key = "uf"
+    url = UF_URL
+
+
+def station_context(line_id: str, station: str) -> str:
+    """Contexto de la entidad de una estación (las de línea usan el id de la línea)."""
+    return f"{line_id}|{station}"
+
+
+class MetroCoordinator(NavajaSourceCoordinator):
+    source = SOURCE_METRO
+
+    def __init__(self, hass: HomeAssistant, hub: NavajaHub) -> None:
+        super().__init__(hass, hub)
+        self.stations = StationIndex()
+        self._station_changes: set[tuple[str, str]] = set()
+        # Último resultado (de sólo lectura) del cliente y su copia en dicts planos
+        self._parsed: Any = None
+        self._thawed: dict[str, Any] = {}
+
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        # Sin cambios, el cliente devuelve el mismo objeto de la vez anterior y se reusa la copia
+        parsed = await self.client.async_fetch(METRO_URL, parse_metro, self.source)
+        if parsed is not self._parsed:
+            # Va tal cual a los atributos y al Store: hace falta en dicts planos
+            self._parsed, self._thawed = parsed, thaw(parsed)
+        data = self._thawed
+        prev = self.data or {}
+        if prev:
+            self._async_fire_line_changes(prev.get("metro_lines") or {}, data.get("metro_lines") or {})
+        self._station_changes = (
+            self.stations.apply(data.get("metro_stations") or {})
+            if data.get("metro_stations") is not prev.get("metro_stations") else set()
         )
+        return data
+
+    @callback
+    def _async_fire_line_changes(self, old: dict[str, str], new: dict[str, str]) -> None:
+        if old is new:
+            return
+        for lid, state in new.items():
+            if lid in old and old[lid] != state:
+                self.hass.bus.async_fire(EVENT_METRO_STATUS_CHANGED, {"line": lid, "old": old[lid], "new": state})
+
+    def _changed_contexts(self, old: dict[str, Any], new: dict[str, Any]) -> set[str]:
+        changed: set[str] = set()
+        for key in ("metro_lines", "metro_details"):
+            a, b = old.get(key) or {}, new.get(key) or {}
+            changed.update(lid for lid in a.keys() | b.keys() if a.get(lid) != b.get(lid))
+        changed.update(station_context(lid, name) for lid, name in self._station_changes)
+        self._station_changes = set()
+        return changed
+
+    def async_restore(self, data: dict[str, Any], fetched_at: datetime) -> None:
+        self.stations.apply(data.get("metro_stations") or {})
+        super().async_restore(data, fetched_at)
+
+
+class SismosCoordinator(NavajaSourceCoordinator):
+    """Historial de sismos: cada ciclo sólo normaliza los eventos no vistos o revisados."""
+
+    source = SOURCE_SISMOS
+
+    def __init__(self, hass: HomeAssistant, hub: NavajaHub) -> None:
+        super().__init__(hass, hub)
+        self.index = QuakeIndex()
+
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        index = self.index
+        index.set_home(self.hass.config.latitude, self.hass.config.longitude)
+        # Sin historial previo (primera descarga) no hay nada "nuevo" que anunciar
+        seeded = len(index) > 0
+        fresh = await self.client.async_fetch(
+            SISMOS_URL, partial(parse_quakes, known=index.revisions()), self.source, max_items=QUAKE_FEED_ITEMS
+        )
+        new = index.merge(fresh)
+        if seeded:
+            for ev in reversed(new):
+                data = {k: v for k, v in ev.items() if k not in ("ts", "mag")}
+                self.hass.bus.async_fire(EVENT_NEW_QUAKE, {**data, "magnitude": ev["mag"]})
+        return self._from_index()
+
+    def _from_index(self) -> dict[str, Any]:
+        events = self.index.events
+        prev = self.data or {}
+        sismo = prev["sismo"] if prev.get("quakes") is events else sismo_view(events[0] if events else None)
+        return self._reuse_if_unchanged({"sismo": sismo, "quakes": events})
+
+    def async_restore(self, data: dict[str, Any], fetched_at: datetime) -> None:
+        self.index.set_home(self.hass.config.latitude, self.hass.config.longitude)
+        # Antes los sismos sin id se identificaban por "fecha|lat|lon": pasan a sólo la fecha
+        self.index.merge(
+            {**ev, "id": str(ev["fecha"])} if ev.get("fecha") and ev["id"].startswith(f"{ev['fecha']}|") else ev
+            for ev in data.get("quakes") or []
+        )
+        super().async_restore({**data, "quakes": self.index.events}, fetched_at)
+
+
+class BusCoordinator(NavajaSourceCoordinator):
+    """Paraderos con sondeo adaptativo.
+
+    El coordinador avanza al intervalo configurado (el más rápido), pero en
+    cada ciclo sólo consulta los paraderos cuya próxima consulta ya venció.
+    El intervalo de cada paradero depende de su bus más cercano y del horario
+    de servicio (ver `_poll_interval`).
+    """
+
+    source = SOURCE_BUS
+
+    def __init__(self, hass: HomeAssistant, hub: NavajaHub) -> None:
+        super().__init__(hass, hub)
+        self._next_poll: dict[str, float] = {}
+        # Recorridos que ya "se acercan" por paradero (para avisar sólo una vez)
+        self._approaching: dict[str, set[str]] = {}
+
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        prev = (self.data or {}).get("buses") or {}
+        stale = "stale_since" in (self.data or {})
+        now_ts = dt_util.utcnow().timestamp()
+        # Los más atrasados primero: si el ciclo vence, quedan para el próximo
+        due = sorted(
+            (
+                sid for sid in self.hub.stop_ids
+                if stale or sid not in prev or self._next_poll.get(sid, 0) <= now_ts + 1
+            ),
+            key=lambda sid: self._next_poll.get(sid, 0),
+        )
+        if not due:
+            return self._reuse_if_unchanged({"buses": prev})
+
+        base = self._base_interval()
+        # Ciclo pesado (cientos de paraderos): se decodifica y normaliza en el executor
+        offload = self.cycle_bytes >= DECODE_OFFLOAD_BYTES
+        # Muchos paraderos: se reparten los inicios en parte del intervalo en vez de una ráfaga.
+        # Los paraderos sin datos aún (arranque, paradero nuevo) no esperan.
+        known = [sid for sid in due if sid in prev and not stale]
+        spread = base * BUS_DISPATCH_SPREAD / len(known) if len(known) > self.client.host_concurrency else 0
+        delays = {sid: i * spread for i, sid in enumerate(known)}
+        tasks = {
+            asyncio.create_task(self._async_fetch_stop(sid, delays.get(sid, 0), prev.get(sid), base, offload)): sid
+            for sid in due
+        }
+        done, pending = await asyncio.wait(tasks, timeout=base * BUS_CYCLE_DEADLINE)
+        for t in pending:
+            # Vencido el plazo del ciclo: se publica lo ya listo y el resto sigue pendiente
+            t.cancel()
+        if pending:
+            _LOGGER.debug("Ciclo de paraderos vencido: %d de %d pendientes", len(pending), len(tasks))
+        fetched = {tasks[t]: t.result() for t in done}
+
+        stop_ids = self.hub.stop_ids
+        latest = (self.data or {}).get("buses") or {}
+        bus_data = {}
+        for sid in stop_ids:
+            stop = fetched[sid] if sid in fetched else latest.get(sid) or prev.get(sid)
+            # Paradero sin dato aún (agregado durante el ciclo o vencido el plazo): queda para el próximo
+            if stop is not None:
+                bus_data[sid] = stop
+        for sid in list(self._next_poll):
+            if sid not in bus_data:
+                del self._next_poll[sid]
+        for sid in list(self._approaching):
+            if sid not in bus_data:
+                del self._approaching[sid]
+        self._async_fire_approaching(bus_data, dt_util.utcnow().timestamp())
+
+        if prev == bus_data:
+            bus_data = prev
+        return self._reuse_if_unchanged({"buses": bus_data})
+
+    async def _async_fetch_stop(
+        self, sid: str, delay: float, prev: dict[str, Any] | None, base: int, offload: bool
+    ) -> dict[str, Any]:
+        """Descarga un paradero (tras `delay` s) y lo publica apenas está listo."""
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            parsed = await self.client.async_fetch(
+                BUS_URL_TMPL.format(stop_id=sid), partial(parse_stop, sid), self.source, offload=offload
+            )
+            # Llegadas absolutas: la cuenta regresiva local sigue sin volver a consultar la API
+            now_ts = dt_util.utcnow().timestamp()
+            stop = render_stop(anchor_stop(parsed, now_ts), now_ts)
+        except UpstreamError as e:
+            _LOGGER.debug("Paradero %s sin datos nuevos: %s", sid, e)
+            return self._failed_stop(sid, prev, base)
+        except Exception:  # noqa: BLE001 - un paradero con respuesta rara no tumba el ciclo
+            _LOGGER.exception("Error inesperado al procesar el paradero %s", sid)
+            return self._failed_stop(sid, prev, base)
+        stop["fetched_at"] = int(now_ts)
+        stop["poll_interval"] = interval = self._poll_interval(stop, now_ts)
+        self._next_poll[sid] = now_ts + interval
+        self._async_publish_stop(sid, stop)
+        return stop
+
+    def _failed_stop(self, sid: str, prev: dict[str, Any] | None, base: int) -> dict[str, Any]:
+        """Paradero con error: se mantiene el último dato conocido, marcado con `stale_since`."""
+        self._next_poll[sid] = dt_util.utcnow().timestamp() + base
+        return self._stale_stop(prev) if prev is not None else parse_stop(sid, None)
+
+    @callback
+    def _async_publish_stop(self, sid: str, stop: dict[str, Any]) -> None:
+        """Publica un paradero a mitad de ciclo, notificando sólo a su entidad."""
+        if self.data is None or "stale_since" in self.data:
+            return
+        buses = self.data.get("buses") or {}
+        if buses.get(sid) == stop:
+            return
+        self.data = {**self.data, "buses": {**buses, sid: stop}}
+        self._changed = {sid}
+        self.async_update_listeners()
+        self._async_fire_approaching({sid: stop}, dt_util.utcnow().timestamp())
+
+    def _stale_stop(self, stop: dict[str, Any]) -> dict[str, Any]:
+        if "stale_since" in stop:
+            return stop
+        ts = stop.get("fetched_at")
+        since = dt_util.utc_from_timestamp(ts) if ts else (self.fetched_at or dt_util.utcnow())
+        return {**stop, "stale_since": since.isoformat()}
+
+    def _base_interval(self) -> int:
+        return int(self.update_interval.total_seconds()) if self.update_interval else DEFAULT_INTERVALS[SOURCE_BUS]
+
+    def _poll_interval(self, stop: dict[str, Any], now_ts: float) -> int:
+        """Segundos hasta la próxima consulta de un paradero."""
+        base = self._base_interval()
+        hour = dt_util.as_local(dt_util.utc_from_timestamp(now_ts)).hour
+        if BUS_NIGHT_START_HOUR <= hour < BUS_NIGHT_END_HOUR:
+            return max(base, BUS_NIGHT_INTERVAL_SECONDS)
+        arrivals = stop.get("arrivals") or []
+        if not arrivals:
+            return max(base, BUS_IDLE_INTERVAL_SECONDS)
+        nearest = min(
+            ((a["arrive_from"] - now_ts) / 60 for a in arrivals if "arrive_from" in a),
+            default=None,
+        )
+        if nearest is None or nearest <= BUS_NEAR_MINUTES:
+            return base
+        # Bus lejano: se consulta a la mitad del tiempo que falta, acotado
+        return int(min(max(base, nearest * 30), BUS_IDLE_INTERVAL_SECONDS))
+
+    @callback
+    def async_countdown(self, now: datetime) -> None:
+        """Recalcula las ETA de todos los paraderos con la hora local (sin red)."""
+        if not self.data or not self.data.get("buses"):
+            return
+        now_ts = now.timestamp()
+        buses = {sid: render_stop(stop, now_ts) for sid, stop in self.data["buses"].items()}
+        # El umbral se cruza con el paso del tiempo aunque el texto de la ETA no cambie
+        # (con el snapshot restaurado, aún sin datos frescos, no se avisa)
+        if "stale_since" not in self.data:
+            self._async_fire_approaching(buses, now_ts)
+        new = {**self.data, "buses": buses}
+        changed = self._changed_contexts(self.data, new)
+        if not changed:
+            return
+        self.data = new
+        self._changed = changed
+        self.async_update_listeners()
+
+    @callback
+    def _async_fire_approaching(self, buses: dict[str, dict[str, Any]], now_ts: float) -> None:
+        """Avisa cuando un recorrido baja de BUS_APPROACHING_MINUTES en un paradero (una vez por bus).
+
+        Sólo para paraderos de alguna entrada (un evento por entrada, con su
+        `entry_id`); los que sigue sólo un panel por websocket no avisan. La
+        primera vez que se ve un paradero sólo se anota lo que ya viene
+        cerca; con datos viejos (`stale_since`) no se avisa.
+        """
+        limit = now_ts + BUS_APPROACHING_MINUTES * 60
+        owners = self.hub.stop_entries()
+        for sid, stop in buses.items():
+            if sid not in owners:
+                self._approaching.pop(sid, None)
+                continue
+            near: dict[str, dict[str, Any]] = {}
+            for a in stop.get("arrivals") or []:
+                if "arrive_from" in a and now_ts <= a.get("arrive_to", a["arrive_from"]) and a["arrive_from"] <= limit:
+                    near.setdefault(a["route"], a)
+            seen = self._approaching.get(sid)
+            self._approaching[sid] = set(near)
+            if seen is None or "stale_since" in stop:
+                continue
+            for route in near.keys() - seen:
+                a = near[route]
+                data = {
+                    "stop_id": sid,
+                    "stop_name": stop.get("name"),
+                    "route": route,
+                    "dest": a["dest"],
+                    "eta": a["eta"],
+                    "minutes": max(0, round((a["arrive_from"] - now_ts) / 60)),
+                }
+                for entry_id in owners[sid]:
+                    self.hass.bus.async_fire(EVENT_BUS_APPROACHING, {**data, "entry_id": entry_id})
+
+    def _changed_contexts(self, old: dict[str, Any], new: dict[str, Any]) -> set[str]:
+        a, b = old.get("buses") or {}, new.get("buses") or {}
+        return {sid for sid in a.keys() | b.keys() if a.get(sid) is not b.get(sid) and a.get(sid) != b.get(sid)}
+
+
+COORDINATORS: dict[str, type[NavajaSourceCoordinator]] = {
+    SOURCE_USD: UsdCoordinator,
+    SOURCE_UF: UfCoordinator,
+    SOURCE_METRO: MetroCoordinator,
+    SOURCE_SISMOS: SismosCoordinator,
+    SOURCE_BUS: BusCoordinator,
+}
 
-        # ---- USD ----
-        usd_val = None
-        if isinstance(usd_json, dict):
-            serie = usd_json.get("serie")
-            if isinstance(serie, list) and serie:
-                usd_val = serie[0].get("valor")
-            if usd_val is None and isinstance(usd_json.get("dolar"), dict):
-                usd_val = usd_json["dolar"].get("valor")
-
-        # ---- UF ----
-        uf_val = None
-        if isinstance(uf_json, dict):
-            serie = uf_json.get("serie")
-            if isinstance(serie, list) and serie:
-                uf_val = serie[0].get("valor")
-            if uf_val is None and isinstance(uf_json.get("uf"), dict):
-                uf_val = uf_json["uf"].get("valor")
-
-        # ---- Metro ---- (default Operativa)
-        metro_lines: dict[str, str] = {f"L{i}": "Operativa" for i in (1, 2, 3, 4, 5, 6)}
-        metro_lines["L4A"] = "Operativa"
-
-        def _lid(name: Any) -> str | None:
-            if not name:
-                return None
-            lid = str(name).upper().replace(" ", "")
-            if lid.startswith("LINEA"):
-                lid = "L" + lid.split("LINEA", 1)[1]
-            return lid
-
-        if isinstance(metro_json, dict):
-            lines = metro_json.get("lineas") or metro_json.get("lines") or metro_json.get("data")
-            if isinstance(lines, list):
-                for ln in lines:
-                    if not isinstance(ln, dict):
-                        continue
-                    lid = _lid(ln.get("nombre") or ln.get("name") or ln.get("linea") or ln.get("id"))
-                    status = ln.get("estado") or ln.get("status") or ln.get("detalle") or ln.get("state")
-                    if lid:
-                        metro_lines[lid] = status or "Operativa"
-            else:
-                for k, v in metro_json.items():
-                    if str(k).upper().startswith("L"):
-                        metro_lines[str(k).upper()] = str(v or "Operativa")
-        elif isinstance(metro_json, list):
-            for ln in metro_json:
-                if isinstance(ln, dict):
-                    lid = _lid(ln.get("nombre") or ln.get("name") or ln.get("linea") or ln.get("id"))
-                    status = ln.get("estado") or ln.get("status") or ln.get("detalle") or ln.get("state")
-                    if lid:
-                        metro_lines[lid] = status or "Operativa"
-
-        # Incidencias por línea
-        metro_details: dict[str, dict[str, Any]] = {}
-        if isinstance(metro_json, dict):
-            lines = metro_json.get("lineas") or metro_json.get("lines") or metro_json.get("data")
-            if isinstance(lines, list):
-                for ln in lines:
-                    if not isinstance(ln, dict):
-                        continue
-                    lid = _lid(ln.get("nombre") or ln.get("name") or ln.get("linea") or ln.get("id"))
-                    if not lid:
-                        continue
-                    affected: list[str] = []
-                    details: list[str] = []
-                    for key in ("incidencias", "incidents", "issues"):
-                        val = ln.get(key)
-                        if isinstance(val, list):
-                            for it in val:
-                                if isinstance(it, dict):
-                                    st = it.get("estacion") or it.get("station") or it.get("name") or it.get("id")
-                                    if st:
-                                        affected.append(str(st))
-                                    txt = it.get("detalle") or it.get("detail") or it.get("status") or it.get("description")
-                                    if txt:
-                                        details.append(str(txt))
-                                else:
-                                    details.append(str(it))
-                    for key in ("estaciones", "stations"):
-                        val = ln.get(key)
-                        if isinstance(val, list):
-                            for st in val:
-                                if isinstance(st, dict):
-                                    st_name = st.get("nombre") or st.get("name") or st.get("id")
-                                    st_state = st.get("estado") or st.get("status")
-                                    if st_name and st_state and str(st_state).lower() not in ("normal", "operativa", "ok"):
-                                        affected.append(str(st_name))
-                    if affected or details:
-                        metro_details[lid] = {
-                            "affected_stations": sorted(set(affected)),
-                            "details": details,
-                        }
-
-        # ---- Sismos ----
-        sismo_state = "N/A"
-        sismo_attr: dict[str, Any] = {}
-        if isinstance(sismos_json, list) and sismos_json:
-            last = sismos_json[0]
-            mag = _first([last.get("Magnitud"), last.get("magnitud"), last.get("Mag")])
-            num_mag = _try_float(mag)
-            ref = _first([last.get("RefGeografica"), last.get("Referencia"), last.get("ref")])
-            fecha = _first([last.get("Fecha"), last.get("fecha"), last.get("time")])
-            prof = _first([last.get("Profundidad"), last.get("profundidad")])
-            lat = _try_float(_first([last.get("Latitud"), last.get("lat"), last.get("Latitude")]))
-            lon = _try_float(_first([last.get("Longitud"), last.get("lon"), last.get("Longitude")]))
-            sismo_state = f"M {num_mag:.1f}" if num_mag is not None else str(mag or "N/A")
-            sismo_attr = {
-                "referencia": ref,
-                "fecha": fecha,
-                "profundidad_km": prof,
-                "latitude": lat,
-                "longitude": lon,
-            }
 
-        # ---- Buses ----
-        bus_data: dict[str, Any] = {}
-        for sid, t in bus_tasks.items():
-            js = await t
-            out = {"name": None, "arrivals": []}
-            if isinstance(js, dict):
-                out["name"] = _first([js.get("name"), js.get("stop"), js.get("title")]) or sid
-                buses = js.get("buses") or js.get("services") or js.get("arrivals") or js.get("next_buses") or []
-                if isinstance(buses, list):
-                    for b in buses[:8]:
-                        route = _first([b.get("route"), b.get("servicio"), b.get("service"), b.get("route_id"), b.get("id")]) or ""
-                        head = _first([b.get("headsign"), b.get("destination"), b.get("destino")]) or ""
-                        eta_txt = _fmt_eta(b)
-                        out["arrivals"].append({"route": route, "eta": eta_txt, "dest": head})
-            bus_data[sid] = out
+class NavajaHub:
+    """Capa de descarga compartida por todas las entradas (hass.data[DOMAIN]["hub"]).
+
+    Hay un solo coordinador por fuente y un solo cliente HTTP para todo Home
+    Assistant. Los paraderos se cuentan por referencia entre entradas, de modo
+    que cada URL se pide una vez por ciclo sin importar cuántas entradas la usen.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.client = NavajaApiClient(hass)
+        self.coordinators: dict[str, NavajaSourceCoordinator] = {
+            source: cls(hass, self) for source, cls in COORDINATORS.items()
+        }
+        self._entries: dict[str, ConfigEntry] = {}
+        # Paraderos con que se suscribió cada entrada (las opciones pueden cambiar después)
+        self._entry_stops: dict[str, list[str]] = {}
+        self._stop_refs: Counter[str] = Counter()
+        self._add_lock = asyncio.Lock()
+        self._unsub_countdown: CALLBACK_TYPE | None = None
+        self._unsub_midnight: CALLBACK_TYPE | None = None
+        self._background: dict[str, asyncio.Task[None]] = {}
+        # Consultas del panel: LRU con TTL + una sola descarga en vuelo por paradero
+        self._lookup_cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lookup_inflight: dict[str, asyncio.Future[dict[str, Any]]] = {}
+        # Último estado conocido, para arrancar sin esperar a las APIs
+        self._store: Store[dict[str, Any]] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._restored = False
+
+    @property
+    def stop_ids(self) -> list[str]:
+        """Unión de los paraderos de todas las entradas (sin duplicados)."""
+        return list(self._stop_refs)
+
+    def stop_entries(self) -> dict[str, list[str]]:
+        """Entradas que configuraron cada paradero (sin los seguidos sólo por websocket)."""
+        out: dict[str, list[str]] = {}
+        for entry_id, stops in self._entry_stops.items():
+            for sid in stops:
+                out.setdefault(sid, []).append(entry_id)
+        return out
+
+    @property
+    def has_entries(self) -> bool:
+        return bool(self._entries)
+
+    async def async_add_entry(self, entry: ConfigEntry) -> dict[str, NavajaSourceCoordinator]:
+        """Suscribe una entrada: suma sus paraderos y lanza el refresco de lo que lo necesite."""
+        # Las entradas se configuran en paralelo: en serie para no repetir descargas
+        async with self._add_lock:
+            self._entries[entry.entry_id] = entry
+            self._entry_stops[entry.entry_id] = stops = stop_ids_from_entry(entry)
+            self._stop_refs.update(stops)
+            self._update_intervals()
+            if self._unsub_countdown is None:
+                self._unsub_countdown = async_track_time_interval(
+                    self.hass,
+                    self.coordinators[SOURCE_BUS].async_countdown,
+                    timedelta(seconds=ETA_COUNTDOWN_SECONDS),
+                    name="navaja_chilena eta countdown",
+                )
+                # USD/UF cambian de día desde la caché, sin esperar al próximo ciclo
+                self._unsub_midnight = async_track_time_change(
+                    self.hass, self._async_midnight, hour=0, minute=0, second=0
+                )
+
+            if not self._restored:
+                self._restored = True
+                await self._async_restore()
+
+            # Nunca esperamos a las APIs: cada fuente se refresca en segundo plano y sus
+            # entidades pasan a disponibles con su primer dato (una fuente lenta no frena al resto)
+            for c in self.coordinators.values():
+                self._refresh_in_background(c)
+        return self.coordinators
+
+    @callback
+    def _refresh_in_background(self, coordinator: NavajaSourceCoordinator) -> None:
+        """Un refresco en segundo plano por fuente, si hace falta.
+
+        Es el único camino para refrescar fuera del ciclo normal (entradas
+        nuevas, opciones, suscripciones del panel): mientras hay uno en curso
+        los pedidos siguientes no lanzan otro, y si el ciclo normal está
+        descargando, lo espera (`_fetch_lock`). Si al terminar aún faltan datos
+        que no faltaban al empezar (llegaron paraderos nuevos mientras tanto)
+        se lanza otro; un refresco fallido no se repite aquí, lo reintenta el
+        ciclo normal.
+        """
+        source = coordinator.source
+        if source in self._background or not self._needs_refresh(coordinator):
+            return
+
+        @callback
+        def _done(_: asyncio.Task[None]) -> None:
+            self._background.pop(source, None)
+            data = coordinator.data
+            if self._entries and data is not None and "stale_since" not in data:
+                self._refresh_in_background(coordinator)
+
+        task = self._background[source] = self.hass.async_create_background_task(
+            coordinator.async_refresh(), f"navaja_chilena refresh {source}"
+        )
+        task.add_done_callback(_done)
 
+    def _needs_refresh(self, coordinator: NavajaSourceCoordinator) -> bool:
+        data = coordinator.data
+        if data is None or "stale_since" in data:
+            return True
+        if coordinator.source == SOURCE_BUS:
+            return any(sid not in data["buses"] for sid in self._stop_refs)
+        return False
+
+    async def _async_restore(self) -> None:
+        """Restaura el último payload guardado de cada fuente."""
+        try:
+            stored = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning("No se pudo leer el estado guardado: %s", e)
+            return
+        if not stored:
+            return
+        for source, snap in (stored.get("sources") or {}).items():
+            coordinator = self.coordinators.get(source)
+            fetched_at = dt_util.parse_datetime(snap.get("fetched_at") or "")
+            if coordinator is None or fetched_at is None or not isinstance(snap.get("data"), dict):
+                continue
+            coordinator.async_restore(snap["data"], fetched_at)
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Guarda el estado con debounce (varias fuentes → una sola escritura)."""
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY_SECONDS)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        sources: dict[str, Any] = {}
+        for source, c in self.coordinators.items():
+            if c.data is None or c.fetched_at is None:
+                continue
+            data = {k: v for k, v in c.data.items() if k != "stale_since"}
+            sources[source] = {"fetched_at": c.fetched_at.isoformat(), "data": data}
+        return {"sources": sources}
+
+    async def async_remove_entry(self, entry: ConfigEntry) -> None:
+        """Libera las referencias de una entrada; con la última, guarda el estado de inmediato."""
+        if self._entries.pop(entry.entry_id, None) is None:
+            return
+        self._stop_refs.subtract(self._entry_stops.pop(entry.entry_id, []))
+        self._stop_refs += Counter()  # descarta conteos en cero
+        self._update_intervals()
+        if self._entries:
+            return
+        if self._unsub_countdown is not None:
+            self._unsub_countdown()
+            self._unsub_countdown = None
+            self._unsub_midnight()
+            self._unsub_midnight = None
+        for task in list(self._background.values()):
+            task.cancel()
+        # El guardado con debounce aún pendiente se perdería junto con el hub
+        data = self._data_to_save()
+        if not data["sources"]:
+            return
+        try:
+            await self._store.async_save(data)
+        except Exception as e:
+            _LOGGER.warning("No se pudo guardar el estado: %s", e)
+
+    @callback
+    def _async_midnight(self, now: datetime) -> None:
+        for source in (SOURCE_USD, SOURCE_UF):
+            self.hass.async_create_background_task(
+                self.coordinators[source].async_refresh(), f"navaja_chilena rollover {source}"
+            )
+
+    @callback
+    def async_update_entry(self, entry: ConfigEntry) -> tuple[list[str], list[str]]:
+        """Aplica opciones nuevas sin recargar: paraderos, intervalos y concurrencia.
+
+        Devuelve (agregados, quitados). Sólo se descargan los paraderos nuevos;
+        los quitados salen del próximo ciclo. Las demás fuentes no se tocan.
+        """
+        old = self._entry_stops.get(entry.entry_id, [])
+        new = self._entry_stops[entry.entry_id] = stop_ids_from_entry(entry)
+        self._stop_refs.subtract(old)
+        self._stop_refs.update(new)
+        self._stop_refs += Counter()
+        self._update_intervals()
+        self._refresh_in_background(self.coordinators[SOURCE_BUS])
+        return [sid for sid in new if sid not in old], [sid for sid in old if sid not in new]
+
+    @callback
+    def async_track_stops(self, stop_ids: list[str]) -> CALLBACK_TYPE:
+        """Suma paraderos fuera de las entradas (p. ej. un panel suscrito); el retorno los libera."""
+        new = [sid for sid in stop_ids if sid not in self._stop_refs]
+        self._stop_refs.update(stop_ids)
+        if new:
+            # Sin esperar al próximo ciclo; suscripciones seguidas comparten el refresco
+            self._refresh_in_background(self.coordinators[SOURCE_BUS])
+
+        @callback
+        def release() -> None:
+            self._stop_refs.subtract(stop_ids)
+            self._stop_refs += Counter()
+
+        return release
+
+    def diagnostics(self) -> dict[str, Any]:
+        """Telemetría por fuente, circuitos y configuración efectiva."""
+        sources: dict[str, Any] = {}
+        for source, c in self.coordinators.items():
+            sources[source] = {
+                "interval": int(c.update_interval.total_seconds()) if c.update_interval else None,
+                "last_update_success": c.last_update_success,
+                "fetched_at": c.fetched_at.isoformat() if c.fetched_at else None,
+                "stale_since": (c.data or {}).get("stale_since"),
+                "cycle_duration_s": None if c.cycle_duration is None else round(c.cycle_duration, 3),
+                "cycle_bytes": c.cycle_bytes,
+                "cycle_decode_on_loop_ms": round(c.cycle_loop_time * 1000, 2),
+                **self.client.stats[source].as_dict(),
+            }
         return {
-            "usd": usd_val,
-            "uf": uf_val,
-            "metro_lines": metro_lines,
-            "metro_details": metro_details,
-            "sismo": {"state": sismo_state, "attr": sismo_attr},
-            "buses": bus_data,
+            "stop_ids": self.stop_ids,
+            "entries": len(self._entries),
+            "host_concurrency": self.client.host_concurrency,
+            "circuits": self.client.circuits(),
+            "sources": sources,
         }
+
+    def slowest_source(self) -> str | None:
+        """Fuente con la peor latencia p95 reciente."""
+        p95 = {s: self.client.stats[s].latency_p(0.95) for s in self.coordinators}
+        p95 = {s: v for s, v in p95.items() if v is not None}
+        return max(p95, key=p95.__getitem__) if p95 else None
+
+    async def async_lookup_stop(self, stop_id: str) -> dict[str, Any]:
+        """Paradero normalizado para el panel, con el menor costo posible.
+
+        Un paradero ya vigilado se responde desde el último snapshot del
+        coordinador; el resto pasa por la caché LRU+TTL y, si hay varias
+        consultas simultáneas del mismo paradero, comparten una sola descarga.
+        Si la API falla se propaga UpstreamError y el resultado no se cachea.
+        """
+        sid = stop_id.strip().upper()
+        buses = (self.coordinators[SOURCE_BUS].data or {}).get("buses") or {}
+        if sid in buses:
+            return buses[sid]
+
+        hit = self._lookup_cache.get(sid)
+        if hit is not None:
+            if hit[0] > monotonic():
+                self._lookup_cache.move_to_end(sid)
+                return render_stop(hit[1], dt_util.utcnow().timestamp())
+            del self._lookup_cache[sid]
+
+        fut = self._lookup_inflight.get(sid)
+        if fut is None:
+            fut = self.hass.async_create_background_task(
+                self._async_fetch_lookup(sid), f"navaja_chilena lookup {sid}"
+            )
+            self._lookup_inflight[sid] = fut
+            fut.add_done_callback(lambda _: self._lookup_inflight.pop(sid, None))
+        # shield: si un cliente se desconecta no cancela la descarga de los demás
+        return await asyncio.shield(fut)
+
+    async def async_lookup_stops(self, stop_ids: list[str]) -> tuple[dict[str, Any], dict[str, str]]:
+        """Varios paraderos a la vez: (resultados, errores) por paradero.
+
+        Cada uno pasa por `async_lookup_stop` (memoria, caché, descarga
+        compartida); como mucho LOOKUP_BATCH_CONCURRENCY descargas en paralelo
+        por consulta. Un paradero que falla no afecta al resto. Con el
+        catálogo importado, los códigos que no existen ni se consultan.
+        """
+        sids = list(dict.fromkeys(s.strip().upper() for s in stop_ids if s.strip()))
+        errors: dict[str, str] = {}
+        catalogue = await async_get_catalogue(self.hass)
+        if catalogue is not None:
+            for sid in [sid for sid in sids if sid not in catalogue]:
+                errors[sid] = "No existe en el catálogo de paraderos"
+                sids.remove(sid)
+        semaphore = asyncio.Semaphore(LOOKUP_BATCH_CONCURRENCY)
+
+        async def one(sid: str) -> dict[str, Any]:
+            async with semaphore:
+                return await self.async_lookup_stop(sid)
+
+        results = await asyncio.gather(*(one(sid) for sid in sids), return_exceptions=True)
+        stops: dict[str, Any] = {}
+        for sid, res in zip(sids, results):
+            if isinstance(res, UpstreamError):
+                errors[sid] = str(res)
+            elif isinstance(res, BaseException):
+                raise res
+            elif res["name"] is None:
+                errors[sid] = "Paradero no disponible"
+            else:
+                stops[sid] = res
+        return stops, errors
+
+    async def _async_fetch_lookup(self, sid: str) -> dict[str, Any]:
+        parsed = await self.client.async_fetch(
+            BUS_URL_TMPL.format(stop_id=sid), partial(parse_stop, sid), SOURCE_BUS
+        )
+        now_ts = dt_util.utcnow().timestamp()
+        out = render_stop(anchor_stop(parsed, now_ts), now_ts)
+        if out["name"] is not None:
+            self._lookup_cache[sid] = (monotonic() + LOOKUP_CACHE_TTL_SECONDS, out)
+            self._lookup_cache.move_to_end(sid)
+            while len(self._lookup_cache) > LOOKUP_CACHE_SIZE:
+                self._lookup_cache.popitem(last=False)
+        return out
+
+    def _update_intervals(self) -> None:
+        """Cada fuente se refresca al intervalo más corto pedido por sus entradas."""
+        for source, coordinator in self.coordinators.items():
+            key = CONF_INTERVALS[source]
+            seconds = min(
+                (int(e.options.get(key, DEFAULT_INTERVALS[source])) for e in self._entries.values()),
+                default=DEFAULT_INTERVALS[source],
+            )
+            coordinator.update_interval = timedelta(seconds=seconds)
+        # Concurrencia por host: la más conservadora entre las entradas
+        self.client.set_host_concurrency(min(
+            (int(e.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)) for e in self._entries.values()),
+            default=DEFAULT_MAX_CONCURRENCY,
+        ))
@@ -0,0 +1,98 @@
+# Author: duvob90
+"""Device triggers sobre los eventos de flanco de la integración.
+
+Cada uno es un trigger de evento con filtro opcional por `line` /
+`stop_id` / `route` (sin paradero, cualquiera de los de la entrada dueña
+del dispositivo): la automatización corre sólo cuando algo cambió, sin
+evaluar plantillas sobre los atributos de los sensores.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components.device_automation import DEVICE_TRIGGER_BASE_SCHEMA
+from homeassistant.components.homeassistant.triggers import event as event_trigger
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_DEVICE_ID, CONF_DOMAIN, CONF_PLATFORM, CONF_TYPE
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant
+from homeassistant.helpers import config_validation as cv, device_registry as dr
+from homeassistant.helpers.trigger import TriggerActionType, TriggerInfo
+from homeassistant.helpers.typing import ConfigType
+
+from .const import (
+    DOMAIN, METRO_KNOWN_LINES, EVENT_METRO_STATUS_CHANGED, EVENT_NEW_QUAKE, EVENT_BUS_APPROACHING,
+)
+from .coordinator import stop_ids_from_entry
+
+TRIGGER_METRO = "metro_status_changed"
+TRIGGER_QUAKE = "new_quake"
+TRIGGER_BUS = "bus_approaching"
+TRIGGER_EVENTS = {
+    TRIGGER_METRO: EVENT_METRO_STATUS_CHANGED,
+    TRIGGER_QUAKE: EVENT_NEW_QUAKE,
+    TRIGGER_BUS: EVENT_BUS_APPROACHING,
+}
+CONF_LINE = "line"
+CONF_STOP_ID = "stop_id"
+CONF_ROUTE = "route"
+CONF_ENTRY_ID = "entry_id"
+# Campos que se comparan tal cual contra los datos del evento
+_FILTERS = (CONF_LINE, CONF_STOP_ID, CONF_ROUTE)
+
+TRIGGER_SCHEMA = DEVICE_TRIGGER_BASE_SCHEMA.extend({
+    vol.Required(CONF_TYPE): vol.In(TRIGGER_EVENTS),
+    vol.Optional(CONF_LINE): vol.All(cv.string, vol.Upper),
+    vol.Optional(CONF_STOP_ID): vol.All(cv.string, vol.Upper),
+    vol.Optional(CONF_ROUTE): cv.string,
+})
+
+
+def _device_entry(hass: HomeAssistant, device_id: str) -> ConfigEntry | None:
+    """Entrada dueña del dispositivo."""
+    device = dr.async_get(hass).async_get(device_id)
+    for entry_id in device.config_entries if device else ():
+        entry = hass.config_entries.async_get_entry(entry_id)
+        if entry is not None and entry.domain == DOMAIN:
+            return entry
+    return None
+
+
+async def async_get_triggers(hass: HomeAssistant, device_id: str) -> list[dict[str, Any]]:
+    base = {CONF_PLATFORM: "device", CONF_DEVICE_ID: device_id, CONF_DOMAIN: DOMAIN}
+    return [{**base, CONF_TYPE: trigger_type} for trigger_type in TRIGGER_EVENTS]
+
+
+async def async_get_trigger_capabilities(hass: HomeAssistant, config: ConfigType) -> dict[str, vol.Schema]:
+    """Filtros opcionales: línea de Metro; paradero (de esta entrada) y recorrido."""
+    if config[CONF_TYPE] == TRIGGER_METRO:
+        return {"extra_fields": vol.Schema({vol.Optional(CONF_LINE): vol.In(METRO_KNOWN_LINES)})}
+    if config[CONF_TYPE] == TRIGGER_BUS:
+        return {"extra_fields": vol.Schema({
+            vol.Optional(CONF_STOP_ID): vol.In(
+                stop_ids_from_entry(entry) if (entry := _device_entry(hass, config[CONF_DEVICE_ID])) else []
+            ),
+            vol.Optional(CONF_ROUTE): str,
+        })}
+    return {}
+
+
+async def async_attach_trigger(
+    hass: HomeAssistant,
+    config: ConfigType,
+    action: TriggerActionType,
+    trigger_info: TriggerInfo,
+) -> CALLBACK_TYPE:
+    event_data = {k: config[k] for k in _FILTERS if k in config}
+    # Cada entrada recibe su propio evento: sólo los paraderos de este dispositivo
+    if config[CONF_TYPE] == TRIGGER_BUS and (entry := _device_entry(hass, config[CONF_DEVICE_ID])):
+        event_data[CONF_ENTRY_ID] = entry.entry_id
+    event_config = event_trigger.TRIGGER_SCHEMA({
+        event_trigger.CONF_PLATFORM: "event",
+        event_trigger.CONF_EVENT_TYPE: TRIGGER_EVENTS[config[CONF_TYPE]],
+        event_trigger.CONF_EVENT_DATA: event_data,
+    })
+    return await event_trigger.async_attach_trigger(
+        hass, event_config, action, trigger_info, platform_type="device"
+    )
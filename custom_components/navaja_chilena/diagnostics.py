@@ -0,0 +1,18 @@
+# Author: duvob90
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_HUB
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Descarga de diagnóstico: configuración de la entrada + telemetría del hub compartido."""
+    hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+    return {
+        "entry": {"title": entry.title, "data": dict(entry.data), "options": dict(entry.options)},
+        "hub": hub.diagnostics() if hub is not None else None,
+    }
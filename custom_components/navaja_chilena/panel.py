@@ -6,9 +6,10 @@ from typing import Any
 
 from homeassistant.core import HomeAssistant
 from homeassistant.components.http import HomeAssistantView
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-API_BUS_TMPL = "https://api.xor.cl/red/bus-stop/{stop_id}"
+from .api import UpstreamError
+from .catalogue import async_get_catalogue
+from .const import DOMAIN, DATA_HUB, LOOKUP_BATCH_MAX, CATALOGUE_NEAR_RADIUS_M, CATALOGUE_SEARCH_LIMIT
 
 HTML = """<!doctype html>
 <html>
@@ -22,40 +23,94 @@ input, button { font-size: 1rem; padding: 0.5rem; }
 .card { border: 1px solid #ddd; border-radius: 8px; padding: 1rem; margin-top: 1rem; }
 h1 { margin-top: 0; font-size: 1.25rem; }
 small { color: #555; }
+#sugg div { padding: 0.25rem 0.5rem; cursor: pointer; }
+#sugg div:hover { background: #eee; }
 </style>
 </head>
 <body>
   <h1>Navaja Chilena — Bus Stop Browser</h1>
-  <p>Ingresa un <b>código de paradero</b> (p. ej. <code>PA433</code>). Este buscador valida y muestra próximos buses.</p>
+  <p>Ingresa uno o varios <b>códigos de paradero</b> separados por coma o espacio (p. ej. <code>PA433, PA340</code>). Este buscador valida y muestra próximos buses.</p>
   <form id="f">
-    <input id="stop" placeholder="PA433" />
+    <input id="stop" placeholder="PA433, PA340 o nombre" size="40" autocomplete="off" />
     <button type="submit">Buscar</button>
+    <button type="button" id="near">Cerca de casa</button>
   </form>
+  <div id="sugg"></div>
   <div id="res"></div>
 <script>
 const $ = s => document.querySelector(s);
+// Catálogo local (si se importó): se descarga una vez y se filtra aquí, sin red por tecla
+const fold = s => s.normalize("NFD").replace(/[\\u0300-\\u036f]/g, "").toLowerCase();
+let catalogue = [];
+fetch("/api/navaja_chilena/stops_catalogue").then(r => r.ok ? r.text() : "").then(t => {
+  catalogue = t ? t.split("\\n").map(l => {
+    const [code, name] = l.split("\\t");
+    return {code, name, words: fold(name).split(/[^a-z0-9]+/).filter(Boolean)};
+  }) : [];
+});
+const current = () => $("#stop").value.split(/[,;]/).pop().trim();
+const showSugg = items => {
+  $("#sugg").innerHTML = items.map(s =>
+    `<div data-code="${s.code}"><b>${s.code}</b> ${s.name || ""}${s.distance_m != null ? ` <small>(${s.distance_m} m)</small>` : ""}</div>`
+  ).join("");
+};
+$("#stop").addEventListener("input", () => {
+  const q = current();
+  if (!q || !catalogue.length) return showSugg([]);
+  const code = q.toUpperCase(), words = fold(q).split(/[^a-z0-9]+/).filter(Boolean);
+  const byCode = catalogue.filter(s => s.code.startsWith(code));
+  const byName = words.length ? catalogue.filter(s => !s.code.startsWith(code)
+    && words.every(w => s.words.some(x => x.startsWith(w)))) : [];
+  showSugg(byCode.concat(byName).slice(0, 10));
+});
+$("#sugg").addEventListener("click", (e) => {
+  const el = e.target.closest("[data-code]");
+  if (!el) return;
+  const parts = $("#stop").value.split(/[,;]/).map(p => p.trim()).filter(Boolean);
+  if (parts.length && !catalogue.some(s => s.code === parts[parts.length - 1].toUpperCase())) parts.pop();
+  if (!parts.includes(el.dataset.code)) parts.push(el.dataset.code);
+  $("#stop").value = parts.join(", ");
+  showSugg([]);
+  $("#stop").focus();
+});
+$("#near").addEventListener("click", async () => {
+  const r = await fetch("/api/navaja_chilena/stops_search?near=home");
+  const j = await r.json();
+  if (j.error) {
+    $("#res").innerHTML = `<div class="card"><b>Error:</b> ${j.error}</div>`;
+    return;
+  }
+  showSugg(j.stops);
+  if (!j.stops.length) $("#res").innerHTML = `<div class="card">No hay paraderos cerca de casa.</div>`;
+});
+const card = (stop, j) => {
+  const arr = j.arrivals || [];
+  let html = `<div class="card"><div><b>${j.name || stop}</b> <small>(${stop})</small></div>`;
+  if (!arr.length) {
+    html += `<div>No hay próximas llegadas.</div>`;
+  } else {
+    html += `<ul>` + arr.map(a => `<li><b>${a.route || ""}</b> → ${a.dest || ""} <small>(${a.eta || ""})</small></li>`).join("") + `</ul>`;
+  }
+  return html + `</div>`;
+};
 $("#f").addEventListener("submit", async (e) => {
   e.preventDefault();
-  const stop = $("#stop").value.trim();
-  if (!stop) return;
+  const stops = [...new Set($("#stop").value.toUpperCase().split(/[\\s,;]+/).filter(Boolean))];
+  if (!stops.length) return;
+  showSugg([]);
   $("#res").textContent = "Consultando...";
   try {
-    const r = await fetch(`/api/navaja_chilena/lookup?stop_id=${encodeURIComponent(stop)}`);
+    // Una sola petición para todos los paraderos
+    const r = await fetch(`/api/navaja_chilena/lookup_batch?stop_ids=${encodeURIComponent(stops.join(","))}`);
     const j = await r.json();
     if (j.error) {
       $("#res").innerHTML = `<div class="card"><b>Error:</b> ${j.error}</div>`;
       return;
     }
-    const name = j.name || stop;
-    const arr = j.arrivals || [];
-    let html = `<div class="card"><div><b>${name}</b> <small>(${stop})</small></div>`;
-    if (!arr.length) {
-      html += `<div>No hay próximas llegadas.</div>`;
-    } else {
-      html += `<ul>` + arr.map(a => `<li><b>${a.route || ""}</b> → ${a.dest || ""} <small>(${a.eta || ""})</small></li>`).join("") + `</ul>`;
-    }
-    html += `</div>`;
-    $("#res").innerHTML = html;
+    $("#res").innerHTML = stops.map(stop => j.stops[stop]
+      ? card(stop, j.stops[stop])
+      : `<div class="card"><b>${stop}:</b> ${j.errors[stop] || "Sin respuesta"}</div>`
+    ).join("");
   } catch (err) {
     $("#res").innerHTML = `<div class="card"><b>Error de red:</b> ${err}</div>`;
   }
@@ -79,30 +134,99 @@ class NavajaLookupAPI(HomeAssistantView):
 
     async def get(self, request):
         hass: HomeAssistant = request.app["hass"]
-        session = async_get_clientsession(hass)
         stop_id = request.query.get("stop_id", "").strip()
         if not stop_id:
             return aiohttp.web.json_response({"error": "stop_id requerido"}, status=400)
+        hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+        if hub is None:
+            return aiohttp.web.json_response({"error": "Integración no cargada"}, status=503)
+        catalogue = await async_get_catalogue(hass)
+        if catalogue is not None and stop_id not in catalogue:
+            return aiohttp.web.json_response({"error": "No existe en el catálogo de paraderos"}, status=404)
+
+        # Mismo normalizador que el coordinador, con caché y sin descargas duplicadas
         try:
-            async with session.get(API_BUS_TMPL.format(stop_id=stop_id), timeout=20) as resp:
-                if resp.status != 200:
-                    return aiohttp.web.json_response({"error": f"HTTP {resp.status}"}, status=resp.status)
-                data = await resp.json(content_type=None)
-        except Exception as e:
-            return aiohttp.web.json_response({"error": f"{e}"}, status=500)
-
-        out = {"name": data.get("name") or data.get("stop") or data.get("title") or stop_id, "arrivals": []}
-        buses = data.get("buses") or data.get("services") or data.get("arrivals") or []
-        if isinstance(buses, list):
-            for b in buses[:10]:
-                route = b.get("route") or b.get("servicio") or b.get("service") or b.get("id") or ""
-                when = b.get("time") or b.get("arrives_in") or b.get("minutes") or b.get("timestamp") or b.get("datetime")
-                head = b.get("headsign") or b.get("destination") or b.get("destino") or ""
-                if isinstance(when, (int, float)):
-                    when = f"{int(when)} min"
-                out["arrivals"].append({"route": route, "eta": when, "dest": head})
+            out = await hub.async_lookup_stop(stop_id)
+        except UpstreamError as e:
+            return aiohttp.web.json_response({"error": f"{e}"}, status=502)
+        if out["name"] is None:
+            return aiohttp.web.json_response({"error": "Paradero no disponible"}, status=502)
         return aiohttp.web.json_response(out)
 
+class NavajaBatchLookupAPI(HomeAssistantView):
+    """Varios paraderos en una petición: `?stop_ids=PA433,PA340`.
+
+    Responde 200 con resultados parciales: `stops` por paradero y `errors`
+    con el motivo de los que fallaron.
+    """
+
+    url = "/api/navaja_chilena/lookup_batch"
+    name = "navaja_chilena:lookup_batch"
+    requires_auth = True
+
+    async def get(self, request):
+        hass: HomeAssistant = request.app["hass"]
+        stop_ids = list(dict.fromkeys(
+            s.strip().upper() for s in request.query.get("stop_ids", "").split(",") if s.strip()
+        ))
+        if not stop_ids:
+            return aiohttp.web.json_response({"error": "stop_ids requerido"}, status=400)
+        if len(stop_ids) > LOOKUP_BATCH_MAX:
+            return aiohttp.web.json_response(
+                {"error": f"Máximo {LOOKUP_BATCH_MAX} paraderos por consulta"}, status=400
+            )
+        hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+        if hub is None:
+            return aiohttp.web.json_response({"error": "Integración no cargada"}, status=503)
+
+        stops, errors = await hub.async_lookup_stops(stop_ids)
+        return aiohttp.web.json_response({"stops": stops, "errors": errors})
+
+class NavajaStopSearchAPI(HomeAssistantView):
+    """Búsqueda en el catálogo local, sin red: `?q=los leones` o `?near=home|lat,lon&radius=300`."""
+
+    url = "/api/navaja_chilena/stops_search"
+    name = "navaja_chilena:stops_search"
+    requires_auth = True
+
+    async def get(self, request):
+        hass: HomeAssistant = request.app["hass"]
+        catalogue = await async_get_catalogue(hass)
+        if catalogue is None:
+            return aiohttp.web.json_response(
+                {"error": "Catálogo no importado (servicio navaja_chilena.import_stops)"}, status=404
+            )
+        try:
+            limit = min(int(request.query.get("limit", CATALOGUE_SEARCH_LIMIT)), 100)
+            near = request.query.get("near", "").strip()
+            if near:
+                if near == "home":
+                    lat, lon = hass.config.latitude, hass.config.longitude
+                else:
+                    lat, lon = (float(x) for x in near.split(","))
+                radius = float(request.query.get("radius", CATALOGUE_NEAR_RADIUS_M))
+                return aiohttp.web.json_response({"stops": catalogue.near(lat, lon, radius, limit)})
+        except ValueError:
+            return aiohttp.web.json_response({"error": "Parámetros inválidos"}, status=400)
+        return aiohttp.web.json_response({"stops": catalogue.search(request.query.get("q", ""), limit)})
+
+class NavajaStopCatalogueAPI(HomeAssistantView):
+    """Catálogo completo en texto (`código<TAB>nombre` por línea) para autocompletar en el navegador."""
+
+    url = "/api/navaja_chilena/stops_catalogue"
+    name = "navaja_chilena:stops_catalogue"
+    requires_auth = True
+
+    async def get(self, request):
+        catalogue = await async_get_catalogue(request.app["hass"])
+        if catalogue is None:
+            return aiohttp.web.Response(status=404)
+        text = "\n".join(f"{c}\t{n}" for c, n in zip(catalogue.codes, catalogue.names))
+        return aiohttp.web.Response(text=text, content_type="text/plain", headers={"Cache-Control": "private, max-age=3600"})
+
 def register_views(hass: HomeAssistant) -> None:
     hass.http.register_view(NavajaStopsPage())
     hass.http.register_view(NavajaLookupAPI())
+    hass.http.register_view(NavajaBatchLookupAPI())
+    hass.http.register_view(NavajaStopSearchAPI())
+    hass.http.register_view(NavajaStopCatalogueAPI())
@@ -0,0 +1,464 @@
+# Author: duvob90
+# Normalización de las respuestas de cada API (sin estado de red, sin I/O)
+from __future__ import annotations
+
+import re
+import sys
+from functools import lru_cache
+from math import ceil
+from typing import Any, Callable, Mapping
+
+from homeassistant.util import dt as dt_util
+
+# Máximo de llegadas por paradero
+MAX_ARRIVALS = 8
+
+_RE_NUM = re.compile(r"\d+")
+_RE_FLOAT = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _try_float(v) -> float | None:
+    try:
+        if v is None:
+            return None
+        if isinstance(v, (int, float)):
+            return float(v)
+        s = str(v).strip().replace(",", ".")
+        return float(s)
+    except Exception:
+        return None
+
+
+def _alias(*keys: str, truthy: bool = False) -> Callable[[dict], Any]:
+    """Compila una lista de alias en un extractor.
+
+    Equivale a `_first([obj.get(k) for k in keys])` (o a `a or b or c` con
+    `truthy=True`) con el mismo orden de prioridad, pero sin listas
+    intermedias y cortando en el primer alias que calza.
+    """
+    if truthy:
+        def get(obj: dict) -> Any:
+            v = None
+            for k in keys:
+                v = obj.get(k)
+                if v:
+                    return v
+            return v
+    else:
+        def get(obj: dict) -> Any:
+            for k in keys:
+                v = obj.get(k)
+                if v is not None:
+                    return v
+            return None
+
+    return get
+
+
+# ---- Buses ----
+_stop_name = _alias("name", "stop", "title")
+_stop_buses = _alias("buses", "services", "arrivals", "next_buses", truthy=True)
+_bus_route = _alias("route", "servicio", "service", "route_id", "id")
+_bus_head = _alias("headsign", "destination", "destino")
+_eta_text = _alias("arrival_estimation", "eta_text", "eta")
+_eta_raw = _alias("arrives_in", "time", "window", "range")
+_eta_ts = _alias("datetime", "timestamp", "hora", "time_at")
+_eta_minutes = _alias("minutes", "minutos")
+_ETA_PAIRS = (("a", "b"), ("min", "max"), ("min_arrival", "max_arrival"), ("min_arrive", "max_arrive"))
+
+# ---- Metro ----
+_metro_list = _alias("lineas", "lines", "data", truthy=True)
+_line_name = _alias("nombre", "name", "linea", "id", truthy=True)
+_line_status = _alias("estado", "status", "detalle", "state", truthy=True)
+_incident_station = _alias("estacion", "station", "name", "id", truthy=True)
+_incident_text = _alias("detalle", "detail", "status", "description", truthy=True)
+_STATION_OK = frozenset(("normal", "operativa", "ok"))
+
+# ---- Sismos ----
+_quake_mag = _alias("Magnitud", "magnitud", "Mag")
+_quake_ref = _alias("RefGeografica", "Referencia", "ref")
+_quake_date = _alias("Fecha", "fecha", "time")
+_quake_depth = _alias("Profundidad", "profundidad")
+_quake_lat = _alias("Latitud", "lat", "Latitude")
+_quake_lon = _alias("Longitud", "lon", "Longitude")
+_quake_id = _alias("id", "Id", "evento", "event_id")
+
+
+def format_eta(lo: float, hi: float | None) -> str:
+    """Texto de ETA desde una ventana en minutos ("7 min", "Entre 06 Y 08 min." o, sin tope, "Más de 30 min.")."""
+    lo = max(0, ceil(lo))
+    if hi is None:
+        return f"Más de {lo} min."
+    hi = max(0, ceil(hi))
+    if lo == hi:
+        return f"{lo} min"
+    return f"Entre {lo:02d} Y {hi:02d} min."
+
+
+def _window_from_text(txt: str) -> list[float | None] | None:
+    """Ventana desde textos ya listos: "Entre 06 Y 08 min.", "Menos de 5 min", "7 min".
+
+    "Más de 30 min." es una cota inferior: la ventana queda abierta ([30, None]).
+    """
+    nums = _RE_NUM.findall(txt)
+    if len(nums) >= 2:
+        return [float(nums[0]), float(nums[1])]
+    if len(nums) == 1:
+        n = float(nums[0])
+        low = txt.lower()
+        if "menos" in low:
+            return [0.0, n]
+        if "más" in low or "mas " in low:
+            return [n, None]
+        return [n, n]
+    return None
+
+
+def _eta_from_text(obj: dict) -> tuple[str, list[float | None] | None] | None:
+    # 1) Campo ya listo
+    txt = _eta_text(obj)
+    if isinstance(txt, str) and txt.strip():
+        return txt.strip(), _window_from_text(txt)
+    return None
+
+
+def _eta_from_pair(obj: dict) -> tuple[str, list[float]] | None:
+    # 2) Rangos numéricos (a/b, min/max, etc.)
+    for a_key, b_key in _ETA_PAIRS:
+        a = obj.get(a_key)
+        if a is None:
+            continue
+        a, b = _try_float(a), _try_float(obj.get(b_key))
+        if a is not None and b is not None:
+            return f"Entre {int(a):02d} Y {int(b):02d} min.", [a, b]
+    return None
+
+
+def _eta_from_range(obj: dict) -> tuple[str, list[float]] | None:
+    # 3) Strings tipo "06-08", "6 a 8", "6–8"
+    raw = _eta_raw(obj)
+    if isinstance(raw, str):
+        s = raw.lower().replace("min.", "").replace("min", "").strip()
+        for sep in ("-", "–", "—", " a ", " y "):
+            if sep in s:
+                p = [x.strip() for x in s.split(sep)]
+                if len(p) >= 2 and p[0].isdigit() and p[1].isdigit():
+                    return f"Entre {int(p[0]):02d} Y {int(p[1]):02d} min.", [float(p[0]), float(p[1])]
+    return None
+
+
+def _eta_from_timestamp(obj: dict) -> tuple[str, list[float]] | None:
+    # 4) Timestamp → minutos
+    ts = _eta_ts(obj)
+    if isinstance(ts, str) and ts:
+        try:
+            target = dt_util.parse_datetime(ts)
+            if target:
+                mins = max(0, int((target - dt_util.utcnow()).total_seconds() / 60))
+                return f"{mins} min", [float(mins), float(mins)]
+        except Exception:
+            pass
+    return None
+
+
+def _eta_from_minutes(obj: dict) -> tuple[str, list[float]] | None:
+    # 5) Número suelto
+    m = _try_float(_eta_minutes(obj))
+    if m is not None:
+        return f"{int(m)} min", [m, m]
+    return None
+
+
+# Orden de prioridad fijo: una llegada puede traer varios formatos a la vez (texto y min/max)
+_ETA_STRATEGIES = (_eta_from_text, _eta_from_pair, _eta_from_range, _eta_from_timestamp, _eta_from_minutes)
+
+
+def _parse_eta(obj: dict) -> tuple[str | None, list[float | None] | None]:
+    """ETA legible y ventana relativa [desde, hasta] en minutos, desde múltiples formatos (XOR y variantes)."""
+    for strategy in _ETA_STRATEGIES:
+        res = strategy(obj)
+        if res is not None:
+            return res
+    return None, None
+
+
+# mindicador.cl fecha sus valores a medianoche de Chile (p. ej. "2025-01-31T03:00:00.000Z")
+_CHILE_TZ = dt_util.get_time_zone("America/Santiago")
+
+
+def _series_day(fecha: Any) -> str | None:
+    if not fecha:
+        return None
+    parsed = dt_util.parse_datetime(str(fecha))
+    if parsed is None or parsed.tzinfo is None:
+        return str(fecha)[:10]
+    return parsed.astimezone(_CHILE_TZ).date().isoformat()
+
+
+def parse_series(js: Any, key: str) -> dict[str, float]:
+    """Serie completa de un indicador de mindicador.cl: {fecha ISO: valor}."""
+    out: dict[str, float] = {}
+    if not isinstance(js, dict):
+        return out
+    serie = js.get("serie")
+    if not isinstance(serie, list):
+        serie = [js[key]] if isinstance(js.get(key), dict) else []
+    for item in serie:
+        if not isinstance(item, dict):
+            continue
+        day, val = _series_day(item.get("fecha")), _try_float(item.get("valor"))
+        if day and val is not None:
+            out.setdefault(day, val)
+    return out
+
+
+@lru_cache(maxsize=64)
+def _lid(name: Any) -> str | None:
+    if not name:
+        return None
+    lid = str(name).upper().replace(" ", "")
+    if lid.startswith("LINEA"):
+        lid = "L" + lid.split("LINEA", 1)[1]
+    return lid
+
+
+# Código de estado de una estación: "normal" o el estado de la API en minúsculas (internado)
+STATION_NORMAL = "normal"
+
+
+@lru_cache(maxsize=128)
+def _station_code(state: Any) -> str:
+    code = str(state or "").strip().lower()
+    return STATION_NORMAL if not code or code in _STATION_OK else sys.intern(code)
+
+
+def _line_details(ln: dict, stations: dict[str, str]) -> dict[str, Any] | None:
+    """Estaciones afectadas y textos de incidencia de una línea; llena `stations` (nombre → código)."""
+    affected: list[str] = []
+    details: list[str] = []
+    for key in ("incidencias", "incidents", "issues"):
+        val = ln.get(key)
+        if isinstance(val, list):
+            for it in val:
+                if isinstance(it, dict):
+                    st = _incident_station(it)
+                    if st:
+                        affected.append(str(st))
+                    txt = _incident_text(it)
+                    if txt:
+                        details.append(str(txt))
+                else:
+                    details.append(str(it))
+    for key in ("estaciones", "stations"):
+        val = ln.get(key)
+        if isinstance(val, list):
+            # Bucle más caliente del parser (todas las estaciones): alias en línea
+            for st in val:
+                if isinstance(st, dict):
+                    st_name = st.get("nombre") or st.get("name") or st.get("id")
+                    if not st_name:
+                        continue
+                    name = sys.intern(st_name if type(st_name) is str else str(st_name))
+                    code = stations[name] = _station_code(st.get("estado") or st.get("status"))
+                    if code is not STATION_NORMAL:
+                        affected.append(name)
+    if affected or details:
+        return {"affected_stations": sorted(set(affected)), "details": details}
+    return None
+
+
+def parse_metro(metro_json: Any) -> dict[str, Any]:
+    """Estado por línea (default Operativa) e incidencias por línea, en una sola pasada."""
+    metro_lines: dict[str, str] = {f"L{i}": "Operativa" for i in (1, 2, 3, 4, 5, 6)}
+    metro_lines["L4A"] = "Operativa"
+    metro_details: dict[str, dict[str, Any]] = {}
+    # Línea → estación → código de estado (ver STATION_NORMAL)
+    metro_stations: dict[str, dict[str, str]] = {}
+
+    if isinstance(metro_json, dict):
+        lines = _metro_list(metro_json)
+        if isinstance(lines, list):
+            # Incidencias y estaciones sólo en el formato {"lineas": [...]}
+            _walk_metro(lines, metro_lines, metro_details, metro_stations)
+        else:
+            for k, v in metro_json.items():
+                if str(k).upper().startswith("L"):
+                    metro_lines[str(k).upper()] = str(v or "Operativa")
+    elif isinstance(metro_json, list):
+        _walk_metro(metro_json, metro_lines, None, None)
+
+    return {"metro_lines": metro_lines, "metro_details": metro_details, "metro_stations": metro_stations}
+
+
+def _walk_metro(
+    lines: list,
+    metro_lines: dict[str, str],
+    metro_details: dict[str, dict[str, Any]] | None,
+    metro_stations: dict[str, dict[str, str]] | None,
+) -> None:
+    for ln in lines:
+        if not isinstance(ln, dict):
+            continue
+        lid = _lid(_line_name(ln))
+        if not lid:
+            continue
+        metro_lines[lid] = _line_status(ln) or "Operativa"
+        if metro_details is not None and metro_stations is not None:
+            stations = metro_stations.setdefault(lid, {})
+            if (det := _line_details(ln, stations)) is not None:
+                metro_details[lid] = det
+            if not stations:
+                del metro_stations[lid]
+
+
+def quake_key(raw: dict) -> str:
+    """Identidad estable de un sismo: id de la API o su fecha.
+
+    El CSN revisa magnitud, profundidad y epicentro del mismo evento, así que
+    ninguno de ellos sirve de identidad; sin fecha se cae al epicentro.
+    """
+    qid = _quake_id(raw)
+    if qid is not None:
+        return str(qid)
+    if fecha := _quake_date(raw):
+        return str(fecha)
+    lat, lon = _try_float(_quake_lat(raw)), _try_float(_quake_lon(raw))
+    return "|".join(("", "" if lat is None else f"{lat:.2f}", "" if lon is None else f"{lon:.2f}"))
+
+
+def quake_revision(quake: Mapping[str, Any]) -> tuple:
+    """Campos revisables de un sismo normalizado (para detectar revisiones del CSN)."""
+    return (
+        quake["magnitud"], quake["fecha"], quake["referencia"],
+        quake["profundidad_km"], quake["latitude"], quake["longitude"],
+    )
+
+
+def _raw_revision(raw: dict) -> tuple:
+    # Igual que quake_revision, pero sin normalizar fecha ni magnitud
+    return (
+        _quake_mag(raw), _quake_date(raw), _quake_ref(raw),
+        _quake_depth(raw), _try_float(_quake_lat(raw)), _try_float(_quake_lon(raw)),
+    )
+
+
+def _quake_ts(fecha: Any) -> float | None:
+    dt = dt_util.parse_datetime(str(fecha)) if fecha else None
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        # La API entrega hora local de Chile sin zona
+        dt = dt.replace(tzinfo=_CHILE_TZ)
+    return dt.timestamp()
+
+
+def _mag_value(mag: Any) -> float | None:
+    num = _try_float(mag)
+    if num is None and mag is not None and (m := _RE_FLOAT.search(str(mag))):
+        num = float(m.group().replace(",", "."))
+    return num
+
+
+def parse_quakes(js: Any, known: Mapping[str, tuple] | None = None) -> list[dict[str, Any]]:
+    """Sismos normalizados (orden de la API).
+
+    `known` mapea id -> `quake_revision` de los ya vistos: los que no cambiaron
+    se saltan sin normalizarlos; los revisados se devuelven de nuevo.
+    """
+    out: list[dict[str, Any]] = []
+    if not isinstance(js, list):
+        return out
+    for raw in js:
+        if not isinstance(raw, dict):
+            continue
+        key = quake_key(raw)
+        if known and known.get(key) == _raw_revision(raw):
+            continue
+        mag = _quake_mag(raw)
+        fecha = _quake_date(raw)
+        out.append({
+            "id": key,
+            "magnitud": mag,
+            "mag": _mag_value(mag),
+            "ts": _quake_ts(fecha),
+            "fecha": fecha,
+            "referencia": _quake_ref(raw),
+            "profundidad_km": _quake_depth(raw),
+            "latitude": _try_float(_quake_lat(raw)),
+            "longitude": _try_float(_quake_lon(raw)),
+        })
+    return out
+
+
+def sismo_view(quake: dict[str, Any] | None) -> dict[str, Any]:
+    """Estado legible y atributos para el mapa de un sismo normalizado."""
+    if quake is None:
+        return {"state": "N/A", "attr": {}}
+    mag = quake["magnitud"]
+    num_mag = _try_float(mag)
+    attr = {
+        "referencia": quake["referencia"],
+        "fecha": quake["fecha"],
+        "profundidad_km": quake["profundidad_km"],
+        "latitude": quake["latitude"],
+        "longitude": quake["longitude"],
+    }
+    if quake.get("distance_km") is not None:
+        attr["distancia_km"] = quake["distance_km"]
+    return {"state": f"M {num_mag:.1f}" if num_mag is not None else str(mag or "N/A"), "attr": attr}
+
+
+def parse_stop(sid: str, js: Any) -> dict[str, Any]:
+    """Paradero normalizado; único camino para el coordinador y el panel."""
+    out = {"name": None, "arrivals": []}
+    if isinstance(js, dict):
+        out["name"] = _stop_name(js) or sid
+        buses = _stop_buses(js) or []
+        if isinstance(buses, list):
+            arrivals = out["arrivals"]
+            for b in buses[:MAX_ARRIVALS]:
+                eta_txt, window = _parse_eta(b)
+                arrivals.append({
+                    "route": _bus_route(b) or "",
+                    "eta": eta_txt,
+                    "dest": _bus_head(b) or "",
+                    "window": window,
+                })
+    return out
+
+
+def anchor_stop(stop: dict[str, Any], fetched_ts: float) -> dict[str, Any]:
+    """Convierte las ventanas relativas en llegadas absolutas (epoch) desde el momento de la descarga.
+
+    Una ventana abierta ("Más de 30 min.") queda sin `arrive_to` y vence en `arrive_from`.
+    """
+    arrivals = []
+    for a in stop["arrivals"]:
+        out = {"route": a["route"], "eta": a["eta"], "dest": a["dest"]}
+        window = a.get("window")
+        if window:
+            out["arrive_from"] = int(fetched_ts + window[0] * 60)
+            if window[1] is not None:
+                out["arrive_to"] = int(fetched_ts + window[1] * 60)
+        arrivals.append(out)
+    return {"name": stop["name"], "arrivals": arrivals}
+
+
+def render_stop(stop: dict[str, Any], now_ts: float) -> dict[str, Any]:
+    """Recalcula las ETA visibles desde las llegadas absolutas, sin red; descarta las ya vencidas.
+
+    Una ventana abierta vence al pasar su cota inferior: "Más de 0 min." ya no dice nada.
+    """
+    arrivals = []
+    for a in stop.get("arrivals") or []:
+        if "arrive_from" in a:
+            arrive_to = a.get("arrive_to")
+            if (a["arrive_from"] if arrive_to is None else arrive_to) < now_ts:
+                continue
+            eta = format_eta(
+                (a["arrive_from"] - now_ts) / 60, None if arrive_to is None else (arrive_to - now_ts) / 60
+            )
+            if eta != a["eta"]:
+                a = {**a, "eta": eta}
+        arrivals.append(a)
+    return {**stop, "arrivals": arrivals}
@@ -0,0 +1,98 @@
+# Author: duvob90
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from homeassistant.util.location import distance
+
+from .const import QUAKE_HISTORY_SIZE
+from .parsers import quake_revision
+
+
+class QuakeIndex:
+    """Sismos recientes en un ring buffer acotado, indexados por identidad del evento.
+
+    Cada evento guarda su distancia a casa al entrar, así las consultas
+    ("el mayor de las últimas 24 h a menos de X km") recorren sólo la
+    ventana pedida y no recalculan nada.
+    """
+
+    def __init__(self, size: int = QUAKE_HISTORY_SIZE) -> None:
+        self._size = size
+        self._by_id: dict[str, dict[str, Any]] = {}
+        self._home: tuple[float, float] | None = None
+        # Más nuevo primero (los sin fecha al final)
+        self.events: tuple[dict[str, Any], ...] = ()
+
+    def __contains__(self, qid: object) -> bool:
+        return qid in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def revisions(self) -> dict[str, tuple]:
+        """id -> campos revisables de cada evento guardado (para `parse_quakes`)."""
+        return {qid: quake_revision(ev) for qid, ev in self._by_id.items()}
+
+    def _distance(self, ev: dict[str, Any]) -> float | None:
+        if self._home is None or ev["latitude"] is None or ev["longitude"] is None:
+            return None
+        meters = distance(self._home[0], self._home[1], ev["latitude"], ev["longitude"])
+        return None if meters is None else round(meters / 1000, 1)
+
+    def set_home(self, latitude: float | None, longitude: float | None) -> bool:
+        """Fija la ubicación de casa; si cambió, recalcula las distancias (True)."""
+        home = None if latitude is None or longitude is None else (latitude, longitude)
+        if home == self._home:
+            return False
+        self._home = home
+        self._by_id = {qid: {**ev, "distance_km": self._distance(ev)} for qid, ev in self._by_id.items()}
+        self._rebuild()
+        return True
+
+    def merge(self, events: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Agrega los eventos no vistos y devuelve sólo esos (más nuevo primero).
+
+        Los ya vistos cuyos datos cambiaron (revisión del CSN) se actualizan en
+        su lugar, pero no cuentan como nuevos.
+        """
+        full = len(self._by_id) >= self._size
+        oldest = self.events[-1]["ts"] if full and self.events else None
+        new: list[dict[str, Any]] = []
+        revised = False
+        for ev in events:
+            if (old := self._by_id.get(ev["id"])) is not None:
+                if quake_revision(old) != quake_revision(ev):
+                    self._by_id[ev["id"]] = {**ev, "distance_km": self._distance(ev)}
+                    revised = True
+                continue
+            # Con el buffer lleno, algo más viejo que lo guardado ya salió: no es nuevo
+            if full and (ev["ts"] is None or (oldest is not None and ev["ts"] < oldest)):
+                continue
+            ev = {**ev, "distance_km": self._distance(ev)}
+            self._by_id[ev["id"]] = ev
+            new.append(ev)
+        if new or revised:
+            self._rebuild()
+        if new:
+            ids = {ev["id"] for ev in new}
+            new = [ev for ev in self.events if ev["id"] in ids]
+        return new
+
+    def _rebuild(self) -> None:
+        events = sorted(self._by_id.values(), key=lambda ev: (ev["ts"] is not None, ev["ts"] or 0), reverse=True)
+        for ev in events[self._size:]:
+            del self._by_id[ev["id"]]
+        self.events = tuple(events[:self._size])
+
+    def largest(self, within_km: float | None, since_ts: float) -> dict[str, Any] | None:
+        """Mayor sismo desde `since_ts` a menos de `within_km` de casa (None = sin límite)."""
+        best = None
+        for ev in self.events:
+            if ev["ts"] is None or ev["ts"] < since_ts:
+                break
+            if within_km is not None and (ev["distance_km"] is None or ev["distance_km"] > within_km):
+                continue
+            if ev["mag"] is not None and (best is None or ev["mag"] > best["mag"]):
+                best = ev
+        return best
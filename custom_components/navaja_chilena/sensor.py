@@ -1,56 +1,175 @@
 # Author: duvob90
 from __future__ import annotations
+from datetime import timedelta
 from typing import Any
 
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.event import async_track_point_in_utc_time
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN, TITLE, CONF_STOP_IDS, METRO_KNOWN_LINES
-from .coordinator import NavajaCoordinator
+from .const import (
+    DOMAIN, TITLE, METRO_KNOWN_LINES,
+    CONF_QUAKE_RADIUS_KM, DEFAULT_QUAKE_RADIUS_KM, QUAKE_WINDOW_HOURS,
+    CONF_METRO_STATION_SENSORS, CONF_METRO_PINNED_STATIONS,
+    CONF_BUS_COMPACT_ATTRIBUTES, CONF_BUS_ARRIVALS, DEFAULT_BUS_ARRIVALS, SIGNAL_STOPS_CHANGED,
+    SOURCE_USD, SOURCE_UF, SOURCE_METRO, SOURCE_SISMOS, SOURCE_BUS,
+)
+from .coordinator import NavajaHub, NavajaSourceCoordinator, station_context, stop_ids_from_entry
+from .parsers import STATION_NORMAL
+
+# Sólo lo usan los sensores de diagnóstico (los demás no sondean: escuchan a su coordinador)
+SCAN_INTERVAL = timedelta(seconds=60)
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities):
     data = hass.data[DOMAIN][entry.entry_id]
-    coordinator: NavajaCoordinator = data["coordinator"]
+    coordinators: dict[str, NavajaSourceCoordinator] = data["coordinators"]
 
+    # Cada sensor escucha sólo al coordinador de su fuente
     entities: list[SensorEntity] = []
-    entities.append(UsdSensor(coordinator, entry))
-    entities.append(UfSensor(coordinator, entry))
-    entities.append(QuakeSensor(coordinator, entry))
+    entities.append(UsdSensor(coordinators[SOURCE_USD], entry))
+    entities.append(UfSensor(coordinators[SOURCE_UF], entry))
+    entities.append(QuakeSensor(coordinators[SOURCE_SISMOS], entry))
+    entities.append(NearbyQuakeSensor(coordinators[SOURCE_SISMOS], entry))
 
-    # Metro per-line sensors
-    metro_lines = (coordinator.data.get("metro_lines") or {}).keys()
-    line_ids = list(metro_lines) if metro_lines else METRO_KNOWN_LINES
-    for lid in line_ids:
-        entities.append(MetroLineSensor(coordinator, entry, lid))
+    # Metro per-line sensors (desde la configuración: no esperamos el primer payload)
+    metro = coordinators[SOURCE_METRO]
+    for lid in METRO_KNOWN_LINES:
+        entities.append(MetroLineSensor(metro, entry, lid))
 
     # Bus stop sensors
-    stops_str = entry.options.get(CONF_STOP_IDS, entry.data.get(CONF_STOP_IDS, ""))
-    stop_ids = [s.strip() for s in stops_str.split(",") if s.strip()]
-    for sid in stop_ids:
-        entities.append(BusStopSensor(coordinator, entry, sid))
+    bus_cls = CompactBusStopSensor if entry.options.get(CONF_BUS_COMPACT_ATTRIBUTES) else BusStopSensor
+    bus_entities = {sid: bus_cls(coordinators[SOURCE_BUS], entry, sid) for sid in stop_ids_from_entry(entry)}
+    entities.extend(bus_entities.values())
 
-    async_add_entities(entities)
+    # Telemetría (deshabilitados por defecto)
+    hub = coordinators[SOURCE_BUS].hub
+    entities.append(CycleDurationSensor(hub, entry))
+    entities.append(SlowestSourceSensor(hub, entry))
 
-class NavajaBase(CoordinatorEntity[NavajaCoordinator], SensorEntity):
+    async_add_entities(entities)
+    _setup_station_sensors(hass, entry, metro, async_add_entities)
+
+    @callback
+    def _async_stops_changed(added: list[str], removed: list[str]) -> None:
+        """Opciones cambiadas: sólo se crean/quitan los sensores de los paraderos afectados."""
+        ent_reg = er.async_get(hass)
+        for sid in removed:
+            entity = bus_entities.pop(sid, None)
+            if entity is not None and entity.registry_entry is not None:
+                ent_reg.async_remove(entity.entity_id)
+        new = {sid: bus_cls(coordinators[SOURCE_BUS], entry, sid) for sid in added if sid not in bus_entities}
+        bus_entities.update(new)
+        if new:
+            async_add_entities(new.values())
+
+    entry.async_on_unload(
+        async_dispatcher_connect(hass, SIGNAL_STOPS_CHANGED.format(entry.entry_id), _async_stops_changed)
+    )
+
+
+def _setup_station_sensors(
+    hass: HomeAssistant, entry: ConfigEntry, metro: NavajaSourceCoordinator, async_add_entities
+) -> None:
+    """Sensores por estación, creados sólo cuando hacen falta.
+
+    Se crean para las estaciones fijadas por el usuario y, en modo
+    automático, para las que alguna vez salen de lo normal. Las ya creadas
+    se recuperan del registro de entidades al reiniciar.
+    """
+    auto = bool(entry.options.get(CONF_METRO_STATION_SENSORS, False))
+    pinned = {s.strip().lower() for s in entry.options.get(CONF_METRO_PINNED_STATIONS, "").split(",") if s.strip()}
+    index = metro.stations
+    created: set[tuple[str, str]] = set()
+    restored: list[SensorEntity] = []
+
+    ent_reg = er.async_get(hass)
+    prefix = MetroStationSensor.unique_id_prefix(entry)
+    for reg in er.async_entries_for_config_entry(ent_reg, entry.entry_id):
+        if not reg.unique_id.startswith(prefix):
+            continue
+        lid, _, station = reg.unique_id[len(prefix):].partition("_")
+        if auto or station.lower() in pinned:
+            created.add((lid, station))
+            restored.append(MetroStationSensor(metro, entry, lid, station))
+        else:
+            # Ya no se pide (modo automático apagado y no fijada)
+            ent_reg.async_remove(reg.entity_id)
+
+    @callback
+    def _async_add_new() -> None:
+        wanted = index.find(pinned)
+        if auto:
+            wanted |= index.deviated
+        new = wanted - created
+        if new:
+            created.update(new)
+            async_add_entities([MetroStationSensor(metro, entry, lid, st) for lid, st in sorted(new)])
+
+    if restored:
+        async_add_entities(restored)
+    if auto or pinned:
+        _async_add_new()
+        entry.async_on_unload(metro.async_add_listener(_async_add_new))
+
+
+def _device_info(entry: ConfigEntry) -> DeviceInfo:
+    return DeviceInfo(
+        identifiers={(DOMAIN, entry.entry_id)},
+        name=TITLE,
+        manufacturer="duvob90",
+        model="Navaja Chilena",
+    )
+
+class NavajaBase(CoordinatorEntity[NavajaSourceCoordinator], SensorEntity):
     _attr_has_entity_name = True
+    # Trozo de coordinator.data que escucha la entidad: sólo se actualiza si ese trozo cambia
+    _data_key: str | None = None
 
-    def __init__(self, coordinator: NavajaCoordinator, entry: ConfigEntry) -> None:
-        super().__init__(coordinator)
+    def __init__(self, coordinator: NavajaSourceCoordinator, entry: ConfigEntry, context: str | None = None) -> None:
+        super().__init__(coordinator, context or self._data_key)
         self._entry = entry
 
+    @property
+    def available(self) -> bool:
+        # El setup no espera a las APIs: cada fuente se habilita con su primer dato
+        return super().available and self.coordinator.data is not None
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        attrs = self._extra_attributes()
+        # Datos restaurados desde disco (aún sin refrescar): se marca desde cuándo
+        stale_since = (self.coordinator.data or {}).get("stale_since")
+        if stale_since:
+            attrs = {**(attrs or {}), "stale_since": stale_since}
+        return attrs
+
+    def _extra_attributes(self) -> dict[str, Any] | None:
+        return None
+
     @property
     def device_info(self) -> DeviceInfo:
-        return DeviceInfo(
-            identifiers={(DOMAIN, self._entry.entry_id)},
-            name=TITLE,
-            manufacturer="duvob90",
-            model="Navaja Chilena",
-        )
+        return _device_info(self._entry)
+
+class IndicatorSensor(NavajaBase):
+    """USD/UF: fecha del valor, variación contra el día anterior e historial."""
+
+    # Un mes de valores por cambio de estado no vale la pena en la base del recorder
+    _unrecorded_attributes = frozenset({"history"})
+
+    def _extra_attributes(self) -> dict[str, Any] | None:
+        info = (self.coordinator.data or {}).get(f"{self._data_key}_info")
+        return dict(info) if info else None
+
+class UsdSensor(IndicatorSensor):
+    _data_key = "usd"
 
-class UsdSensor(NavajaBase):
     @property
     def name(self) -> str:
         return "USD (CLP)"
@@ -71,7 +190,9 @@ class UsdSensor(NavajaBase):
     def native_value(self) -> Any:
         return self.coordinator.data.get("usd")
 
-class UfSensor(NavajaBase):
+class UfSensor(IndicatorSensor):
+    _data_key = "uf"
+
     @property
     def name(self) -> str:
         return "UF (CLP)"
@@ -93,8 +214,8 @@ class UfSensor(NavajaBase):
         return self.coordinator.data.get("uf")
 
 class MetroLineSensor(NavajaBase):
-    def __init__(self, coordinator: NavajaCoordinator, entry: ConfigEntry, line_id: str) -> None:
-        super().__init__(coordinator, entry)
+    def __init__(self, coordinator: NavajaSourceCoordinator, entry: ConfigEntry, line_id: str) -> None:
+        super().__init__(coordinator, entry, line_id.upper())
         self._line_id = line_id.upper()
 
     @property
@@ -114,12 +235,44 @@ class MetroLineSensor(NavajaBase):
         lines = self.coordinator.data.get("metro_lines") or {}
         return lines.get(self._line_id)
 
-    @property
-    def extra_state_attributes(self) -> dict[str, Any] | None:
+    def _extra_attributes(self) -> dict[str, Any] | None:
         details = (self.coordinator.data.get("metro_details") or {}).get(self._line_id) or {}
         return details if details else None
 
+class MetroStationSensor(NavajaBase):
+    """Estado de una estación ("normal" o el estado informado por Metro)."""
+
+    def __init__(self, coordinator: NavajaSourceCoordinator, entry: ConfigEntry, line_id: str, station: str) -> None:
+        super().__init__(coordinator, entry, station_context(line_id, station))
+        self._line_id = line_id
+        self._station = station
+
+    @staticmethod
+    def unique_id_prefix(entry: ConfigEntry) -> str:
+        return f"{entry.entry_id}_station_"
+
+    @property
+    def name(self) -> str:
+        return f"Metro {self._line_id} {self._station}"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self.unique_id_prefix(self._entry)}{self._line_id}_{self._station}"
+
+    @property
+    def icon(self) -> str:
+        return "mdi:subway" if self.native_value in (STATION_NORMAL, None) else "mdi:subway-alert-variant"
+
+    @property
+    def native_value(self) -> Any:
+        return self.coordinator.stations.status(self._line_id, self._station)
+
+    def _extra_attributes(self) -> dict[str, Any] | None:
+        return {"linea": self._line_id, "estacion": self._station}
+
 class QuakeSensor(NavajaBase):
+    _data_key = "sismo"
+
     @property
     def name(self) -> str:
         return "Último Sismo (Chile)"
@@ -137,15 +290,88 @@ class QuakeSensor(NavajaBase):
         q = self.coordinator.data.get("sismo") or {}
         return q.get("state")
 
-    @property
-    def extra_state_attributes(self) -> dict[str, Any] | None:
+    def _extra_attributes(self) -> dict[str, Any] | None:
         q = self.coordinator.data.get("sismo") or {}
         return q.get("attr") or {}
 
-class BusStopSensor(NavajaBase):
-    def __init__(self, coordinator: NavajaCoordinator, entry: ConfigEntry, stop_id: str) -> None:
+class NearbyQuakeSensor(NavajaBase):
+    """Mayor sismo de las últimas QUAKE_WINDOW_HOURS dentro del radio configurado."""
+
+    _data_key = "quakes"
+
+    def __init__(self, coordinator: NavajaSourceCoordinator, entry: ConfigEntry) -> None:
         super().__init__(coordinator, entry)
+        self._radius = float(entry.options.get(CONF_QUAKE_RADIUS_KM, DEFAULT_QUAKE_RADIUS_KM))
+        self._quake: dict[str, Any] | None = None
+        self._unsub_expiry: CALLBACK_TYPE | None = None
+
+    @property
+    def name(self) -> str:
+        return "Mayor sismo cercano (24 h)"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._entry.entry_id}_quake_nearby"
+
+    @property
+    def icon(self) -> str:
+        return "mdi:map-marker-radius"
+
+    def _refresh(self) -> None:
+        """Consulta el índice y programa la salida del sismo de la ventana."""
+        since = dt_util.utcnow().timestamp() - QUAKE_WINDOW_HOURS * 3600
+        self._quake = self.coordinator.index.largest(self._radius, since)
+        if self._unsub_expiry is not None:
+            self._unsub_expiry()
+            self._unsub_expiry = None
+        if self._quake is not None:
+            expires = dt_util.utc_from_timestamp(self._quake["ts"] + QUAKE_WINDOW_HOURS * 3600)
+            self._unsub_expiry = async_track_point_in_utc_time(self.hass, self._async_expire, expires)
+
+    @callback
+    def _async_expire(self, _now: Any) -> None:
+        self._unsub_expiry = None
+        self._refresh()
+        self.async_write_ha_state()
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._refresh()
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._unsub_expiry is not None:
+            self._unsub_expiry()
+            self._unsub_expiry = None
+        await super().async_will_remove_from_hass()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._refresh()
+        super()._handle_coordinator_update()
+
+    @property
+    def native_value(self) -> Any:
+        return self._quake["mag"] if self._quake else None
+
+    def _extra_attributes(self) -> dict[str, Any] | None:
+        attrs: dict[str, Any] = {"radio_km": self._radius, "ventana_h": QUAKE_WINDOW_HOURS}
+        if self._quake:
+            q = self._quake
+            attrs.update({
+                "magnitud": q["magnitud"],
+                "referencia": q["referencia"],
+                "fecha": q["fecha"],
+                "distancia_km": q["distance_km"],
+                "latitude": q["latitude"],
+                "longitude": q["longitude"],
+            })
+        return attrs
+
+class BusStopSensor(NavajaBase):
+    def __init__(self, coordinator: NavajaSourceCoordinator, entry: ConfigEntry, stop_id: str) -> None:
+        super().__init__(coordinator, entry, stop_id)
         self._stop_id = stop_id
+        self._max_arrivals = int(entry.options.get(CONF_BUS_ARRIVALS, DEFAULT_BUS_ARRIVALS))
 
     @property
     def name(self) -> str:
@@ -172,9 +398,121 @@ class BusStopSensor(NavajaBase):
                 return f"{route} → {dest} ({eta})"
         return None
 
-    @property
-    def extra_state_attributes(self) -> dict[str, Any] | None:
+    def _extra_attributes(self) -> dict[str, Any] | None:
         buses = (self.coordinator.data.get("buses") or {}).get(self._stop_id) or {}
         name = buses.get("name") or self._stop_id
-        arrivals = buses.get("arrivals") or []
-        return {"paradero": name, "stop_id": self._stop_id, "arrivals": arrivals}
+        attrs = {
+            "paradero": name,
+            "stop_id": self._stop_id,
+            **self._arrival_attributes((buses.get("arrivals") or [])[:self._max_arrivals]),
+            "poll_interval": buses.get("poll_interval"),
+        }
+        # API del paradero caída: se muestra el último dato conocido
+        if buses.get("stale_since"):
+            attrs["stale_since"] = buses["stale_since"]
+        return attrs
+
+    def _arrival_attributes(self, arrivals: list[dict[str, Any]]) -> dict[str, Any]:
+        # Sólo lo visible: las llegadas absolutas (arrive_from/arrive_to) son internas
+        return {"arrivals": [{"route": a.get("route"), "eta": a.get("eta"), "dest": a.get("dest")} for a in arrivals]}
+
+class CompactBusStopSensor(BusStopSensor):
+    """Paradero con atributos compactos, pensados para el recorder.
+
+    `arrivals` es una lista de `[recorrido, índice en destinations, min desde,
+    min hasta]` (minutos enteros, null si la API no dio ventana; sólo
+    "hasta" en null si no tiene tope, p. ej. "Más de 30 min."). Lo que
+    cambia en cada descuento no se guarda en el recorder; la lista completa
+    se obtiene con el servicio `navaja_chilena.get_arrivals`.
+    """
+
+    _unrecorded_attributes = frozenset({"arrivals", "destinations", "poll_interval"})
+
+    def _arrival_attributes(self, arrivals: list[dict[str, Any]]) -> dict[str, Any]:
+        now_ts = dt_util.utcnow().timestamp()
+        destinations: dict[str, int] = {}
+        compact = []
+        for a in arrivals:
+            dest = destinations.setdefault(a.get("dest") or "", len(destinations))
+            if "arrive_from" in a:
+                lo = max(0, round((a["arrive_from"] - now_ts) / 60))
+                hi = max(lo, round((a["arrive_to"] - now_ts) / 60)) if "arrive_to" in a else None
+            else:
+                lo = hi = None
+            compact.append([a.get("route"), dest, lo, hi])
+        return {"destinations": list(destinations), "arrivals": compact}
+
+class NavajaDiagnosticBase(SensorEntity):
+    """Sensor de telemetría del hub: se sondea cada SCAN_INTERVAL y viene deshabilitado."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, hub: NavajaHub, entry: ConfigEntry) -> None:
+        self._hub = hub
+        self._entry = entry
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return _device_info(self._entry)
+
+class CycleDurationSensor(NavajaDiagnosticBase):
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_suggested_display_precision = 2
+
+    @property
+    def name(self) -> str:
+        return "Duración último ciclo"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._entry.entry_id}_cycle_duration"
+
+    @property
+    def icon(self) -> str:
+        return "mdi:timer-outline"
+
+    @property
+    def native_value(self) -> Any:
+        # Las fuentes se refrescan en paralelo: el ciclo dura lo que la más lenta
+        durations = [c.cycle_duration for c in self._hub.coordinators.values() if c.cycle_duration is not None]
+        return round(max(durations), 3) if durations else None
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        return {
+            source: None if c.cycle_duration is None else round(c.cycle_duration, 3)
+            for source, c in self._hub.coordinators.items()
+        }
+
+class SlowestSourceSensor(NavajaDiagnosticBase):
+    @property
+    def name(self) -> str:
+        return "Fuente más lenta"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._entry.entry_id}_slowest_source"
+
+    @property
+    def icon(self) -> str:
+        return "mdi:speedometer-slow"
+
+    @property
+    def native_value(self) -> Any:
+        return self._hub.slowest_source()
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        attrs: dict[str, Any] = {}
+        for source in self._hub.coordinators:
+            stats = self._hub.client.stats[source]
+            p50, p95 = stats.latency_p(0.5), stats.latency_p(0.95)
+            attrs[f"{source}_p50_ms"] = None if p50 is None else round(p50 * 1000)
+            attrs[f"{source}_p95_ms"] = None if p95 is None else round(p95 * 1000)
+            attrs[f"{source}_failures"] = stats.failures
+        return attrs
@@ -0,0 +1,56 @@
+# Author: duvob90
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Any
+
+from .const import INDICATOR_HISTORY_DAYS, INDICATOR_SERIES_MAX_DAYS
+
+
+class IndicatorSeries:
+    """Valores diarios de un indicador (USD, UF) por fecha ISO.
+
+    mindicador.cl entrega ~un mes por respuesta (la UF, incluso días
+    futuros): se acumulan aquí y el valor de cada día se lee sin red.
+    Un día sin publicación (fin de semana para el dólar) toma el último
+    valor anterior.
+    """
+
+    def __init__(self, max_days: int = INDICATOR_SERIES_MAX_DAYS) -> None:
+        self._max_days = max_days
+        self.values: dict[str, float] = {}
+        self._dates: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def merge(self, values: dict[str, float]) -> bool:
+        """Agrega/actualiza fechas; devuelve True si algo cambió."""
+        if all(self.values.get(day) == val for day, val in values.items()):
+            return False
+        merged = {**self.values, **values}
+        self._dates = sorted(merged)[-self._max_days:]
+        self.values = {day: merged[day] for day in self._dates}
+        return True
+
+    def covers(self, day: str) -> bool:
+        """¿Hay un valor publicado para `day` o posterior?"""
+        return bool(self._dates) and self._dates[-1] >= day
+
+    def view(self, day: str) -> dict[str, Any]:
+        """Valor vigente en `day`, variación contra el valor anterior e historial."""
+        i = bisect_right(self._dates, day)
+        if i == 0:
+            return {"value": None}
+        date = self._dates[i - 1]
+        value = self.values[date]
+        out: dict[str, Any] = {"value": value, "date": date}
+        if i > 1:
+            prev_date = self._dates[i - 2]
+            prev = self.values[prev_date]
+            out["previous_date"] = prev_date
+            out["previous"] = prev
+            out["change"] = round(value - prev, 2)
+            out["change_pct"] = round((value - prev) / prev * 100, 3) if prev else None
+        out["history"] = {d: self.values[d] for d in self._dates[max(0, i - INDICATOR_HISTORY_DAYS):i]}
+        return out
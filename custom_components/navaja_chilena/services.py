@@ -0,0 +1,62 @@
+# Author: duvob90
+from __future__ import annotations
+
+from pathlib import Path
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+
+from .const import DOMAIN, DATA_HUB, LOOKUP_BATCH_MAX, SERVICE_GET_ARRIVALS, SERVICE_IMPORT_STOPS
+
+GET_ARRIVALS_SCHEMA = vol.Schema({
+    vol.Required("stop_ids"): vol.All(cv.ensure_list_csv, [cv.string], vol.Length(min=1, max=LOOKUP_BATCH_MAX)),
+})
+IMPORT_STOPS_SCHEMA = vol.Schema({
+    vol.Required("path"): cv.string,
+})
+
+
+def _import_path(hass: HomeAssistant, raw: str) -> Path:
+    """Ruta a importar: dentro de la carpeta de configuración o en `allowlist_external_dirs`.
+
+    Resuelve symlinks y `..`, así que hace I/O: va en el executor.
+    """
+    path = Path(hass.config.path(raw)).resolve()
+    if path.is_relative_to(Path(hass.config.config_dir).resolve()) or hass.config.is_allowed_path(str(path)):
+        return path
+    raise HomeAssistantError(f"Ruta no permitida: {path} (agrégala a allowlist_external_dirs)")
+
+
+@callback
+def async_register_services(hass: HomeAssistant) -> None:
+    async def get_arrivals(call: ServiceCall) -> ServiceResponse:
+        """Lista completa de llegadas (la que no va en los atributos compactos)."""
+        hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+        if hub is None:
+            raise HomeAssistantError("Navaja Chilena no está cargada")
+        stops, errors = await hub.async_lookup_stops(call.data["stop_ids"])
+        return {"stops": stops, "errors": errors}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_GET_ARRIVALS, get_arrivals,
+        schema=GET_ARRIVALS_SCHEMA, supports_response=SupportsResponse.ONLY,
+    )
+
+    async def import_stops(call: ServiceCall) -> ServiceResponse:
+        """Arma el catálogo local desde un `stops.txt` de GTFS (ruta relativa a la config)."""
+        from .catalogue import async_import_catalogue
+
+        path = await hass.async_add_executor_job(_import_path, hass, call.data["path"])
+        try:
+            catalogue = await async_import_catalogue(hass, path)
+        except (OSError, ValueError) as err:
+            raise HomeAssistantError(f"No se pudo importar {path}: {err}") from err
+        return {"stops": len(catalogue)}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_IMPORT_STOPS, import_stops,
+        schema=IMPORT_STOPS_SCHEMA, supports_response=SupportsResponse.OPTIONAL,
+    )
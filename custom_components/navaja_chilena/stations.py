@@ -0,0 +1,59 @@
+# Author: duvob90
+from __future__ import annotations
+
+from .parsers import STATION_NORMAL
+
+
+class StationIndex:
+    """Estado de cada estación de Metro (línea → estación → código), actualizado en el lugar.
+
+    `apply` compara contra lo que ya hay y sólo toca las estaciones que
+    cambiaron; devuelve esas claves para notificar únicamente a sus
+    entidades. `deviated` guarda las estaciones que alguna vez estuvieron
+    fuera de lo normal (para crear sus sensores bajo demanda).
+    """
+
+    def __init__(self) -> None:
+        self.lines: dict[str, dict[str, str]] = {}
+        self.deviated: set[tuple[str, str]] = set()
+        # Nombre en minúsculas → (línea, estación): combinaciones están en varias líneas
+        self._by_name: dict[str, set[tuple[str, str]]] = {}
+
+    def status(self, line_id: str, station: str) -> str | None:
+        return self.lines.get(line_id, {}).get(station)
+
+    def find(self, names: set[str]) -> set[tuple[str, str]]:
+        """Estaciones (en cualquier línea) cuyo nombre está en `names` (minúsculas)."""
+        return {key for name in names for key in self._by_name.get(name, ())}
+
+    def apply(self, stations: dict[str, dict[str, str]]) -> set[tuple[str, str]]:
+        """Aplica un snapshot completo y devuelve las (línea, estación) que cambiaron."""
+        changed: set[tuple[str, str]] = set()
+        for lid in self.lines.keys() - stations.keys():
+            for name in self.lines.pop(lid):
+                self._forget(lid, name)
+                changed.add((lid, name))
+        for lid, new in stations.items():
+            cur = self.lines.setdefault(lid, {})
+            for name, code in new.items():
+                old = cur.get(name)
+                if old == code:
+                    continue
+                if old is None:
+                    self._by_name.setdefault(name.lower(), set()).add((lid, name))
+                cur[name] = code
+                changed.add((lid, name))
+                if code != STATION_NORMAL:
+                    self.deviated.add((lid, name))
+            for name in cur.keys() - new.keys():
+                del cur[name]
+                self._forget(lid, name)
+                changed.add((lid, name))
+        return changed
+
+    def _forget(self, lid: str, name: str) -> None:
+        keys = self._by_name.get(name.lower())
+        if keys is not None:
+            keys.discard((lid, name))
+            if not keys:
+                del self._by_name[name.lower()]
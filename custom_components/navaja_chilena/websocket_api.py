@@ -0,0 +1,133 @@
+# Author: duvob90
+"""Suscripción por websocket a paraderos y líneas de Metro.
+
+    {"type": "navaja_chilena/subscribe", "stops": ["PA433"], "lines": ["L1"]}
+
+Tras el `result` llega un evento `{"kind": "snapshot", "stops": {...},
+"lines": {...}}` y luego, cada vez que el coordinador trae datos nuevos,
+`{"kind": "delta", ...}` sólo con lo que cambió: por paradero/línea, los
+campos modificados (un campo eliminado va como null). Un paradero o línea
+que aparece o queda sin datos se envía completo (o null).
+
+Los paraderos suscritos se suman a los del hub mientras dure la
+suscripción: una sola descarga sirve a todos los paneles abiertos.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DOMAIN, DATA_HUB, LOOKUP_BATCH_MAX, SOURCE_BUS, SOURCE_METRO
+
+STOPS = "stops"
+LINES = "lines"
+
+
+@callback
+def async_register_commands(hass: HomeAssistant) -> None:
+    websocket_api.async_register_command(hass, ws_subscribe)
+
+
+def _delta(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    return {k: new.get(k) for k in old.keys() | new.keys() if old.get(k) != new.get(k)}
+
+
+class _Subscription:
+    """Estado de una suscripción: último valor enviado por paradero/línea."""
+
+    def __init__(self, hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg_id: int, hub: Any) -> None:
+        self.hass = hass
+        self.connection = connection
+        self.msg_id = msg_id
+        self.bus = hub.coordinators[SOURCE_BUS]
+        self.metro = hub.coordinators[SOURCE_METRO]
+        self.sent: dict[str, dict[str, dict[str, Any] | None]] = {STOPS: {}, LINES: {}}
+        self._dirty: dict[str, set[str]] = {STOPS: set(), LINES: set()}
+        self._flush_handle: asyncio.Handle | None = None
+
+    def _view(self, kind: str, key: str) -> dict[str, Any] | None:
+        if kind == STOPS:
+            return ((self.bus.data or {}).get("buses") or {}).get(key)
+        data = self.metro.data or {}
+        state = (data.get("metro_lines") or {}).get(key)
+        if state is None:
+            return None
+        view = {"state": state, **((data.get("metro_details") or {}).get(key) or {})}
+        if "stale_since" in data:
+            view["stale_since"] = data["stale_since"]
+        return view
+
+    def snapshot(self, stops: list[str], lines: list[str]) -> dict[str, Any]:
+        for kind, keys in ((STOPS, stops), (LINES, lines)):
+            for key in keys:
+                self.sent[kind][key] = self._view(kind, key)
+        return {"kind": "snapshot", STOPS: dict(self.sent[STOPS]), LINES: dict(self.sent[LINES])}
+
+    @callback
+    def mark(self, kind: str, key: str) -> None:
+        """Listener del coordinador: se junta todo lo de un mismo refresco en un mensaje."""
+        self._dirty[kind].add(key)
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_soon(self._flush)
+
+    @callback
+    def cancel(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    @callback
+    def _flush(self) -> None:
+        self._flush_handle = None
+        out: dict[str, Any] = {STOPS: {}, LINES: {}}
+        for kind, keys in self._dirty.items():
+            for key in keys:
+                old, new = self.sent[kind][key], self._view(kind, key)
+                if old == new:
+                    continue
+                out[kind][key] = new if old is None or new is None else _delta(old, new)
+                self.sent[kind][key] = new
+            keys.clear()
+        if out[STOPS] or out[LINES]:
+            self.connection.send_message(websocket_api.event_message(self.msg_id, {"kind": "delta", **out}))
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/subscribe",
+    vol.Optional(STOPS, default=[]): vol.All([vol.All(str, vol.Strip, vol.Upper)], vol.Length(max=LOOKUP_BATCH_MAX)),
+    vol.Optional(LINES, default=[]): [vol.All(str, vol.Strip, vol.Upper)],
+})
+@callback
+def ws_subscribe(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict[str, Any]) -> None:
+    """Snapshot de los paraderos/líneas pedidos y luego deltas."""
+    hub = hass.data.get(DOMAIN, {}).get(DATA_HUB)
+    if hub is None:
+        connection.send_error(msg["id"], "not_loaded", "Integración no cargada")
+        return
+    stops = list(dict.fromkeys(s for s in msg[STOPS] if s))
+    lines = list(dict.fromkeys(lid for lid in msg[LINES] if lid))
+
+    sub = _Subscription(hass, connection, msg["id"], hub)
+    # Contexto por paradero/línea: sólo nos despiertan los que cambiaron
+    unsubs = [
+        sub.bus.async_add_listener(lambda sid=sid: sub.mark(STOPS, sid), sid) for sid in stops
+    ] + [
+        sub.metro.async_add_listener(lambda lid=lid: sub.mark(LINES, lid), lid) for lid in lines
+    ]
+    if stops:
+        unsubs.append(hub.async_track_stops(stops))
+
+    @callback
+    def unsubscribe() -> None:
+        sub.cancel()
+        for unsub in unsubs:
+            unsub()
+
+    connection.subscriptions[msg["id"]] = unsubscribe
+    connection.send_result(msg["id"])
+    connection.send_message(websocket_api.event_message(msg["id"], sub.snapshot(stops, lines)))
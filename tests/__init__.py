@@ -0,0 +1 @@
+"""Pruebas de la integración navaja_chilena."""
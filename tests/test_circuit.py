@@ -0,0 +1,61 @@
+# Author: duvob90
+"""Circuit breaker por host: umbral, una falla por ventana y petición de prueba."""
+from __future__ import annotations
+
+from custom_components.navaja_chilena.api import _Circuit
+from custom_components.navaja_chilena.const import CIRCUIT_FAILURE_THRESHOLD
+
+
+def _open(circuit: _Circuit, now: float = 0.0) -> float:
+    delay = None
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        assert circuit.allows(now)
+        delay = circuit.failure(now)
+    assert delay is not None
+    return delay
+
+
+def test_opens_only_after_consecutive_failures() -> None:
+    circuit = _Circuit()
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        assert circuit.failure(0.0) is None
+    circuit.success()
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        assert circuit.failure(0.0) is None
+    assert circuit.allows(0.0)
+    assert circuit.failure(0.0) is not None
+    assert not circuit.allows(1.0)
+
+
+def test_retry_after_opens_at_once() -> None:
+    circuit = _Circuit()
+    assert circuit.failure(0.0, retry_after=120) == 120
+    assert not circuit.allows(119.0)
+
+
+def test_in_flight_failures_count_once_per_window() -> None:
+    circuit = _Circuit()
+    delay = _open(circuit)
+    # Peticiones que ya habían salido fallan después: no alargan la espera
+    assert circuit.failure(1.0) is None
+    assert circuit.failure(2.0) is None
+    assert circuit.trips == 1
+    assert circuit.open_until == delay
+
+
+def test_half_open_lets_a_single_probe_through() -> None:
+    circuit = _Circuit()
+    delay = _open(circuit)
+    now = delay + 1
+    assert circuit.allows(now)
+    assert circuit.state(now) == "half_open"
+    assert not circuit.allows(now)
+    # La prueba falla: vuelve a abrirse con el doble de espera
+    second = circuit.failure(now)
+    assert second is not None and second > delay
+    assert circuit.state(now) == "open"
+    now += second + 1
+    assert circuit.allows(now)
+    circuit.success()
+    assert circuit.state(now) == "closed"
+    assert circuit.allows(now) and circuit.allows(now)
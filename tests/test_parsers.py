@@ -0,0 +1,78 @@
+# Author: duvob90
+"""Normalización de paraderos: prioridad de formatos de ETA, descuento local y vencimiento."""
+from __future__ import annotations
+
+from custom_components.navaja_chilena.parsers import anchor_stop, parse_stop, render_stop
+
+T0 = 1_700_000_000.0
+
+
+def _anchored(*buses: dict) -> dict:
+    return anchor_stop(parse_stop("PA1", {"name": "Paradero 1", "buses": list(buses)}), T0)
+
+
+def test_text_window_counts_down() -> None:
+    stop = _anchored({"route": "506", "arrival_estimation": "Entre 04 Y 06 min."})
+    assert render_stop(stop, T0)["arrivals"][0]["eta"] == "Entre 04 Y 06 min."
+    assert render_stop(stop, T0 + 120)["arrivals"][0]["eta"] == "Entre 02 Y 04 min."
+    assert render_stop(stop, T0 + 300)["arrivals"][0]["eta"] == "Entre 00 Y 01 min."
+
+
+def test_less_than_is_closed_window() -> None:
+    stop = _anchored({"route": "506", "arrival_estimation": "Menos de 5 min"})
+    assert render_stop(stop, T0 + 60)["arrivals"][0]["eta"] == "Entre 00 Y 04 min."
+
+
+def test_more_than_is_open_lower_bound() -> None:
+    stop = _anchored({"route": "506", "arrival_estimation": "Más de 30 min."})
+    arrival = stop["arrivals"][0]
+    assert "arrive_to" not in arrival
+    assert render_stop(stop, T0)["arrivals"][0]["eta"] == "Más de 30 min."
+    assert render_stop(stop, T0 + 600)["arrivals"][0]["eta"] == "Más de 20 min."
+    assert render_stop(stop, T0 + 1800)["arrivals"][0]["eta"] == "Más de 0 min."
+
+
+def test_open_window_expires_after_its_lower_bound() -> None:
+    stop = _anchored(
+        {"route": "506", "arrival_estimation": "Más de 30 min."},
+        {"route": "210", "arrival_estimation": "Entre 40 Y 45 min."},
+    )
+    # Pasada la cota inferior la ventana abierta ya no informa nada: sale, no queda "Más de 0 min."
+    assert [a["route"] for a in render_stop(stop, T0 + 1801)["arrivals"]] == ["210"]
+    assert [a["route"] for a in render_stop(stop, T0 + 3600)["arrivals"]] == []
+
+
+def test_expired_arrivals_are_dropped() -> None:
+    stop = _anchored(
+        {"route": "506", "arrival_estimation": "Entre 01 Y 02 min."},
+        {"route": "210", "arrival_estimation": "Entre 08 Y 10 min."},
+        {"route": "D09", "eta": "Sin información"},
+    )
+    routes = [a["route"] for a in render_stop(stop, T0 + 180)["arrivals"]]
+    assert routes == ["210", "D09"]
+
+
+def test_eta_priority_does_not_depend_on_previous_arrivals() -> None:
+    # Una llegada sólo con min/max no debe cambiar el formato elegido para las siguientes
+    parse_stop("PA1", {"buses": [{"route": "506", "min_arrival": 0, "max_arrival": 9}]})
+    both = {"route": "210", "arrival_estimation": "Menos de 5 min", "min_arrival": 0, "max_arrival": 9}
+    arrivals = parse_stop("PA2", {"buses": [{"route": "506", "min_arrival": 0, "max_arrival": 9}, both]})["arrivals"]
+    assert arrivals[0]["eta"] == "Entre 00 Y 09 min."
+    assert arrivals[1]["eta"] == "Menos de 5 min"
+    assert arrivals[1]["window"] == [0.0, 5.0]
+
+
+def test_eta_formats() -> None:
+    buses = [
+        {"route": "1", "min": 2, "max": 4},
+        {"route": "2", "arrives_in": "06-08 min"},
+        {"route": "3", "minutes": 7},
+        {"route": "4"},
+    ]
+    arrivals = parse_stop("PA1", {"buses": buses})["arrivals"]
+    assert [(a["eta"], a["window"]) for a in arrivals] == [
+        ("Entre 02 Y 04 min.", [2.0, 4.0]),
+        ("Entre 06 Y 08 min.", [6.0, 8.0]),
+        ("7 min", [7.0, 7.0]),
+        (None, None),
+    ]
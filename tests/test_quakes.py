@@ -0,0 +1,75 @@
+# Author: duvob90
+"""Historial de sismos: deduplicación, desalojo del ring buffer y hora de Chile."""
+from __future__ import annotations
+
+from datetime import datetime
+
+from custom_components.navaja_chilena.parsers import parse_quakes
+from custom_components.navaja_chilena.quakes import QuakeIndex
+
+
+def _raw(minute: int, mag: str = "3.5") -> dict:
+    return {
+        "Magnitud": mag,
+        "RefGeografica": f"{minute} km al N de Ciudad",
+        "Fecha": f"2025-01-01 10:{minute:02d}:00",
+        "Latitud": "-33.4",
+        "Longitud": f"-70.{minute:02d}",
+    }
+
+
+def test_fecha_is_chile_local_time() -> None:
+    # 10:00 en Santiago en enero (horario de verano, UTC-3) = 13:00 UTC
+    (quake,) = parse_quakes([_raw(0)])
+    assert quake["ts"] == datetime.fromisoformat("2025-01-01T13:00:00+00:00").timestamp()
+
+
+def test_merge_returns_only_new_events_newest_first() -> None:
+    index = QuakeIndex(size=10)
+    assert [ev["fecha"][-5:] for ev in index.merge(parse_quakes([_raw(1), _raw(0)]))] == ["01:00", "00:00"]
+    new = index.merge(parse_quakes([_raw(2), _raw(1), _raw(0)]))
+    assert [ev["fecha"][-5:] for ev in new] == ["02:00"]
+    assert len(index) == 3
+    assert [ev["fecha"][-5:] for ev in index.events] == ["02:00", "01:00", "00:00"]
+
+
+def test_revisions_update_known_events_without_being_new() -> None:
+    index = QuakeIndex(size=10)
+    index.merge(parse_quakes([_raw(1), _raw(0)]))
+    events = index.events
+    # El CSN corrige magnitud y epicentro del mismo evento (misma fecha)
+    revised = {**_raw(1, mag="3.9"), "Latitud": "-33.5", "Longitud": "-70.20"}
+    assert index.merge(parse_quakes([revised, _raw(0)], known=index.revisions())) == []
+    assert len(index) == 2
+    assert index.events is not events
+    assert (index.events[0]["mag"], index.events[0]["latitude"]) == (3.9, -33.5)
+
+
+def test_unchanged_known_events_are_skipped_before_normalizing() -> None:
+    index = QuakeIndex(size=10)
+    index.merge(parse_quakes([_raw(0), _raw(1)]))
+    known = index.revisions()
+    assert parse_quakes([_raw(2), _raw(1, mag="3.6"), _raw(0)], known=known) == parse_quakes(
+        [_raw(2), _raw(1, mag="3.6")]
+    )
+
+
+def test_full_buffer_evicts_oldest_and_ignores_older_events() -> None:
+    index = QuakeIndex(size=3)
+    index.merge(parse_quakes([_raw(m) for m in (3, 2, 1)]))
+    new = index.merge(parse_quakes([_raw(4), _raw(0)]))
+    # El de 10:00 es más viejo que todo lo guardado: ya había salido del buffer
+    assert [ev["fecha"][-5:] for ev in new] == ["04:00"]
+    assert len(index) == 3
+    assert [ev["fecha"][-5:] for ev in index.events] == ["04:00", "03:00", "02:00"]
+    assert index.merge(parse_quakes([_raw(1)])) == []
+
+
+def test_largest_within_distance() -> None:
+    index = QuakeIndex(size=10)
+    index.set_home(-33.4, -70.0)
+    index.merge(parse_quakes([_raw(50, mag="5.1"), _raw(5, mag="4.0"), _raw(1, mag="6.0")]))
+    since = datetime.fromisoformat("2025-01-01T13:02:00+00:00").timestamp()
+    assert index.largest(None, since)["mag"] == 5.1
+    assert index.largest(20, since)["mag"] == 4.0
+    assert index.largest(None, 0)["mag"] == 6.0
@@ -0,0 +1,63 @@
+# Author: duvob90
+"""Serie de USD/UF: cobertura del día, cambio de día sin red y fechas de mindicador.cl."""
+from __future__ import annotations
+
+from custom_components.navaja_chilena.parsers import parse_series
+from custom_components.navaja_chilena.series import IndicatorSeries
+
+
+def _series(values: dict[str, float]) -> IndicatorSeries:
+    series = IndicatorSeries()
+    series.merge(values)
+    return series
+
+
+def test_parse_series_uses_chile_dates() -> None:
+    js = {"serie": [
+        # Medianoche de Chile: UTC-3 en verano, UTC-4 en invierno
+        {"fecha": "2025-01-31T03:00:00.000Z", "valor": 38500.5},
+        {"fecha": "2025-07-01T04:00:00.000Z", "valor": "39100,2"},
+        {"fecha": "2025-07-02", "valor": 39101},
+        {"fecha": None, "valor": 1},
+    ]}
+    assert parse_series(js, "uf") == {"2025-01-31": 38500.5, "2025-07-01": 39100.2, "2025-07-02": 39101.0}
+
+
+def test_parse_series_falls_back_to_single_value() -> None:
+    js = {"uf": {"fecha": "2025-01-31T03:00:00.000Z", "valor": 38500.5}}
+    assert parse_series(js, "uf") == {"2025-01-31": 38500.5}
+
+
+def test_covers() -> None:
+    series = IndicatorSeries()
+    assert not series.covers("2025-01-31")
+    series.merge({"2025-01-30": 950.0, "2025-01-31": 951.0})
+    assert series.covers("2025-01-30")
+    assert series.covers("2025-01-31")
+    assert not series.covers("2025-02-01")
+
+
+def test_midnight_rollover_reads_published_value() -> None:
+    # La UF viene publicada por adelantado: el cambio de día no necesita red
+    series = _series({"2025-01-30": 38000.0, "2025-01-31": 38010.0, "2025-02-01": 38020.0})
+    before, after = series.view("2025-01-31"), series.view("2025-02-01")
+    assert (before["value"], before["date"]) == (38010.0, "2025-01-31")
+    assert (after["value"], after["date"], after["previous"], after["change"]) == (38020.0, "2025-02-01", 38010.0, 10.0)
+    assert list(after["history"]) == ["2025-01-30", "2025-01-31", "2025-02-01"]
+
+
+def test_day_without_value_keeps_last_one() -> None:
+    # Fin de semana del dólar: se muestra el viernes, pero el día no queda cubierto
+    series = _series({"2025-01-30": 950.0, "2025-01-31": 951.0})
+    view = series.view("2025-02-01")
+    assert (view["value"], view["date"]) == (951.0, "2025-01-31")
+    assert not series.covers("2025-02-01")
+    assert series.view("2025-01-01") == {"value": None}
+
+
+def test_merge_reports_changes_and_trims() -> None:
+    series = IndicatorSeries(max_days=2)
+    assert series.merge({"2025-01-30": 950.0})
+    assert not series.merge({"2025-01-30": 950.0})
+    assert series.merge({"2025-01-31": 951.0, "2025-02-01": 952.0})
+    assert list(series.values) == ["2025-01-31", "2025-02-01"]